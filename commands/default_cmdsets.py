@@ -2,13 +2,38 @@
 Custom command sets for the xyyx project.
 
 This module defines command sets for unlogged-in users, guiding them through
-the account creation and login process with custom prompts and timeouts.
+the account creation and login process with custom prompts and timeouts, and
+the account and character command sets with the game's versions of the
+default `channel` and `help` commands.
 """
 
 import random
-from evennia import create_object, utils, CmdSet
+from collections import ChainMap, defaultdict
+from itertools import chain
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+import evennia
+from evennia import create_account, create_object, CmdSet
+from evennia.accounts.models import AccountDB
 from evennia.commands.default.unloggedin import CmdUnconnectedQuit, CmdUnconnectedLook, CmdUnconnectedConnect, CmdUnconnectedCreate
 from evennia.commands.default.muxcommand import MuxCommand
+from evennia.commands.default.cmdset_account import AccountCmdSet as DefaultAccountCmdSet
+from evennia.commands.default.cmdset_character import CharacterCmdSet as DefaultCharacterCmdSet
+from evennia.commands.default.comms import CmdChannel as DefaultCmdChannel
+from evennia.commands.default.help import CmdHelp as DefaultCmdHelp, HelpCategory
+from evennia.utils.utils import inherits_from
+
+from typeclasses.characters import roll_innate_attributes
+from world.account_index import ACCOUNT_NAMES
+from world.eventlog import EVENT_LOG
+from world.help_index import HELP_INDEX
+from world.importtime import profile_imports
+from world.passwords import allow_attempt, verify_password
+from world.room_graph import ROOM_GRAPH
+from world.templates import send_template
+from world.timeouts import LOGIN_TIMEOUTS
 
 # 随机中文名生成器
 def generate_random_name():
@@ -17,391 +42,586 @@ def generate_random_name():
     given_names = ["无忌", "三丰", "翠山", "峰", "冲", "云", "风", "雪"]
     return random.choice(surnames) + random.choice(given_names)
 
+def disconnect_if_unlogged(caller, message):
+    """Disconnect the caller if it still has not logged in."""
+    if not caller.logged_in:
+        EVENT_LOG.log("login_timeout", caller, state=caller.ndb.login_state)
+        caller.msg(message)
+        caller.disconnect()
+
 def disconnect_with_timeout(caller, timeout, message):
-    """Disconnect the caller after a timeout if not authenticated."""
-    def disconnect():
-        if not caller.is_authenticated():
-            caller.msg(message)
-            caller.session.disconnect()
-    utils.delay(timeout, disconnect)
-
-class CmdEnterName(MuxCommand):
-    """Input an English name for login or account creation."""
+    """
+    Disconnect the caller after a timeout if not authenticated. Each session
+    has only one such deadline; calling this again replaces it.
+    """
+    LOGIN_TIMEOUTS.schedule(caller.sessid, timeout, disconnect_if_unlogged, caller, message)
+
+SHORT_TIMEOUT = (180, "您三分钟未输入，已断开连接！")
+LONG_TIMEOUT = (300, "您用的时间太久了！")
+
+# 登录/创建流程中暂存于 ndb 的数据，流程结束后清除
+LOGIN_FLOW_NDB = (
+    "login_state", "login_account", "new_account_name", "temp_name",
+    "temp_password", "temp_identifier", "attr_choice", "attr_value",
+    "temp_attributes",
+)
+
+# 登录/创建流程的状态机：状态 -> {输入的命令: 处理方法}
+LOGIN_FLOW = {
+    "enter_name": {"name": "enter_name"},
+    "login_password": {"password": "login_password"},
+    "checking_password": {},
+    "create_confirm": {"y": "create_confirm", "n": "create_deny"},
+    "set_name": {"name": "set_name"},
+    "confirm_name": {"y": "confirm_name", "n": "deny_name"},
+    "set_password": {"password": "set_password"},
+    "confirm_password": {"password": "confirm_password"},
+    "set_identifier": {"identifier": "set_identifier"},
+    "confirm_identifier": {"identifier": "confirm_identifier"},
+    "set_attribute": {"attribute": "set_attribute"},
+    "set_attribute_value": {"value": "set_attribute_value"},
+    "confirm_attributes": {"y": "confirm_attributes", "n": "deny_attributes"},
+    "set_gender": {"gender": "set_gender"},
+}
+
+def prompt(caller, template, state=None, timeout=SHORT_TIMEOUT, **fields):
+    """
+    Send a prompt template, optionally move the login flow to a new state
+    and (re)start the input timeout.
+    """
+    send_template(caller, template, **fields)
+    if state:
+        caller.ndb.login_state = state
+    disconnect_with_timeout(caller, *timeout)
+
+def clear_login_flow(caller):
+    """Forget all intermediate login/creation data and the input timeout."""
+    LOGIN_TIMEOUTS.cancel(caller.sessid)
+    for key in LOGIN_FLOW_NDB:
+        caller.nattributes.remove(key)
+
+# 口令类数据不随重载交接，不写入磁盘
+LOGIN_FLOW_SECRETS = ("temp_password", "temp_identifier")
+# 已输入过密码的状态，交接后要从设定密码重新开始
+AFTER_SET_PASSWORD = (
+    "confirm_password", "set_identifier", "confirm_identifier", "set_attribute",
+    "set_attribute_value", "confirm_attributes", "set_gender",
+)
+# 重载交接过来、等待会话同步后恢复的登录流程：sessid -> (ndb 数据, 超时)
+PENDING_LOGIN_FLOWS = {}
+
+def dump_login_flows():
+    """
+    Get the login flow of every unlogged session, to hand over on reload.
+    Passwords and identifiers are left out.
+
+    Returns:
+        dict: `{sessid: (ndb data, timeout)}`; the account being logged in
+            to is given by id.
+    """
+    flows = {}
+    for session in evennia.SESSION_HANDLER.values():
+        if session.logged_in or not session.ndb.login_state:
+            continue
+        data = {
+            key: session.nattributes.get(key)
+            for key in LOGIN_FLOW_NDB
+            if key not in LOGIN_FLOW_SECRETS
+        }
+        if data["login_account"]:
+            data["login_account"] = data["login_account"].id
+        deadline = LOGIN_TIMEOUTS.deadlines.get(session.sessid)
+        flows[session.sessid] = (data, deadline and (deadline[1], deadline[3][1]))
+    return flows
+
+def load_login_flows(flows):
+    """
+    Keep the login flows handed over by `dump_login_flows` until their
+    sessions are synced from the portal, which happens after the reload
+    hooks have run; see `resume_login_flow`.
+    """
+    PENDING_LOGIN_FLOWS.clear()
+    PENDING_LOGIN_FLOWS.update(flows)
+
+def resume_login_flow(session):
+    """
+    Resume the handed-over login flow of a session that has just synced.
+    A flow that had got past the password asks for it again, as it was not
+    handed over.
+    """
+    flow = PENDING_LOGIN_FLOWS.pop(session.sessid, None)
+    if not flow or session.logged_in:
+        return
+    data, timeout = flow
+    if data["login_account"]:
+        data["login_account"] = AccountDB.objects.get_id(data["login_account"])
+    if data["login_state"] in ("login_password", "checking_password"):
+        # 重载前的密码校验结果已经丢失，请玩家重新输入
+        data["login_state"] = "login_password"
+        send_template(session, "reload_enter_password")
+    elif data["login_state"] in AFTER_SET_PASSWORD:
+        data["login_state"] = "set_password"
+        send_template(session, "reload_set_password")
+    for key, value in data.items():
+        if value is not None:
+            session.nattributes.add(key, value)
+    if timeout:
+        # 重载打断了输入，超时从头计算
+        disconnect_with_timeout(session, *timeout)
+
+class CmdLoginFlow(MuxCommand):
+    """
+    Handle input at every step of login and account creation.
+
+    The whole flow is a session-scoped state machine: the current step is
+    kept in `caller.ndb.login_state` and all entered data stays in `ndb`
+    until the account and character are created in one transaction.
+    """
     key = "name"
+    aliases = ["password", "y", "n", "identifier", "attribute", "value", "gender"]
+
+    def at_pre_cmd(self):
+        # 任何输入都重新计算超时
+        LOGIN_TIMEOUTS.reset(self.caller.sessid)
 
     def func(self):
         caller = self.caller
-        if not self.args:
-            caller.msg("请输入您的英文名字：")
-            disconnect_with_timeout(caller, 180, "您三分钟未输入，已断开连接！")
+        state = caller.ndb.login_state or "enter_name"
+        handler = LOGIN_FLOW[state].get(self.cmdstring.lower())
+        EVENT_LOG.log("login_step", caller, state=state, handler=handler)
+        if not handler:
+            send_template(caller, "follow_prompt")
             return
-        name = self.args.strip()
-        account = caller.search_account(name)
+        getattr(self, handler)(caller, self.args)
+
+    def enter_name(self, caller, name):
+        """Input an English name for login or account creation."""
+        if not name:
+            prompt(caller, "enter_name")
+            return
+        # 先查内存中的名字索引，只有命中时才取出账号
+        account = ACCOUNT_NAMES.get(name)
         if account:
             caller.ndb.login_account = account
-            caller.msg("请输入密码：")
-            caller.cmdset.add(LoginPasswordCmdSet)
-            caller.cmdset.remove(EnterNameCmdSet)
-            disconnect_with_timeout(caller, 180, "您三分钟未输入，已断开连接！")
+            prompt(caller, "enter_password", "login_password")
         else:
             caller.ndb.new_account_name = name
-            caller.msg(f"使用 {name} 这个名字将会创造一个新的人物，您确定吗(y/n)？")
-            caller.cmdset.add(CreateConfirmCmdSet)
-            caller.cmdset.remove(EnterNameCmdSet)
-            disconnect_with_timeout(caller, 180, "您三分钟未输入，已断开连接！")
-
-class CmdLoginPassword(MuxCommand):
-    """Input password for login."""
-    key = "password"
+            prompt(caller, "create_confirm", "create_confirm", name=name)
 
-    def func(self):
-        caller = self.caller
-        if not self.args:
-            caller.msg("请输入密码：")
-            disconnect_with_timeout(caller, 180, "您三分钟未输入，已断开连接！")
+    def login_password(self, caller, password):
+        """Input password for login."""
+        if not password:
+            prompt(caller, "enter_password")
             return
-        password = self.args.strip()
         account = caller.ndb.login_account
-        if account.check_password(password):
+        if not allow_attempt(caller.address, account):
+            EVENT_LOG.log("login_throttled", caller, account=account.key)
+            prompt(caller, "login_throttled")
+            return
+        # 密码校验在线程池中进行，期间不接受其他输入
+        caller.ndb.login_state = "checking_password"
+        verify_password(account, password).addCallback(self.at_password_checked, caller, account)
+
+    def at_password_checked(self, valid, caller, account):
+        """Finish logging in once the password has been checked."""
+        if evennia.SESSION_HANDLER.get(caller.sessid) is not caller:
+            # 校验期间连接已断开
+            return
+        if caller.logged_in or caller.ndb.login_state != "checking_password":
+            # 校验期间已登录
+            return
+        if valid:
+            clear_login_flow(caller)
             caller.login(account)
-            caller.msg("登录成功！欢迎回到江湖！")
-            caller.cmdset.remove(LoginPasswordCmdSet)
+            EVENT_LOG.log("login", caller, account=account.key)
+            send_template(caller, "login_success")
         else:
-            caller.msg("密码错误，请重新输入您的英文名字：")
-            caller.cmdset.add(EnterNameCmdSet)
-            caller.cmdset.remove(LoginPasswordCmdSet)
-            disconnect_with_timeout(caller, 180, "您三分钟未输入，已断开连接！")
-
-class CmdCreateConfirm(MuxCommand):
-    """Confirm account creation."""
-    key = "y"
+            prompt(caller, "wrong_password", "enter_name")
 
-    def func(self):
-        caller = self.caller
-        caller.msg("现在请您给自己取一个有气质，有个性的名字。\n"
-                   "如果您有困难输入中文名字，请直接敲回车键。\n"
-                   "请给自己取一个中文名字：")
-        caller.cmdset.add(CreateNameCmdSet)
-        caller.cmdset.remove(CreateConfirmCmdSet)
-        disconnect_with_timeout(caller, 180, "您三分钟未输入，已断开连接！")
+    def create_confirm(self, caller, args):
+        """Confirm account creation."""
+        prompt(caller, "choose_name", "set_name")
 
-class CmdCreateDeny(MuxCommand):
-    """Deny account creation."""
-    key = "n"
-
-    def func(self):
-        caller = self.caller
-        caller.msg("请输入您的英文名字：")
-        caller.cmdset.add(EnterNameCmdSet)
-        caller.cmdset.remove(CreateConfirmCmdSet)
-        disconnect_with_timeout(caller, 180, "您三分钟未输入，已断开连接！")
-
-class CmdSetName(MuxCommand):
-    """Set a Chinese name."""
-    key = "name"
+    def create_deny(self, caller, args):
+        """Deny account creation."""
+        prompt(caller, "enter_name", "enter_name")
 
-    def func(self):
-        caller = self.caller
-        if not self.args.strip():
+    def set_name(self, caller, name):
+        """Set a Chinese name."""
+        if not name:
             random_name = generate_random_name()
             caller.ndb.temp_name = random_name
-            caller.msg(f"看来您要个随机产生的中文名字．．\n"
-                       f"请问您是否满意这个中文名字(y/n)？ ──〖 {random_name} 〗：")
-            caller.cmdset.add(ConfirmNameCmdSet)
-            disconnect_with_timeout(caller, 180, "您三分钟未输入，已断开连接！")
+            prompt(caller, "random_name", "confirm_name", name=random_name)
         else:
-            caller.ndb.temp_name = self.args.strip()
-            caller.msg("请设定您的密码：")
-            caller.cmdset.add(SetPasswordCmdSet)
-            caller.cmdset.remove(CreateNameCmdSet)
-            disconnect_with_timeout(caller, 180, "您三分钟未输入，已断开连接！")
-
-class CmdConfirmName(MuxCommand):
-    """Confirm random Chinese name."""
-    key = "y"
-
-    def func(self):
-        caller = self.caller
-        caller.msg("请设定您的密码：")
-        caller.cmdset.add(SetPasswordCmdSet)
-        caller.cmdset.remove(ConfirmNameCmdSet)
-        disconnect_with_timeout(caller, 180, "您三分钟未输入，已断开连接！")
+            caller.ndb.temp_name = name
+            prompt(caller, "set_password", "set_password")
 
-class CmdDenyName(MuxCommand):
-    """Deny random Chinese name."""
-    key = "n"
+    def confirm_name(self, caller, args):
+        """Confirm random Chinese name."""
+        prompt(caller, "set_password", "set_password")
 
-    def func(self):
-        caller = self.caller
-        caller.msg("请给自己取一个中文名字：")
-        caller.cmdset.remove(ConfirmNameCmdSet)
-        disconnect_with_timeout(caller, 180, "您三分钟未输入，已断开连接！")
+    def deny_name(self, caller, args):
+        """Deny random Chinese name."""
+        prompt(caller, "set_name", "set_name")
 
-class CmdSetPassword(MuxCommand):
-    """Set account password."""
-    key = "password"
-
-    def func(self):
-        caller = self.caller
-        password = self.args.strip()
+    def set_password(self, caller, password):
+        """Set account password."""
         if len(password) < 5:
-            caller.msg("密码的长度至少要五个字符，请重设您的密码：")
+            send_template(caller, "password_too_short")
+            return
+        # 与 create_account 用同样的校验，免得到最后一步才失败
+        valid, error = AccountDB.validate_password(password)
+        if not valid:
+            send_template(caller, "password_invalid", errors=" ".join(error.messages))
             return
         caller.ndb.temp_password = password
-        caller.msg("请再输入一次您的密码，以确认您没记错：")
-        caller.cmdset.add(ConfirmPasswordCmdSet)
-        caller.cmdset.remove(SetPasswordCmdSet)
-        disconnect_with_timeout(caller, 180, "您三分钟未输入，已断开连接！")
-
-class CmdConfirmPassword(MuxCommand):
-    """Confirm account password."""
-    key = "password"
+        prompt(caller, "confirm_password", "confirm_password")
 
-    def func(self):
-        caller = self.caller
-        if self.args != caller.ndb.temp_password:
-            caller.msg("两次密码不一致，请重设您的密码：")
-            caller.cmdset.add(SetPasswordCmdSet)
-            caller.cmdset.remove(ConfirmPasswordCmdSet)
-            disconnect_with_timeout(caller, 180, "您三分钟未输入，已断开连接！")
+    def confirm_password(self, caller, password):
+        """Confirm account password."""
+        if password != caller.ndb.temp_password:
+            prompt(caller, "password_mismatch", "set_password")
         else:
-            caller.msg("请设定您的身份标识，该标识在您自杀，以及取回密码时使用。不可修改，请谨慎保管：")
-            caller.cmdset.add(SetIdentifierCmdSet)
-            caller.cmdset.remove(ConfirmPasswordCmdSet)
-            disconnect_with_timeout(caller, 180, "您三分钟未输入，已断开连接！")
-
-class CmdSetIdentifier(MuxCommand):
-    """Set account identifier."""
-    key = "identifier"
+            prompt(caller, "set_identifier", "set_identifier")
 
-    def func(self):
-        caller = self.caller
-        identifier = self.args.strip()
+    def set_identifier(self, caller, identifier):
+        """Set account identifier."""
         if len(identifier) < 9:
-            caller.msg("身份标识的长度至少要九个字符，请重设您的身份标识：")
+            send_template(caller, "identifier_too_short")
             return
         caller.ndb.temp_identifier = identifier
-        caller.msg("请再输入一次您的身份标识，以确认您没记错：")
-        caller.cmdset.add(ConfirmIdentifierCmdSet)
-        caller.cmdset.remove(SetIdentifierCmdSet)
-        disconnect_with_timeout(caller, 180, "您三分钟未输入，已断开连接！")
-
-class CmdConfirmIdentifier(MuxCommand):
-    """Confirm account identifier."""
-    key = "identifier"
+        prompt(caller, "confirm_identifier", "confirm_identifier")
 
-    def func(self):
-        caller = self.caller
-        if self.args != caller.ndb.temp_identifier:
-            caller.msg("两次身份标识不一致，请重设您的身份标识：")
-            caller.cmdset.add(SetIdentifierCmdSet)
-            caller.cmdset.remove(ConfirmIdentifierCmdSet)
-            disconnect_with_timeout(caller, 180, "您三分钟未输入，已断开连接！")
+    def confirm_identifier(self, caller, identifier):
+        """Confirm account identifier."""
+        if identifier != caller.ndb.temp_identifier:
+            prompt(caller, "identifier_mismatch", "set_identifier")
         else:
-            caller.msg(
-                """一个人物的天赋对于他或她所修习的武艺息息相关。
-人物大多具有以下六项天赋,其中福缘与容貌是隐藏属性：
-　　㈠　臂力：影响攻击能力及负荷量的大小。
-　　㈡　悟性：影响学习武功秘籍的速度及理解师傅的能力。
-　　㈢　根骨：影响体力恢复的速度及升级后所增加的体力。
-　　㈣　身法：影响防御及躲避的能力。
-　　㈤　福缘：影响解迷、奇遇，拜师等运气方面。
-　　㈥  容貌：影响解密，拜师的条件以及玩家和NPC对你的印象。
-您可以输入 (1-4) 指定其中的一项值，或者输入 0 由系统随机选择。
-您的选择是 (0-4)："""
-            )
-            caller.cmdset.add(SetAttributeCmdSet)
-            caller.cmdset.remove(ConfirmIdentifierCmdSet)
-            disconnect_with_timeout(caller, 300, "您用的时间太久了！")
-
-class CmdSetAttribute(MuxCommand):
-    """Choose attribute allocation method."""
-    key = "attribute"
+            prompt(caller, "attributes_intro", "set_attribute", LONG_TIMEOUT)
 
-    def func(self):
-        caller = self.caller
-        choice = self.args.strip()
+    def set_attribute(self, caller, choice):
+        """Choose attribute allocation method."""
         if choice not in {"0", "1", "2", "3", "4"}:
-            caller.msg("请输入 0-4：")
-            disconnect_with_timeout(caller, 300, "您用的时间太久了！")
+            prompt(caller, "attribute_choice_invalid", timeout=LONG_TIMEOUT)
             return
         caller.ndb.attr_choice = int(choice)
         if choice == "0":
             self.try_attributes(caller)
         else:
-            caller.msg("请输入您想要的数值(10-30)：")
-            caller.cmdset.add(SetAttributeValueCmdSet)
-            caller.cmdset.remove(SetAttributeCmdSet)
-            disconnect_with_timeout(caller, 300, "您用的时间太久了！")
+            prompt(caller, "attribute_value", "set_attribute_value", LONG_TIMEOUT)
+
+    def set_attribute_value(self, caller, args):
+        """Set a specific attribute value."""
+        try:
+            value = int(args)
+        except ValueError:
+            prompt(caller, "attribute_value_invalid", timeout=LONG_TIMEOUT)
+            return
+        if not 10 <= value <= 30:
+            prompt(caller, "attribute_value_range", timeout=LONG_TIMEOUT)
+            return
+        caller.ndb.attr_value = value
+        self.try_attributes(caller)
 
     def try_attributes(self, caller):
-        char = caller.ndb.temp_character or create_object("typeclasses.characters.Character", key=caller.ndb.new_account_name)
-        caller.ndb.temp_character = char
+        """Roll a set of innate attributes and ask the caller to accept it."""
         attr_map = {1: "先天臂力", 2: "先天悟性", 3: "先天根骨", 4: "先天身法"}
         fixed_attr = attr_map.get(caller.ndb.attr_choice)
         fixed_value = caller.ndb.attr_value if fixed_attr else None
-        char.set_innate_attributes(fixed_attr, fixed_value)
-        attrs = char.db.innate_attributes
-        caller.msg(
-            f"膂力[{attrs['先天臂力']}]，悟性[{attrs['先天悟性']}]，"
-            f"根骨[{attrs['先天根骨']}]，身法[{attrs['先天身法']}]\n"
-            "您同意这一组天赋吗(y/n)？"
-        )
-        caller.cmdset.add(ConfirmAttributesCmdSet)
+        # 重掷只保存在 ndb 中，直到角色创建时才写入数据库
+        attrs = caller.ndb.temp_attributes = roll_innate_attributes(fixed_attr, fixed_value)
+        prompt(caller, "attributes_roll", "confirm_attributes", LONG_TIMEOUT, **attrs)
 
-class CmdSetAttributeValue(MuxCommand):
-    """Set a specific attribute value."""
-    key = "value"
+    def confirm_attributes(self, caller, args):
+        """Confirm character attributes."""
+        prompt(caller, "set_gender", "set_gender")
 
-    def func(self):
-        caller = self.caller
-        try:
-            value = int(self.args.strip())
-            if not 10 <= value <= 30:
-                caller.msg("数值需在 10-30 之间：")
-                disconnect_with_timeout(caller, 300, "您用的时间太久了！")
-                return
-            caller.ndb.attr_value = value
-            CmdSetAttribute().try_attributes(caller)
-            caller.cmdset.remove(SetAttributeValueCmdSet)
-            disconnect_with_timeout(caller, 300, "您用的时间太久了！")
-        except ValueError:
-            caller.msg("请输入有效数字(10-30)：")
-            disconnect_with_timeout(caller, 300, "您用的时间太久了！")
-
-class CmdConfirmAttributes(MuxCommand):
-    """Confirm character attributes."""
-    key = "y"
-
-    def func(self):
-        caller = self.caller
-        caller.msg("您要扮演男性(m)的角色或女性(f)的角色？")
-        caller.cmdset.add(SetGenderCmdSet)
-        caller.cmdset.remove(ConfirmAttributesCmdSet)
-        disconnect_with_timeout(caller, 180, "您三分钟未输入，已断开连接！")
+    def deny_attributes(self, caller, args):
+        """Deny character attributes."""
+        self.try_attributes(caller)
 
-class CmdDenyAttributes(MuxCommand):
-    """Deny character attributes."""
-    key = "n"
-
-    def func(self):
-        caller = self.caller
-        CmdSetAttribute().try_attributes(caller)
-        caller.cmdset.remove(ConfirmAttributesCmdSet)
-        disconnect_with_timeout(caller, 300, "您用的时间太久了！")
-
-class CmdSetGender(MuxCommand):
-    """Set character gender."""
-    key = "gender"
-
-    def func(self):
-        caller = self.caller
-        gender = self.args.strip().lower()
+    def set_gender(self, caller, gender):
+        """Set character gender, then create and log in."""
+        gender = gender.lower()
         if gender not in {"m", "f"}:
-            caller.msg("请输入 m（男性）或 f（女性）：")
-            disconnect_with_timeout(caller, 180, "您三分钟未输入，已断开连接！")
+            prompt(caller, "gender_invalid")
             return
-        caller.ndb.gender = "男性" if gender == "m" else "女性"
+        gender = "男性" if gender == "m" else "女性"
 
-        # 创建并登录
+        # 创建并登录：整个流程中唯一一次写入数据库
         account_name = caller.ndb.new_account_name
-        password = caller.ndb.temp_password
-        identifier = caller.ndb.temp_identifier
-        chinese_name = caller.ndb.temp_name
-        char = caller.ndb.temp_character
-
-        account = create_object("typeclasses.accounts.Account", key=account_name)
-        account.set_password(password)
-        account.db.identifier = identifier
-        char.db.chinese_name = chinese_name
-        char.db.gender = caller.ndb.gender
-        char.location = "#5"
-        account.characters.add(char)
+        try:
+            with transaction.atomic():
+                # 选名字之后，别的流程可能已经用这个名字注册了
+                if AccountDB.objects.filter(username__iexact=account_name).exists():
+                    raise IntegrityError(f"Account name '{account_name}' is taken.")
+                account = create_account(
+                    account_name,
+                    None,
+                    caller.ndb.temp_password,
+                    typeclass="typeclasses.accounts.Account",
+                    attributes=[("identifier", caller.ndb.temp_identifier)],
+                )
+                char = create_object(
+                    "typeclasses.characters.Character",
+                    key=account_name,
+                    location="#5",
+                    home="#5",
+                    attributes=[
+                        ("chinese_name", caller.ndb.temp_name),
+                        ("gender", gender),
+                        ("innate_attributes", caller.ndb.temp_attributes),
+                    ],
+                )
+                account.characters.add(char)
+        except IntegrityError:
+            prompt(caller, "name_taken", "enter_name")
+            return
+        except ValidationError as error:
+            prompt(caller, "password_invalid", "set_password", errors=" ".join(error.messages))
+            return
+        clear_login_flow(caller)
         caller.login(account)
-        caller.msg("角色创建成功！欢迎踏入《夕阳又现》的江湖！")
-        caller.cmdset.remove(SetGenderCmdSet)
-
-# 定义命令集
-class EnterNameCmdSet(CmdSet):
-    """Command set for entering an English name."""
-    key = "EnterNameCmdSet"
-    def at_cmdset_creation(self):
-        self.add(CmdEnterName)
+        EVENT_LOG.log("account_login_created", caller, account=account.key)
+        send_template(caller, "create_success")
+
+class CmdChannel(DefaultCmdChannel):
+    __doc__ = DefaultCmdChannel.__doc__
+
+    def get_channel_history(self, channel, start_index=0):
+        """View a channel's history, served from memory where possible."""
+        channel.get_history(lambda lines: self.msg("\n".join(lines)), start_index, 20)
+
+class CmdHelp(DefaultCmdHelp):
+    __doc__ = DefaultCmdHelp.__doc__
+
+    def collect_topics(self, caller, mode="list"):
+        """
+        Same as the default, but the file and database topics come from the
+        help index instead of a scan with a lock check per entry.
+        """
+        cmdset = self.cmdset
+        cmdset.make_unique(caller)
+        can_show = self.can_list_topic if mode == "list" else self.can_read_topic
+        cmd_help_topics = {
+            getattr(cmd, "auto_help_display_key", cmd.key): cmd
+            for cmd in cmdset
+            if cmd and cmd.access(caller, "cmd") and can_show(cmd, caller)
+        }
+        self.help_view = HELP_INDEX.view(caller, mode)
+        db_help_topics, file_help_topics = HELP_INDEX.topics_in_view(mode, self.help_view)
+        return cmd_help_topics, db_help_topics, file_help_topics
+
+    def do_search(self, query, entries, search_fields=None):
+        """
+        Match commands and categories by name and look up topics in the
+        help index, instead of building a Lunr index of all entries. Searches
+        of other fields go to the default.
+        """
+        if search_fields:
+            return super().do_search(query, entries, search_fields)
+        base_query = query.lower()
+        if base_query and base_query[0] in settings.CMD_IGNORE_PREFIXES:
+            base_query = base_query[1:]
+        exact, prefixed, topics = None, [], {}
+        for entry in entries:
+            if isinstance(entry, HelpCategory) or inherits_from(
+                entry, "evennia.commands.command.Command"
+            ):
+                names = [entry.key] + list(getattr(entry, "aliases", []))
+                names = [name.lower().lstrip(settings.CMD_IGNORE_PREFIXES) for name in names]
+                if exact is None and base_query in names:
+                    exact = entry
+                elif any(name.startswith(base_query) for name in names):
+                    prefixed.append(entry)
+            else:
+                topics[entry.key.lower().strip()] = entry
+        found = [topics[key] for key in HELP_INDEX.search(base_query, topics, self.suggestion_maxnum)]
+        exact_topic = HELP_INDEX.find(base_query)
+        if exact is None and found and exact_topic and found[0] is topics.get(exact_topic.key):
+            exact = found.pop(0)
+        matches = ([exact] if exact else []) + prefixed + found
+        if not matches:
+            return None, []
+        suggestions = [match.key for match in matches[: self.suggestion_maxnum]]
+        return matches[0], suggestions
 
-class LoginPasswordCmdSet(CmdSet):
-    """Command set for entering a password."""
-    key = "LoginPasswordCmdSet"
-    def at_cmdset_creation(self):
-        self.add(CmdLoginPassword)
+    def func(self):
+        """
+        Serve the help listing and file/database topics from the help index;
+        everything else the default way.
+        """
+        caller = self.caller
+        if not self.topic:
+            cmd_help_topics, db_help_topics, file_help_topics = self.collect_topics(caller, "list")
+            # 列表按客户端宽度分栏，宽度也是键的一部分
+            signature = (
+                self.help_view,
+                tuple(sorted(cmd_help_topics)),
+                self.clickable_topics,
+                self.client_width(),
+            )
+            output = HELP_INDEX.get_listing(signature)
+            if output is None:
+                key_and_aliases = set(chain(*(cmd._keyaliases for cmd in cmd_help_topics.values())))
+                cmd_help_by_category = defaultdict(list)
+                for key, cmd in cmd_help_topics.items():
+                    cmd_help_by_category[cmd.help_category].append(
+                        self.strip_cmd_prefix(key, key_and_aliases)
+                    )
+                file_db_help_by_category = defaultdict(list)
+                for key, entry in {**file_help_topics, **db_help_topics}.items():
+                    file_db_help_by_category[entry.help_category].append(key)
+                output = self.format_help_index(
+                    cmd_help_by_category, file_db_help_by_category, click_topics=self.clickable_topics
+                )
+                HELP_INDEX.add_listing(signature, output)
+            self.msg_help(output)
+            return
 
-class CreateConfirmCmdSet(CmdSet):
-    """Command set for confirming account creation."""
-    key = "CreateConfirmCmdSet"
-    def at_cmdset_creation(self):
-        self.add(CmdCreateConfirm)
-        self.add(CmdCreateDeny)
+        topic = HELP_INDEX.find(self.topic)
+        if topic is None or any(self.topic in cmd._keyaliases for cmd in self.cmdset if cmd):
+            super().func()
+            return
+        db_help_topics, file_help_topics = HELP_INDEX.topics_in_view(
+            "query", HELP_INDEX.view(caller, "query")
+        )
+        if topic.key not in db_help_topics and topic.key not in file_help_topics:
+            super().func()
+            return
 
-class CreateNameCmdSet(CmdSet):
-    """Command set for setting a Chinese name."""
-    key = "CreateNameCmdSet"
-    def at_cmdset_creation(self):
-        self.add(CmdSetName)
+        # 使用预先拆分好的子话题树
+        tree, path = topic.tree, topic.entry.key
+        for query in self.subtopics:
+            subtopic = query
+            if subtopic not in tree:
+                # 先试开头匹配，再试包含匹配
+                subtopic = next((key for key in tree if key and key.startswith(query)), None)
+                subtopic = subtopic or next((key for key in tree if key and query in key), None)
+                if subtopic is None:
+                    checked_topic = f"{path}{self.subtopic_separator_char}{query}"
+                    self.msg_help(
+                        self.format_help_entry(
+                            topic=path,
+                            help_text=f"No help entry found for '{checked_topic}'",
+                            subtopics=[key for key in tree if key is not None],
+                            click_topics=self.clickable_topics,
+                        )
+                    )
+                    return
+            tree = tree[subtopic]
+            path += f"{self.subtopic_separator_char}{subtopic}"
+
+        suggested = HELP_INDEX.search(
+            self.topic, ChainMap(db_help_topics, file_help_topics), self.suggestion_maxnum
+        )
+        self.msg_help(
+            self.format_help_entry(
+                topic=path,
+                help_text=tree[None],
+                aliases=None if self.subtopics else topic.aliases,
+                subtopics=[key for key in tree if key is not None],
+                suggested=[key for key in suggested if key != topic.key],
+                click_topics=self.clickable_topics,
+            )
+        )
 
-class ConfirmNameCmdSet(CmdSet):
-    """Command set for confirming a random Chinese name."""
-    key = "ConfirmNameCmdSet"
-    def at_cmdset_creation(self):
-        self.add(CmdConfirmName)
-        self.add(CmdDenyName)
+class CmdImportTime(MuxCommand):
+    """
+    report the slowest imports of a server start
 
-class SetPasswordCmdSet(CmdSet):
-    """Command set for setting a password."""
-    key = "SetPasswordCmdSet"
-    def at_cmdset_creation(self):
-        self.add(CmdSetPassword)
+    Usage:
+      importtime [<number>]
 
-class ConfirmPasswordCmdSet(CmdSet):
-    """Command set for confirming a password."""
-    key = "ConfirmPasswordCmdSet"
-    def at_cmdset_creation(self):
-        self.add(CmdConfirmPassword)
+    Imports the server and game modules in a new Python process with
+    import timing on and lists the <number> (default 15) slowest modules,
+    by their own import time and with everything they imported, plus the
+    total against the reload target.
+    """
+    key = "importtime"
+    locks = "cmd:perm(Developer)"
+    help_category = "System"
 
-class SetIdentifierCmdSet(CmdSet):
-    """Command set for setting an identifier."""
-    key = "SetIdentifierCmdSet"
-    def at_cmdset_creation(self):
-        self.add(CmdSetIdentifier)
+    def func(self):
+        count = int(self.args) if self.args.strip().isdigit() else 15
+        self.msg("Profiling imports in a new process ...")
+        profile_imports().addCallbacks(
+            lambda times: self.report(times, count),
+            lambda failure: self.msg(f"|rImport profiling failed:|n {failure.getErrorMessage()}"),
+        )
 
-class ConfirmIdentifierCmdSet(CmdSet):
-    """Command set for confirming an identifier."""
-    key = "ConfirmIdentifierCmdSet"
-    def at_cmdset_creation(self):
-        self.add(CmdConfirmIdentifier)
+    def report(self, times, count):
+        """Show the profile."""
+        if not times:
+            self.msg("No imports were recorded.")
+            return
+        total = sum(entry.cumulative_us for entry in times if entry.depth == 0) / 1e6
+        target = settings.RELOAD_IMPORT_TARGET
+        color = "|g" if total <= target else "|r"
+        lines = [f"Imports took {color}{total:.2f}s|n in all (target {target}s, {len(times)} modules)."]
+        for label, attr in (("own time", "self_us"), ("with dependencies", "cumulative_us")):
+            lines.append(f"|wSlowest by {label}:|n")
+            for entry in sorted(times, key=lambda entry: getattr(entry, attr), reverse=True)[:count]:
+                lines.append(f"  {getattr(entry, attr) / 1000:9.1f}ms  {entry.module}")
+        self.msg("\n".join(lines))
+
+class CmdRoute(MuxCommand):
+    """
+    show the shortest way to a room
+
+    Usage:
+      route <room>
+
+    Lists the exits to take from here to <room>, looked up in the room
+    graph.
+    """
+    key = "route"
+    locks = "cmd:perm(Builder)"
+    help_category = "Building"
 
-class SetAttributeCmdSet(CmdSet):
-    """Command set for choosing attribute allocation."""
-    key = "SetAttributeCmdSet"
-    def at_cmdset_creation(self):
-        self.add(CmdSetAttribute)
+    def func(self):
+        caller = self.caller
+        if not self.args:
+            self.msg("Usage: route <room>")
+            return
+        target = caller.search(self.args, global_search=True)
+        if not target:
+            return
+        if not caller.location:
+            self.msg("You are nowhere.")
+            return
+        route = ROOM_GRAPH.path(caller.location.id, target.id)
+        if route is None:
+            self.msg(f"There is no way from here to {target.get_display_name(caller)}.")
+        elif not route:
+            self.msg("You are already there.")
+        else:
+            keys = [ROOM_GRAPH.edges[exit_id][2] for exit_id in route]
+            self.msg(f"{len(route)} steps to {target.get_display_name(caller)}: {', '.join(keys)}")
 
-class SetAttributeValueCmdSet(CmdSet):
-    """Command set for setting a specific attribute value."""
-    key = "SetAttributeValueCmdSet"
+# 定义命令集
+class AccountCmdSet(DefaultAccountCmdSet):
+    """Command set available to the account at all times."""
+    key = "DefaultAccount"
     def at_cmdset_creation(self):
-        self.add(CmdSetAttributeValue)
-
-class ConfirmAttributesCmdSet(CmdSet):
-    """Command set for confirming character attributes."""
-    key = "ConfirmAttributesCmdSet"
+        super().at_cmdset_creation()
+        self.add(CmdChannel)
+        self.add(CmdHelp)
+        self.add(CmdImportTime)
+
+class CharacterCmdSet(DefaultCharacterCmdSet):
+    """Command set available to the character."""
+    key = "DefaultCharacter"
     def at_cmdset_creation(self):
-        self.add(CmdConfirmAttributes)
-        self.add(CmdDenyAttributes)
+        super().at_cmdset_creation()
+        self.add(CmdHelp)
+        self.add(CmdRoute)
 
-class SetGenderCmdSet(CmdSet):
-    """Command set for setting character gender."""
-    key = "SetGenderCmdSet"
+class LoginFlowCmdSet(CmdSet):
+    """Command set for the whole login and account creation flow."""
+    key = "LoginFlowCmdSet"
     def at_cmdset_creation(self):
-        self.add(CmdSetGender)
+        self.add(CmdLoginFlow)
 
 class UnloggedinCmdSet(CmdSet):
     """Command set for unlogged-in users."""
@@ -411,4 +631,4 @@ class UnloggedinCmdSet(CmdSet):
         self.add(CmdUnconnectedLook)
         self.add(CmdUnconnectedConnect)
         self.add(CmdUnconnectedCreate)
-        self.add(CmdEnterName)
\ No newline at end of file
+        self.add(CmdLoginFlow)
\ No newline at end of file
@@ -0,0 +1,246 @@
+"""
+Tests for the commands.
+
+Run with
+
+    evennia test --settings settings.py commands
+
+"""
+
+import random
+import time
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+import evennia
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from evennia.commands import cmdparser as default_parser
+from evennia.commands.cmdset import CmdSet
+from evennia.commands.command import Command
+from evennia.server.serversession import ServerSession
+from evennia.utils.test_resources import EvenniaTest
+
+from server.conf.cmdparser import cmdparser, get_trie
+from world.account_index import ACCOUNT_NAMES
+from world.cmdset_cache import MergeRecipe
+
+from .default_cmdsets import (
+    CmdLoginFlow,
+    clear_login_flow,
+    dump_login_flows,
+    load_login_flows,
+    resume_login_flow,
+)
+
+# 解析器对照测试：随机命令集的命令数和每个命令集的输入数
+PARSER_COMMANDS = 60
+PARSER_INPUTS = 2000
+# 拼命令名的片段，有意让许多名字共用前缀
+NAME_PARTS = ["l", "lo", "look", "get", "g", "@", "!", "说", "看", "看看", "东", "all", " "]
+INPUT_TAILS = ["", " ", " sword", "sword", "-2", ".1", " 长剑", "x"]
+
+# 负载测试中同时注册的会话数
+LOAD_TEST_SESSIONS = 1000
+
+# 能通过 Django 密码校验的密码
+PASSWORD = "Qz7-lantern-Wx"
+# 一次完整注册的输入：(命令, 参数)，最后一步才写数据库
+REGISTRATION_STEPS = [
+    ("name", "{name}"),
+    ("y", ""),
+    ("name", "张无忌"),
+    ("password", PASSWORD),
+    ("password", PASSWORD),
+    ("identifier", "123456789"),
+    ("identifier", "123456789"),
+    ("attribute", "0"),
+    ("y", ""),
+]
+FINAL_STEP = ("gender", "m")
+
+
+def _new_session(sessid):
+    session = ServerSession()
+    session.init_session("telnet", ("localhost", sessid), evennia.SESSION_HANDLER)
+    session.sessid = sessid
+    session.login = Mock()
+    return session
+
+
+def _input(session, cmdstring, args=""):
+    cmd = CmdLoginFlow()
+    cmd.caller = cmd.session = session
+    cmd.cmdstring, cmd.args = cmdstring, args
+    cmd.at_pre_cmd()
+    cmd.func()
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class TestRegistrationLoad(EvenniaTest):
+    def setUp(self):
+        super().setUp()
+        ACCOUNT_NAMES.load()
+        self.sessions = [_new_session(1000 + number) for number in range(LOAD_TEST_SESSIONS)]
+
+    def tearDown(self):
+        for session in self.sessions:
+            clear_login_flow(session)
+        super().tearDown()
+
+    def test_simultaneous_registrations(self):
+        start = time.perf_counter()
+        # 所有会话交替推进，如同同时注册
+        with CaptureQueriesContext(connection) as queries:
+            for cmdstring, args in REGISTRATION_STEPS:
+                for number, session in enumerate(self.sessions):
+                    _input(session, cmdstring, args.format(name=f"loadtest{number}"))
+        self.assertEqual(len(queries), 0, "the flow touched the database before the last step")
+        for session in self.sessions:
+            self.assertEqual(session.ndb.login_state, "set_gender")
+
+        for session in self.sessions:
+            _input(session, *FINAL_STEP)
+        elapsed = time.perf_counter() - start
+        print(
+            f"\n{LOAD_TEST_SESSIONS} registrations in {elapsed:.2f}s "
+            f"({LOAD_TEST_SESSIONS / elapsed:,.0f}/s)"
+        )
+
+        for number, session in enumerate(self.sessions):
+            account = session.login.call_args[0][0]
+            self.assertEqual(account.key, f"loadtest{number}")
+            self.assertTrue(account.check_password(PASSWORD))
+            character = account.characters.all()[0]
+            self.assertEqual(character.db.chinese_name, "张无忌")
+            self.assertEqual(character.db.gender, "男性")
+            self.assertIsNone(session.ndb.login_state)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class TestRegistration(EvenniaTest):
+    def setUp(self):
+        super().setUp()
+        ACCOUNT_NAMES.load()
+        self.sessions = [_new_session(1000), _new_session(1001)]
+        for session in self.sessions:
+            session.msg = Mock()
+
+    def tearDown(self):
+        for session in self.sessions:
+            clear_login_flow(session)
+        super().tearDown()
+
+    def test_common_password_refused_early(self):
+        session = self.sessions[0]
+        for cmdstring, args in REGISTRATION_STEPS[:3]:
+            _input(session, cmdstring, args.format(name="careless"))
+        _input(session, "password", "password")
+        self.assertEqual(session.ndb.login_state, "set_password")
+        self.assertIsNone(session.ndb.temp_password)
+
+    def test_same_name_twice(self):
+        first, second = self.sessions
+        for cmdstring, args in REGISTRATION_STEPS:
+            _input(first, cmdstring, args.format(name="twin"))
+            _input(second, cmdstring, args.format(name="twin"))
+        with self.captureOnCommitCallbacks(execute=True):
+            _input(first, *FINAL_STEP)
+        self.assertTrue(ACCOUNT_NAMES.exists("twin"))
+
+        # 后完成的流程得到提示并重新选名，而不是报错
+        _input(second, *FINAL_STEP)
+        second.login.assert_not_called()
+        self.assertEqual(second.ndb.login_state, "enter_name")
+
+
+class TestLoginFlowHandoff(EvenniaTest):
+    def setUp(self):
+        super().setUp()
+        ACCOUNT_NAMES.load()
+        self.login_session = _new_session(1000)
+        self.login_session.msg = Mock()
+
+    def tearDown(self):
+        clear_login_flow(self.login_session)
+        super().tearDown()
+
+    def test_credentials_stay_behind(self):
+        for cmdstring, args in REGISTRATION_STEPS:
+            _input(self.login_session, cmdstring, args.format(name="handoff"))
+        with patch.object(evennia.SESSION_HANDLER, "values", return_value=[self.login_session]):
+            flows = dump_login_flows()
+        self.assertNotIn(PASSWORD, repr(flows))
+        self.assertNotIn("123456789", repr(flows))
+
+        # 新进程中：会话同步之后才恢复，并重新要求设定密码
+        clear_login_flow(self.login_session)
+        load_login_flows(flows)
+        self.assertIsNone(self.login_session.ndb.login_state)
+        resume_login_flow(self.login_session)
+        self.assertEqual(self.login_session.ndb.login_state, "set_password")
+        self.assertEqual(self.login_session.ndb.temp_name, "张无忌")
+        self.assertIsNone(self.login_session.ndb.temp_password)
+
+
+class _CustomMatchCommand(Command):
+    """A command with its own `match`, which the trie cannot hold."""
+
+    def match(self, cmdname, include_prefixes=True):
+        return super().match(cmdname, include_prefixes=include_prefixes)
+
+
+def _random_cmdset(rng):
+    cmdset = CmdSet()
+    for number in range(PARSER_COMMANDS):
+        names = {
+            "".join(rng.choice(NAME_PARTS) for _ in range(rng.randint(1, 3))).strip() or "l"
+            for _ in range(rng.randint(1, 4))
+        }
+        key, *aliases = sorted(names)
+        command_class = _CustomMatchCommand if number % 10 == 0 else Command
+        kwargs = {"arg_regex": r"\s.*?|$"} if number % 3 == 0 else {}
+        cmdset.add(command_class(key=key, aliases=aliases, **kwargs))
+    for cmd in cmdset.commands:
+        # 只比较匹配本身，不检查锁
+        cmd.access = lambda *args, **kwargs: True
+    return cmdset
+
+
+def _random_input(rng, cmdset):
+    cmd = rng.choice(cmdset.commands)
+    name = rng.choice(cmd._keyaliases)
+    if rng.random() < 0.3:
+        name = name[: rng.randint(0, len(name))]
+    if rng.random() < 0.2:
+        name = rng.choice(["", "@", "!", "2-", "1-"]) + name
+    raw_string = name + rng.choice(INPUT_TAILS)
+    return raw_string.upper() if rng.random() < 0.1 else raw_string
+
+
+class TestCommandParser(TestCase):
+    def setUp(self):
+        self.caller = Mock()
+
+    def test_same_matches_as_default(self):
+        for seed in range(5):
+            rng = random.Random(seed)
+            cmdset = _random_cmdset(rng)
+            for _ in range(PARSER_INPUTS):
+                raw_string = _random_input(rng, cmdset)
+                self.assertEqual(
+                    cmdparser(raw_string, cmdset, self.caller),
+                    default_parser.cmdparser(raw_string, cmdset, self.caller),
+                    f"seed {seed}, input {raw_string!r}",
+                )
+
+    def test_trie_shared_by_recipe(self):
+        first, second = _random_cmdset(random.Random(1)), _random_cmdset(random.Random(1))
+        recipe = MergeRecipe([first], first)
+        first, second = recipe.build([first]), recipe.build([second])
+        self.assertIs(get_trie(first), get_trie(second))
+        # 树是共用的，匹配到的仍是所解析命令集自己的命令
+        raw_string = second.commands[0].key
+        for match in cmdparser(raw_string, second, self.caller):
+            self.assertTrue(any(match[2] is cmd for cmd in second.commands))
@@ -17,12 +17,36 @@ at_server_cold_stop()
 
 """
 
+# 游戏模块都在用到它们的钩子里才导入，不拖慢加载本模块
+
+
+def _register_reload_state():
+    """
+    Register the in-memory state handed over to the next process on
+    reload (see world/reload_state.py).
+    """
+    from commands.default_cmdsets import dump_login_flows, load_login_flows
+    from typeclasses.rooms import OCCUPANT_LINES_VERSION, dump_occupant_lines, load_occupant_lines
+    from world.account_index import ACCOUNT_NAMES
+    from world.channel_history import CHANNEL_HISTORY
+    from world.reload_state import RELOAD_STATE
+
+    RELOAD_STATE.register("account_names", ACCOUNT_NAMES.dump_state, ACCOUNT_NAMES.load_state)
+    RELOAD_STATE.register("channel_history", CHANNEL_HISTORY.dump_state, CHANNEL_HISTORY.load_state)
+    RELOAD_STATE.register("login_flows", dump_login_flows, load_login_flows)
+    RELOAD_STATE.register(
+        "occupant_lines", dump_occupant_lines, load_occupant_lines, version=OCCUPANT_LINES_VERSION
+    )
+
 
 def at_server_init():
     """
     This is called first as the server is starting up, regardless of how.
     """
-    pass
+    from world.cmdset_cache import install as install_merge_cache
+
+    install_merge_cache()
+    _register_reload_state()
 
 
 def at_server_start():
@@ -30,7 +54,19 @@ def at_server_start():
     This is called every time the server starts up, regardless of
     how it was shut down.
     """
-    pass
+    from world.account_index import ACCOUNT_NAMES
+    from world.help_index import HELP_INDEX
+    from world.object_index import OBJECT_INDEX
+    from world.room_graph import ROOM_GRAPH
+    from world.warmup import warm_up
+
+    if ACCOUNT_NAMES.ids is None:
+        # 重载时已从上一个进程接过
+        ACCOUNT_NAMES.load()
+    HELP_INDEX.build()
+    ROOM_GRAPH.load()
+    OBJECT_INDEX.load()
+    warm_up()
 
 
 def at_server_stop():
@@ -38,21 +74,29 @@ def at_server_stop():
     This is called just before the server is shut down, regardless
     of it is for a reload, reset or shutdown.
     """
-    pass
+    from world.channel_history import CHANNEL_HISTORY
+    from world.eventlog import EVENT_LOG
+
+    EVENT_LOG.flush()
+    CHANNEL_HISTORY.flush()
 
 
 def at_server_reload_start():
     """
     This is called only when server starts back up after a reload.
     """
-    pass
+    from world.reload_state import RELOAD_STATE
+
+    RELOAD_STATE.restore()
 
 
 def at_server_reload_stop():
     """
     This is called only time the server stops before a reload.
     """
-    pass
+    from world.reload_state import RELOAD_STATE
+
+    RELOAD_STATE.save()
 
 
 def at_server_cold_start():
@@ -60,7 +104,9 @@ def at_server_cold_start():
     This is called only when the server starts "cold", i.e. after a
     shutdown or a reset.
     """
-    pass
+    from world.reload_state import RELOAD_STATE
+
+    RELOAD_STATE.discard()
 
 
 def at_server_cold_stop():
@@ -22,15 +22,168 @@ parser return a list of matches. Each match is a tuple with its first
 three elements being the parsed cmdname (lower case), the remaining
 arguments, and the matched cmdobject from the cmdset.
 
+This parser gives the same matches as the default one, but instead of
+asking every command in the cmdset whether the input starts with one of
+its keys or aliases, it walks the input down a prefix trie of all keys
+and aliases - Chinese ones included, one character per step - and only
+checks the commands whose names it meets on the way.
 
-This module is not accessed by default. To tell Evennia to use it
-instead of the default command parser, add the following line to
-your settings file:
+The trie, with and without the ignored prefixes, only holds the names
+and the positions of the commands in the merged cmdset; the commands
+themselves, with their locks and `arg_regex`, are taken from the cmdset
+being parsed. It is kept on the merge recipe of the cmdset (see
+`world/cmdset_cache.py`), so all players with the same stack of cmdsets
+share one trie, found without looking at the commands. A merged cmdset
+without a recipe keeps a trie of its own. A command that changes its
+key or aliases in place (`set_key`, `set_aliases`) is not noticed; exits
+get new commands when they are renamed.
+
+The tests check that both parsers give the same matches. `benchmark`
+compares their speed on generated commands, e.g. in game:
+
+    py from server.conf.cmdparser import benchmark; benchmark(500)
+
+Set in the settings with
 
     COMMAND_PARSER = "server.conf.cmdparser.cmdparser"
 
 """
 
+import time
+
+from django.conf import settings
+
+from evennia.commands import cmdparser as default_parser
+from evennia.commands.cmdparser import create_match, try_num_differentiators
+from evennia.commands.command import Command
+from evennia.utils.logger import log_trace
+
+_CMD_IGNORE_PREFIXES = settings.CMD_IGNORE_PREFIXES
+
+# 终结标记：该节点上结束的 (命令序号, 优先顺序, 名字, 原始名字)
+_END = None
+
+
+class CommandTrie:
+    """
+    Prefix tries over the keys and aliases of the commands in a cmdset.
+
+    """
+
+    def __init__(self, commands):
+        self.prefixed = {}
+        self.unprefixed = {}
+        # 自定义了 match 的命令无法放进前缀树，每次照常逐个匹配
+        self.custom = []
+        for position, cmd in enumerate(commands):
+            if type(cmd).match is not Command.match:
+                self.custom.append(position)
+                continue
+            for rank, name in enumerate(cmd._keyaliases):
+                self._insert(self.prefixed, name, (position, rank, name, name))
+            for rank, (name, raw_name) in enumerate(cmd._noprefix_aliases.items()):
+                self._insert(self.unprefixed, name, (position, rank, name, raw_name))
+
+    @staticmethod
+    def _insert(trie, name, terminal):
+        node = trie
+        for char in name:
+            node = node.setdefault(char, {})
+        node.setdefault(_END, []).append(terminal)
+
+    def match(self, search_string, commands, include_prefixes=True):
+        """
+        Find the name each command would match the start of the input with,
+        like `Command.match` does.
+
+        Args:
+            search_string (str): The lower-case input.
+            commands (list): The commands of the cmdset being parsed, with
+                the same names in the same order as the trie was built from.
+            include_prefixes (bool): Match the names with their prefixes.
+
+        Returns:
+            list: `(position, cmdname, raw_cmdname)`, in cmdset order.
+
+        """
+        # 沿输入逐字走树，收集沿途结束的所有名字
+        node = self.prefixed if include_prefixes else self.unprefixed
+        found = list(node.get(_END, ()))
+        for char in search_string:
+            node = node.get(char)
+            if node is None:
+                break
+            found.extend(node.get(_END, ()))
+        # 每个命令取优先顺序最靠前、且余下部分符合其 arg_regex 的名字
+        best = {}
+        for position, rank, name, raw_name in found:
+            if position in best and best[position][0] < rank:
+                continue
+            arg_regex = commands[position].arg_regex
+            if not arg_regex or arg_regex.match(search_string[len(name) :]):
+                best[position] = (rank, name, raw_name)
+        for position in self.custom:
+            name, raw_name = commands[position].match(
+                search_string, include_prefixes=include_prefixes
+            )
+            if name:
+                best[position] = (0, name, raw_name)
+        # 与 build_matches 一样，名字为空（只由前缀组成）不算匹配
+        return [
+            (position, name, raw_name)
+            for position, (_, name, raw_name) in sorted(best.items())
+            if name
+        ]
+
+
+def get_trie(cmdset):
+    """
+    Get the trie of a merged cmdset, from its merge recipe if it has one.
+
+    Args:
+        cmdset (CmdSet): The merged cmdset.
+
+    Returns:
+        CommandTrie: The trie.
+
+    """
+    # 合并方案由相同命令集栈的玩家共用；没有方案的合并结果自己保存
+    holder = getattr(cmdset, "merge_recipe", None) or cmdset
+    trie = getattr(holder, "command_trie", None)
+    if trie is None:
+        trie = holder.command_trie = CommandTrie(cmdset.commands)
+    return trie
+
+
+def build_matches(raw_string, cmdset, include_prefixes=False):
+    """
+    Build match tuples by matching raw_string against available commands,
+    like `evennia.commands.cmdparser.build_matches`.
+
+    Args:
+        raw_string (str): Input string that can look in any way; the only assumption is
+            that the sought command's name/alias must be *first* in the string.
+        cmdset (CmdSet): The current cmdset to pick Commands from.
+        include_prefixes (bool): If set, include prefixes like @, ! etc (specified in settings)
+            in the match, otherwise strip them before matching.
+
+    Returns:
+        matches (list) A list of match tuples created by `cmdparser.create_match`.
+
+    """
+    matches = []
+    try:
+        if not include_prefixes and len(raw_string) > 1:
+            raw_string = raw_string.lstrip(_CMD_IGNORE_PREFIXES)
+        commands = cmdset.commands
+        for position, cmdname, raw_cmdname in get_trie(cmdset).match(
+            raw_string.lower(), commands, include_prefixes
+        ):
+            matches.append(create_match(cmdname, raw_string, commands[position], raw_cmdname))
+    except Exception:
+        log_trace("cmdhandler error. raw_input:%s" % raw_string)
+    return matches
+
 
 def cmdparser(raw_string, cmdset, caller, match_index=None):
     """
@@ -52,4 +205,99 @@ def cmdparser(raw_string, cmdset, caller, match_index=None):
             (possibly) separate multiple matches.
 
     """
-    # Your implementation here
+    if not raw_string:
+        return []
+
+    # find matches, first using the full name
+    matches = build_matches(raw_string, cmdset, include_prefixes=True)
+
+    if not matches or len(matches) > 1:
+        # no single match, try parsing for optional numerical tags like 1-cmd
+        # or cmd-2, cmd.2 etc
+        match_index, new_raw_string = try_num_differentiators(raw_string)
+        if match_index is not None:
+            matches.extend(build_matches(new_raw_string, cmdset, include_prefixes=True))
+
+    if not matches and _CMD_IGNORE_PREFIXES:
+        # still no match. Try to strip prefixes
+        raw_string = raw_string.lstrip(_CMD_IGNORE_PREFIXES) if len(raw_string) > 1 else raw_string
+        matches = build_matches(raw_string, cmdset, include_prefixes=False)
+
+    # only select command matches we are actually allowed to call.
+    matches = [match for match in matches if match[2].access(caller, "cmd")]
+
+    # try to bring the number of matches down to 1
+    if len(matches) > 1:
+        # See if it helps to analyze the match with preserved case but only if
+        # it leaves at least one match.
+        trimmed = [match for match in matches if raw_string.startswith(match[0])]
+        if trimmed:
+            matches = trimmed
+
+    if len(matches) > 1:
+        # we still have multiple matches. Sort them by count quality.
+        matches = sorted(matches, key=lambda m: m[3])
+        # only pick the matches with highest count quality
+        quality = [mat[3] for mat in matches]
+        matches = matches[-quality.count(quality[-1]) :]
+
+    if len(matches) > 1:
+        # still multiple matches. Fall back to ratio-based quality.
+        matches = sorted(matches, key=lambda m: m[4])
+        # only pick the highest rated ratio match
+        quality = [mat[4] for mat in matches]
+        matches = matches[-quality.count(quality[-1]) :]
+
+    if len(matches) > 1 and match_index is not None:
+        # We couldn't separate match by quality, but we have an
+        # index argument to tell us which match to use.
+        if 0 < match_index <= len(matches):
+            matches = [matches[match_index - 1]]
+        else:
+            # we tried to give an index outside of the range - this means
+            # a no-match
+            matches = []
+
+    # no matter what we have at this point, we have to return it.
+    return matches
+
+
+def benchmark(count=500, rounds=2000):
+    """
+    Time this parser against the default one on a cmdset of `count`
+    generated commands, half with Chinese aliases.
+
+    Args:
+        count (int): Number of commands in the cmdset.
+        rounds (int): Inputs to parse with each parser.
+
+    Returns:
+        dict: Microseconds per input for `"default"` and `"trie"`, and
+            whether both gave the same matches, under `"same"`.
+
+    """
+    from evennia.commands.cmdset import CmdSet
+
+    cmdset = CmdSet()
+    for number in range(count):
+        aliases = [f"c{number}", f"命令{number}"] if number % 2 else [f"c{number}"]
+        cmdset.add(Command(key=f"command{number}", aliases=aliases))
+    inputs = [
+        f"command{number % count} some args" if number % 3 else f"命令{number % count | 1}"
+        for number in range(rounds)
+    ]
+    # 绕开锁检查，只比较匹配本身
+    caller = type("BenchCaller", (), {})()
+    for cmd in cmdset.commands:
+        cmd.access = lambda *args, **kwargs: True
+
+    results = {}
+    for name, parse in (("default", default_parser.cmdparser), ("trie", cmdparser)):
+        start = time.perf_counter()
+        results[name] = [parse(raw, cmdset, caller) for raw in inputs]
+        results[f"{name}_us"] = (time.perf_counter() - start) * 1e6 / rounds
+    return {
+        "default": results["default_us"],
+        "trie": results["trie_us"],
+        "same": results["default"] == results["trie"],
+    }
@@ -6,6 +6,12 @@ Modify this file to specify what MUD listing sites will report about your game.
 All fields are static. The number of currently active players and your game's
 current uptime will be added automatically by Evennia.
 
+This table is read by the Portal, which answers the crawlers; the running
+counts in `world/population.py` live in the Server process, so they cannot
+be read from here. PLAYERS is left to Evennia, which counts the logged-in
+sessions the Portal knows of. Values may be callables, called each time a
+crawler asks.
+
 You don't have to fill in everything (and most fields are not shown/used by all
 crawlers anyway); leave the default if so needed. You need to reload the server
 before the updated information is made available to crawlers (reloading does
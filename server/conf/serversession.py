@@ -23,6 +23,10 @@ settings file:
 
 from evennia.server.serversession import ServerSession as BaseServerSession
 
+from world.eventlog import EVENT_LOG
+from world.population import POPULATION
+from world.timeouts import LOGIN_TIMEOUTS
+
 
 class ServerSession(BaseServerSession):
     """
@@ -34,4 +38,33 @@ class ServerSession(BaseServerSession):
     through their session(s).
     """
 
-    pass
+    def at_sync(self):
+        super().at_sync()
+        # 重载后会话重新同步时不会调用 puppet 钩子，在这里补回人数
+        POPULATION.session_connected(self)
+        EVENT_LOG.log("session_sync", self, logged_in=self.logged_in)
+        if self.puppet:
+            POPULATION.puppeted(self.puppet)
+        # 登录流程要等会话同步之后才能恢复
+        from commands.default_cmdsets import resume_login_flow
+
+        resume_login_flow(self)
+
+    def at_cmdset_get(self, **kwargs):
+        super().at_cmdset_get(**kwargs)
+        # 登记命令集，合并缓存才能认出它们（见 world/cmdset_cache.py）
+        from world.cmdset_cache import MERGE_CACHE
+
+        MERGE_CACHE.register(self.cmdset.cmdset_stack)
+
+    def at_login(self, account):
+        LOGIN_TIMEOUTS.cancel(self.sessid)
+        POPULATION.session_logged_in(self)
+        super().at_login(account)
+
+    def at_disconnect(self, reason=None):
+        LOGIN_TIMEOUTS.cancel(self.sessid)
+        POPULATION.session_disconnected(self)
+        EVENT_LOG.log("disconnect", self, reason=reason)
+        EVENT_LOG.forget(self)
+        super().at_disconnect(reason=reason)
@@ -16,6 +16,30 @@ DEFAULT_HOME = "#5"
 START_LOCATION = "#5"
 ACCOUNT_TYPECLASS = "typeclasses.accounts.Account"
 CMDSET_UNLOGGEDIN = "commands.default_cmdsets.UnloggedinCmdSet"
+CMDSET_ACCOUNT = "commands.default_cmdsets.AccountCmdSet"
+CMDSET_CHARACTER = "commands.default_cmdsets.CharacterCmdSet"
+SERVER_SESSION_CLASS = "server.conf.serversession.ServerSession"
+COMMAND_PARSER = "server.conf.cmdparser.cmdparser"
+GLOBAL_SCRIPTS = {
+    "tick_scheduler": {
+        "typeclass": "typeclasses.scripts.TickScheduler",
+        "interval": 1,
+        "persistent": True,
+        "desc": "Drives all shared ticks",
+    },
+}
+
+# 启动后预热缓存的阶段（见 world/warmup.py）及其总时间预算（秒）
+WARMUP_STAGES = ["cmdsets", "rooms", "exits", "npcs"]
+WARMUP_TIME_BUDGET = 10
+
+# 启动和重载时导入模块的目标总耗时（秒），见 importtime 命令
+RELOAD_IMPORT_TARGET = 3
+
+# 没有自定义的插件服务，不导入空的插件模块；添加服务时再加回
+# "server.conf.server_services_plugins" / "server.conf.portal_services_plugins"
+SERVER_SERVICES_PLUGIN_MODULES = []
+PORTAL_SERVICES_PLUGIN_MODULES = []
 
 # 只保留 Telnet 端口 4000
 TELNET_PORTS = [4000]  # 确保是整数列表
@@ -1,32 +1,75 @@
+from django.conf import settings
+from django.db import transaction
+
 from evennia import DefaultAccount
+from evennia.utils.utils import lazy_property
+
+from world.account_index import ACCOUNT_NAMES
+from world.cmdset_cache import MERGE_CACHE
+from world.eventlog import EVENT_LOG
+from world.permissions import CachedPermissionHandler
+from world.population import POPULATION, chinese_number
+from world.templates import send_template
+
+from .channels import subscriber_offline, subscriber_online
 
 class Account(DefaultAccount):
+    @lazy_property
+    def permissions(self):
+        return CachedPermissionHandler(self)
+
     def at_account_creation(self):
-        print("DEBUG: at_account_creation called")
-        self.cmdset.add_default("commands.default_cmdsets.UnloggedinCmdSet", persistent=True)
+        EVENT_LOG.log("account_created", account=self.key)
+        # 创建可能在事务中回滚，提交后才进索引
+        transaction.on_commit(lambda: ACCOUNT_NAMES.add(self))
+
+    def at_rename(self, oldname, newname):
+        super().at_rename(oldname, newname)
+        ACCOUNT_NAMES.rename(self, oldname)
+
+    def delete(self, *args, **kwargs):
+        key = self.key
+        deleted = super().delete(*args, **kwargs)
+        if deleted:
+            ACCOUNT_NAMES.remove(key)
+            subscriber_offline(self)
+        return deleted
 
     def at_connect(self):
-        print(f"DEBUG: at_connect called for session {self.session.address}")
+        EVENT_LOG.log("account_connect", self.session, account=self.key)
         if not self.is_authenticated():
-            welcome = (
-                "----------------------------------------\n"
-                "          欢迎来到《夕阳又现》          \n"
-                "----------------------------------------\n"
-                "夕阳斜照，江湖波澜再起。刀剑纵横，侠影凌空，\n"
-                "只待豪杰仗义而行，谱写武林新篇。\n"
-                f"你现在从 {self.session.address} 连线进入。\n"
-                "目前共有零位神仙、零位江湖人士在江湖中，以及一位朋友正在步入途中。\n"
-                "----------------------------------------\n"
-                "请输入您的英文名字："
+            wizards, players, connecting = POPULATION.counts()
+            send_template(
+                self,
+                "welcome",
+                address=self.session.address,
+                wizards=chinese_number(wizards),
+                players=chinese_number(players),
+                connecting=chinese_number(connecting),
             )
-            self.msg(welcome)
             self.cmdset.remove_default()
-            self.cmdset.add("commands.default_cmdsets.EnterNameCmdSet")
+            self.cmdset.add("commands.default_cmdsets.LoginFlowCmdSet")
         else:
             last = "您尚是第一次进入夕阳又现" if not self.db.last_login else self.db.last_login
-            self.msg(f"您上次光临是从：{last}\n"
-                     f"您上次连线的时间是：欢迎您成为我们的一员")
+            send_template(self, "welcome_back", last=last)
             super().at_connect()
 
+    def at_cmdset_get(self, **kwargs):
+        super().at_cmdset_get(**kwargs)
+        # 登记命令集，合并缓存才能认出它们（见 world/cmdset_cache.py）
+        MERGE_CACHE.register(self.cmdset.cmdset_stack)
+
+    def at_post_login(self, session=None, **kwargs):
+        if self.cmdset_storage[:1] != [settings.CMDSET_ACCOUNT]:
+            # 早先创建的账号以未登录命令集为默认，换回账号命令集
+            self.cmdset.add_default(settings.CMDSET_ACCOUNT, persistent=True)
+        super().at_post_login(session=session, **kwargs)
+        subscriber_online(self)
+
+    def at_post_disconnect(self, **kwargs):
+        super().at_post_disconnect(**kwargs)
+        if not self.sessions.count():
+            subscriber_offline(self)
+
     def at_login(self):
         self.db.last_login = self.session.get_connect_time()
\ No newline at end of file
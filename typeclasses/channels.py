@@ -12,7 +12,38 @@ to be modified.
 
 """
 
+from weakref import WeakSet
+
 from evennia.comms.comms import DefaultChannel
+from evennia.utils import logger
+from evennia.utils.utils import make_iter
+
+from world.channel_history import CHANNEL_HISTORY
+from world.permissions import access_fingerprint
+
+# 已建立收听者缓存的频道
+_LIVE_CHANNELS = WeakSet()
+
+
+def subscriber_online(subscriber):
+    """
+    Mark `subscriber` as online in the listener cache of every channel.
+    Called when an Account logs in or a Character is puppeted.
+
+    """
+    for channel in list(_LIVE_CHANNELS):
+        if subscriber in channel._subscribers:
+            channel._online.add(subscriber)
+
+
+def subscriber_offline(subscriber):
+    """
+    Mark `subscriber` as offline in the listener cache of every channel.
+    Called when the last session of an Account or Character goes away.
+
+    """
+    for channel in list(_LIVE_CHANNELS):
+        channel._online.discard(subscriber)
 
 
 class Channel(DefaultChannel):
@@ -113,6 +144,205 @@ class Channel(DefaultChannel):
         web_get_update_url()
         web_get_delete_url()
 
+    Delivery:
+        Large channels format each message once per rendering profile
+        instead of once per subscriber. See `render_profile`.
+
+        The subscribers, the online subscribers and the muted subscribers
+        are kept as in-memory sets, so the receivers of a message are found
+        with a set difference. The sets are built on first use and kept up
+        to date by `connect`, `disconnect`, `mute`, `unmute` and by `subscriber_online`/`subscriber_offline`, which the Account
+        and Character login and puppet hooks call. A ban only keeps the
+        target from joining; banning someone is followed by `disconnect`,
+        which drops them from the sets.
+
+    History:
+        The newest lines are kept in memory and written to the log file in
+        batches. See `world.channel_history` and `get_history`.
+
     """
 
-    pass
+    _subscribers = None
+    _online = None
+    _muted = None
+
+    def _build_listener_cache(self):
+        """
+        Build the in-memory subscriber sets from the subscriptions and the
+        stored mute list.
+
+        """
+        self._subscribers = set(self.subscriptions.all())
+        self._online = set(self.subscriptions.online())
+        self._muted = set(self.mutelist)
+        _LIVE_CHANNELS.add(self)
+
+    def refresh_listener_cache(self):
+        """
+        Forget the in-memory subscriber sets, to be rebuilt on next use.
+        Needed only if subscriptions or the mute list were changed without
+        going through this class' methods.
+
+        """
+        self._subscribers = self._online = self._muted = None
+        _LIVE_CHANNELS.discard(self)
+
+    def listeners(self, bypass_mute=False):
+        """
+        Get everyone a message to this channel should go to.
+
+        Args:
+            bypass_mute (bool, optional): Include muted subscribers.
+
+        Returns:
+            set: The receivers.
+
+        """
+        if self._subscribers is None:
+            self._build_listener_cache()
+        receivers = self._online if self.send_to_online_only else self._subscribers
+        if bypass_mute:
+            return set(receivers)
+        return receivers - self._muted
+
+    def connect(self, subscriber, **kwargs):
+        connected = super().connect(subscriber, **kwargs)
+        if connected and self._subscribers is not None:
+            self._subscribers.add(subscriber)
+            if subscriber.is_connected:
+                self._online.add(subscriber)
+            self._muted.discard(subscriber)
+        return connected
+
+    def disconnect(self, subscriber, **kwargs):
+        disconnected = super().disconnect(subscriber, **kwargs)
+        if disconnected and self._subscribers is not None:
+            self._subscribers.discard(subscriber)
+            self._online.discard(subscriber)
+            self._muted.discard(subscriber)
+        return disconnected
+
+    def mute(self, subscriber, **kwargs):
+        muted = super().mute(subscriber, **kwargs)
+        if muted and self._muted is not None:
+            self._muted.add(subscriber)
+        return muted
+
+    def unmute(self, subscriber, **kwargs):
+        unmuted = super().unmute(subscriber, **kwargs)
+        if unmuted and self._muted is not None:
+            self._muted.discard(subscriber)
+        return unmuted
+
+    def render_profile(self, receiver, senders, **kwargs):
+        """
+        Group receivers that would see a message formatted the same way.
+
+        By default `receiver.at_pre_channel_msg` only depends on the
+        receiver's typeclass and on which senders it may see the dbref of,
+        which in turn depends on the receiver's permissions and, for a
+        puppet, those of its Account - unless the receiver is one of the
+        senders.
+
+        Args:
+            receiver (Account or Object): The one to receive the message.
+            senders (list): The senders of the message.
+
+        Returns:
+            hashable or None: Receivers with the same profile share one
+                formatted message. `None` formats for this receiver alone.
+
+        """
+        if receiver in senders:
+            return None
+        return (type(receiver), access_fingerprint(receiver))
+
+    def msg(self, message, senders=None, bypass_mute=False, **kwargs):
+        """
+        Send message to channel, causing it to be distributed to all non-muted
+        subscribed users of that channel. Same hooks as the default, but the
+        per-receiver formatting (`at_pre_channel_msg`) runs once for each
+        distinct `render_profile` only.
+
+        """
+        senders = make_iter(senders) if senders else []
+        receivers = self.listeners(bypass_mute=bypass_mute)
+
+        send_kwargs = {"senders": senders, "bypass_mute": bypass_mute, **kwargs}
+
+        # pre-send hook
+        message = self.at_pre_msg(message, **send_kwargs)
+        if message in (None, False):
+            return
+
+        # profile -> formatted message
+        rendered = {}
+        for receiver in receivers:
+            # 分组出错是本类的错误，不能被下面对单个收听者的容错吞掉
+            profile = self.render_profile(receiver, **send_kwargs)
+            try:
+                if profile is None:
+                    recv_message = receiver.at_pre_channel_msg(message, self, **send_kwargs)
+                elif profile in rendered:
+                    recv_message = rendered[profile]
+                else:
+                    recv_message = rendered[profile] = receiver.at_pre_channel_msg(
+                        message, self, **send_kwargs
+                    )
+                if recv_message in (None, False):
+                    continue
+
+                receiver.channel_msg(recv_message, self, **send_kwargs)
+
+                receiver.at_post_channel_msg(recv_message, self, **send_kwargs)
+
+            except Exception:
+                logger.log_trace(f"Error sending channel message to {receiver}.")
+
+        # post-send hook
+        self.at_post_msg(message, **send_kwargs)
+
+    def at_post_msg(self, message, **kwargs):
+        """
+        Record the message in the channel history. The line is the same as
+        the default writes to the log file, but the write happens later, in
+        a batch.
+
+        """
+        senders = ",".join(sender.key for sender in kwargs.get("senders", []))
+        senders = f"{senders}: " if senders else ""
+        CHANNEL_HISTORY.record(self, f"{senders}{message}")
+
+    def get_history(self, callback, start_index=0, count=20):
+        """
+        Get the channel history, from memory if it goes back far enough and
+        from the log file otherwise.
+
+        Args:
+            callback (callable): Called with the list of lines, oldest first.
+                With the log file fallback this happens asynchronously.
+            start_index (int, optional): How many of the newest lines to skip.
+            count (int, optional): How many lines to get.
+
+        """
+        lines = CHANNEL_HISTORY.lines(self, start_index, count)
+        if lines is not None:
+            callback(lines)
+            return
+        log_file = self.get_log_filename()
+        if not log_file:
+            callback([])
+            return
+        CHANNEL_HISTORY.flush(log_file)
+        logger.tail_log_file(
+            log_file,
+            start_index,
+            count,
+            callback=lambda lines: callback(
+                [line.split("[-]", 1)[1].strip() if "[-]" in line else line.strip() for line in lines]
+            ),
+        )
+
+    def delete(self):
+        CHANNEL_HISTORY.forget(self)
+        return super().delete()
@@ -7,10 +7,88 @@ is setup to be the "default" character type created by the default
 creation commands.
 """
 
+import itertools
 import random
+from array import array
+
+from evennia.objects.models import ObjectDB
 from evennia.objects.objects import DefaultCharacter
 
-class Character(DefaultCharacter):
+from world.permissions import refresh_permission_cache
+from world.population import POPULATION
+from world.room_graph import ROOM_GRAPH
+
+from .channels import subscriber_offline, subscriber_online
+from .objects import ObjectParent
+
+INNATE_ATTRS = ["先天臂力", "先天悟性", "先天根骨", "先天身法"]
+INNATE_TOTAL = 80
+INNATE_MIN, INNATE_MAX = 10, 30
+
+def _build_innate_splits():
+    """
+    Enumerate every split of INNATE_TOTAL points over the main stats with
+    each stat within INNATE_MIN-INNATE_MAX.
+
+    Returns:
+        tuple: `(splits, by_fixed)` where `splits` is a flat array holding
+            one split per len(INNATE_ATTRS) values and `by_fixed` maps
+            `(stat index, value)` to an array of the split numbers having
+            that value for that stat.
+    """
+    width = len(INNATE_ATTRS)
+    splits = array("b")
+    by_fixed = {}
+    values = range(INNATE_MIN, INNATE_MAX + 1)
+    for split in itertools.product(values, repeat=width - 1):
+        last = INNATE_TOTAL - sum(split)
+        if not INNATE_MIN <= last <= INNATE_MAX:
+            continue
+        number = len(splits) // width
+        for index, value in enumerate(split + (last,)):
+            splits.append(value)
+            by_fixed.setdefault((index, value), array("H")).append(number)
+    return splits, by_fixed
+
+# 所有合法的天赋分配只计算一次，之后每次抽取都是 O(1) 且严格均匀；
+# 首次抽取时才计算，不拖慢启动和重载
+_INNATE_SPLITS = _INNATE_SPLITS_BY_FIXED = None
+
+def roll_innate_attributes(fixed_attr=None, fixed_value=None):
+    """
+    Roll innate attributes with a total of 80 points across 4 main stats,
+    plus the two hidden ones. Every valid split is equally likely. Nothing
+    is stored, so this can be called as often as needed before the result
+    is kept.
+
+    Args:
+        fixed_attr (str, optional): One of the main stats to fix.
+        fixed_value (int, optional): The value (10-30) of `fixed_attr`.
+
+    Returns:
+        dict: The rolled attributes.
+    """
+    global _INNATE_SPLITS, _INNATE_SPLITS_BY_FIXED
+    if _INNATE_SPLITS is None:
+        _INNATE_SPLITS, _INNATE_SPLITS_BY_FIXED = _build_innate_splits()
+    width = len(INNATE_ATTRS)
+    if fixed_attr in INNATE_ATTRS and fixed_value:
+        numbers = _INNATE_SPLITS_BY_FIXED.get((INNATE_ATTRS.index(fixed_attr), fixed_value))
+    else:
+        numbers = None
+    if numbers:
+        number = numbers[random.randrange(len(numbers))]
+    else:  # Random distribution
+        number = random.randrange(len(_INNATE_SPLITS) // width)
+    split = _INNATE_SPLITS[number * width:(number + 1) * width]
+    innate_attributes = dict(zip(INNATE_ATTRS, split))
+
+    # Add hidden attributes
+    innate_attributes["先天福缘"] = random.randint(INNATE_MIN, INNATE_MAX)
+    innate_attributes["先天容貌"] = random.randint(INNATE_MIN, INNATE_MAX)
+    return innate_attributes
+
+class Character(ObjectParent, DefaultCharacter):
     """
     The Character class represents a player-controlled entity in-game.
     It includes methods for setting innate attributes and retrieving stats.
@@ -22,36 +100,31 @@ class Character(DefaultCharacter):
         self.db.chinese_name = self.key
         self.db.innate_attributes = {}
 
+    def at_post_puppet(self, **kwargs):
+        """Refresh caches that depend on who is puppeting us."""
+        super().at_post_puppet(**kwargs)
+        refresh_permission_cache(self)
+        POPULATION.puppeted(self)
+        subscriber_online(self)
+        self.at_display_name_change()
+
+    def at_post_unpuppet(self, account=None, session=None, **kwargs):
+        """Forget state tied to the departing account."""
+        super().at_post_unpuppet(account=account, session=session, **kwargs)
+        refresh_permission_cache(self)
+        POPULATION.unpuppeted(self)
+        if not self.sessions.count():
+            subscriber_offline(self)
+
     def set_innate_attributes(self, fixed_attr=None, fixed_value=None):
         """Set innate attributes with a total of 80 points across 4 main stats."""
-        total_points = 80
-        attrs = ["先天臂力", "先天悟性", "先天根骨", "先天身法"]
         if fixed_attr and fixed_value:
-            if fixed_attr not in attrs or not (10 <= fixed_value <= 30):
+            if fixed_attr not in INNATE_ATTRS or not (INNATE_MIN <= fixed_value <= INNATE_MAX):
                 self.msg("Invalid fixed attribute or value. Using random distribution.")
                 fixed_attr = None
                 fixed_value = None
-            else:
-                self.db.innate_attributes[fixed_attr] = fixed_value
-                remaining_points = total_points - fixed_value
-                remaining_attrs = [attr for attr in attrs if attr != fixed_attr]
-                for attr in remaining_attrs[:-1]:
-                    max_allowed = min(remaining_points - 20, 30)  # Ensure last attr has at least 10
-                    value = random.randint(10, max_allowed)
-                    self.db.innate_attributes[attr] = value
-                    remaining_points -= value
-                self.db.innate_attributes[remaining_attrs[-1]] = remaining_points
-        if not fixed_attr:  # Random distribution
-            for attr in attrs[:-1]:
-                max_allowed = min(total_points - 30, 30)  # Ensure last attr has at least 10
-                value = random.randint(10, max_allowed)
-                self.db.innate_attributes[attr] = value
-                total_points -= value
-            self.db.innate_attributes[attrs[-1]] = total_points
-        
-        # Add hidden attributes
-        self.db.innate_attributes["先天福缘"] = random.randint(10, 30)
-        self.db.innate_attributes["先天容貌"] = random.randint(10, 30)
+        # 一次性写入数据库
+        self.db.innate_attributes = roll_innate_attributes(fixed_attr, fixed_value)
 
     def get_stats(self):
         """Return formatted string of character stats."""
@@ -63,10 +136,46 @@ class Character(DefaultCharacter):
                 f"先天福缘: {attrs.get('先天福缘', 0)}\n"
                 f"先天容貌: {attrs.get('先天容貌', 0)}")
 
-class NPC(DefaultCharacter):
+class NPC(ObjectParent, DefaultCharacter):
     """
     自定义NPC类（需继承自DefaultCharacter）
     """
     def at_object_creation(self):
         """Initialize NPC description."""
-        self.db.desc = "一位沉默的NPC"
\ No newline at end of file
+        self.db.desc = "一位沉默的NPC"
+
+    def route_to(self, destination):
+        """
+        Find the shortest way to a room from the room graph, without
+        touching the database.
+
+        Args:
+            destination (Room): Where to go.
+
+        Returns:
+            list or None: Ids of the exits to take in order, or None if the
+                room cannot be reached.
+        """
+        if not self.location:
+            return None
+        return ROOM_GRAPH.path(self.location.id, destination.id)
+
+    def step_towards(self, destination):
+        """
+        Take the first exit on the way to a room, if its traverse lock
+        lets us.
+
+        Args:
+            destination (Room): Where to go.
+
+        Returns:
+            bool: If we moved.
+        """
+        route = self.route_to(destination)
+        if not route:
+            return False
+        exit = ObjectDB.objects.get_id(route[0])
+        if not exit or not exit.access(self, "traverse"):
+            return False
+        exit.at_traverse(self, exit.destination)
+        return self.location == exit.destination
\ No newline at end of file
@@ -5,12 +5,67 @@ Exits are connectors between Rooms. An exit always has a destination property
 set and has a single command defined on itself with the same name as its key,
 for allowing Characters to traverse the exit to its destination.
 
+Traversal fast path:
+
+- By default every exit carries its own cmdset with its one command, and
+  the command handler merges all of them on every input. Exits of this
+  class instead hand their commands to their room (see
+  `Room.update_exit_cmdset`), which keeps them in one cmdset, rebuilt only
+  when its exits change.
+- A traverse lock made only of permission checks gives the same answer
+  for everyone with the same permissions. Such results are memoized per
+  exit and permission fingerprint, and forgotten whenever the exit's locks
+  change. Permission changes give a new fingerprint.
+
 """
 
+import re
+
+from evennia.commands.cmdset import CmdSet
+from evennia.locks.lockhandler import LockHandler
 from evennia.objects.objects import DefaultExit
+from evennia.utils.utils import lazy_property
+
+from world.permissions import access_fingerprint
 
 from .objects import ObjectParent
 
+# 结果只取决于权限的锁函数
+_PERMISSION_LOCKFUNCS = {
+    "all", "true", "false", "none", "perm", "perm_above", "pperm", "pperm_above", "superuser",
+}
+_LOCKFUNC = re.compile(r"(\w+)\s*\(")
+# 这些 call 锁对所有人都一样，出口命令可以放进房间共用的命令集
+_OPEN_CALL_LOCKS = {"", "call:true()", "call:all()"}
+
+
+class ExitLockHandler(LockHandler):
+    """
+    A LockHandler that makes its exit forget the memoized traverse checks
+    whenever its locks change.
+
+    """
+
+    def add(self, *args, **kwargs):
+        result = super().add(*args, **kwargs)
+        self.obj._traverse_results = None
+        return result
+
+    def remove(self, *args, **kwargs):
+        result = super().remove(*args, **kwargs)
+        self.obj._traverse_results = None
+        return result
+
+    delete = remove
+
+    def clear(self, *args, **kwargs):
+        super().clear(*args, **kwargs)
+        self.obj._traverse_results = None
+
+    def reset(self, *args, **kwargs):
+        super().reset(*args, **kwargs)
+        self.obj._traverse_results = None
+
 
 class Exit(ObjectParent, DefaultExit):
     """
@@ -23,4 +78,75 @@ class Exit(ObjectParent, DefaultExit):
 
     """
 
-    pass
+    # 权限指纹 -> traverse 检查结果；traverse 锁不只看权限时为 False
+    _traverse_results = None
+
+    @lazy_property
+    def locks(self):
+        return ExitLockHandler(self)
+
+    def shares_cmdset(self):
+        """
+        Check if the exit command can live in the room's shared exit cmdset,
+        which is the case unless a `call` lock hides it from some callers.
+
+        """
+        return self.locks.get("call") in _OPEN_CALL_LOCKS
+
+    def create_exit_command(self):
+        """
+        Create the command that traverses this exit.
+
+        """
+        return self.exit_command(
+            key=self.db_key.strip().lower(),
+            aliases=self.aliases.all(),
+            locks=str(self.locks),
+            auto_help=False,
+            destination=self.db_destination,
+            arg_regex=r"^$",
+            is_exit=True,
+            obj=self,
+        )
+
+    def create_exit_cmdset(self, exidbobj):
+        exit_cmdset = CmdSet(None)
+        exit_cmdset.key = "ExitCmdSet"
+        exit_cmdset.priority = self.priority
+        exit_cmdset.duplicates = True
+        exit_cmdset.add(exidbobj.create_exit_command())
+        return exit_cmdset
+
+    def at_cmdset_get(self, **kwargs):
+        location = self.location
+        if location and hasattr(location, "update_exit_cmdset") and self.shares_cmdset():
+            # 命令由房间的共用命令集提供，去掉之前单独建立的
+            if self.cmdset.has_cmdset("ExitCmdSet", must_be_default=True):
+                self.cmdset.remove_default()
+            return
+        super().at_cmdset_get(**kwargs)
+
+    def access(
+        self, accessing_obj, access_type="read", default=False, no_superuser_bypass=False, **kwargs
+    ):
+        if access_type != "traverse" or no_superuser_bypass or not hasattr(
+            accessing_obj, "permissions"
+        ):
+            return super().access(
+                accessing_obj, access_type, default, no_superuser_bypass, **kwargs
+            )
+        results = self._traverse_results
+        if results is None:
+            lockfuncs = set(_LOCKFUNC.findall(self.locks.get("traverse")))
+            results = self._traverse_results = {} if lockfuncs <= _PERMISSION_LOCKFUNCS else False
+        if results is False:
+            return super().access(
+                accessing_obj, access_type, default, no_superuser_bypass, **kwargs
+            )
+        key = (default, access_fingerprint(accessing_obj))
+        result = results.get(key)
+        if result is None:
+            result = results[key] = super().access(accessing_obj, access_type, default, **kwargs)
+        else:
+            self.at_access(result, accessing_obj, access_type, **kwargs)
+        return result
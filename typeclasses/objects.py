@@ -9,6 +9,11 @@ with a location in the game world (like Characters, Rooms, Exits).
 """
 
 from evennia.objects.objects import DefaultObject
+from evennia.utils.utils import dbref, lazy_property
+
+from world.cmdset_cache import MERGE_CACHE
+from world.object_index import OBJECT_INDEX, IndexedAliasHandler, NameAttributeHandler
+from world.permissions import CachedPermissionHandler, is_developer
 
 
 class ObjectParent:
@@ -22,20 +27,120 @@ class ObjectParent:
 
     """
 
+    @lazy_property
+    def permissions(self):
+        return CachedPermissionHandler(self)
+
+    @lazy_property
+    def aliases(self):
+        return IndexedAliasHandler(self)
+
+    @lazy_property
+    def attributes(self):
+        return NameAttributeHandler(self)
+
+    def set_chinese_name(self, chinese_name):
+        """
+        Set the Chinese display name. The same as setting `db.chinese_name`;
+        the Attribute handler refreshes the cached renderings either way.
+        """
+        self.db.chinese_name = chinese_name
+
+    def at_rename(self, oldname, newname):
+        super().at_rename(oldname, newname)
+        self.at_display_name_change()
+
+    def at_display_name_change(self):
+        """
+        Called whenever the key or Chinese name of this object changes.
+        Tells our location to re-render our line in its appearance, and
+        reindexes our names for searching.
+        """
+        location = self.location
+        if location and hasattr(location, "refresh_appearance"):
+            location.refresh_appearance(self)
+        OBJECT_INDEX.update(self)
+
+    def at_object_post_creation(self):
+        super().at_object_post_creation()
+        OBJECT_INDEX.update(self)
+
+    def at_post_move(self, source_location, move_type="move", **kwargs):
+        super().at_post_move(source_location, move_type=move_type, **kwargs)
+        OBJECT_INDEX.move(self)
+
+    def at_object_delete(self):
+        if not super().at_object_delete():
+            return False
+        OBJECT_INDEX.remove(self.id)
+        return True
+
+    def at_cmdset_get(self, **kwargs):
+        super().at_cmdset_get(**kwargs)
+        # 登记命令集，合并缓存才能认出它们（见 world/cmdset_cache.py）
+        MERGE_CACHE.register(self.cmdset.cmdset_stack)
+
+    def get_search_result(
+        self,
+        searchdata,
+        attribute_name=None,
+        typeclass=None,
+        candidates=None,
+        exact=False,
+        use_dbref=None,
+        tags=None,
+        **kwargs,
+    ):
+        """
+        Search names among the candidates in the object index (see
+        world/object_index.py) instead of the database. Global, dbref,
+        Attribute, typeclass and tag searches still go to the database, as
+        do searches the index cannot answer (during a bulk spawn).
+        """
+        if (
+            candidates is not None
+            and isinstance(searchdata, str)
+            and not (attribute_name or typeclass or tags)
+            # #123 这样的 dbref 由 Evennia 按编号查找，索引里没有
+            and not (use_dbref and dbref(searchdata))
+        ):
+            matches = OBJECT_INDEX.search(searchdata, candidates, exact=exact)
+            if matches is not None:
+                return matches
+        return super().get_search_result(
+            searchdata,
+            attribute_name=attribute_name,
+            typeclass=typeclass,
+            candidates=candidates,
+            exact=exact,
+            use_dbref=use_dbref,
+            tags=tags,
+            **kwargs,
+        )
+
 
 class Object(ObjectParent, DefaultObject):
+    _display_name = None
+
     def get_display_name(self, looker, **kwargs):
         """
         Customize how the object’s name appears when looked at.
         Only Developers can see the database ID.
         """
-        chinese_name = self.db.chinese_name or self.key
-        base_name = f"{chinese_name}（{self.key}）"
-        
+        # 基础名字缓存在对象上，名字变化时由 at_display_name_change 清除
+        base_name = self._display_name
+        if base_name is None:
+            chinese_name = self.db.chinese_name or self.key
+            base_name = self._display_name = f"{chinese_name}（{self.key}）"
+
         # 检查调用者是否有 Developer 权限
-        if looker and looker.locks.check_lockstring(looker, "perm(Developer)"):
-            return f"{base_name}(#{self.dbref})"
+        if looker and is_developer(looker):
+            return f"{base_name}(#{self.id})"
         return base_name
+
+    def at_display_name_change(self):
+        self._display_name = None
+        super().at_display_name_change()
     """
     This is the root Object typeclass, representing all entities that
     have an actual presence in-game. DefaultObjects generally have a
@@ -1,8 +1,116 @@
+from evennia.commands.cmdset import CmdSet
+from evennia.objects.models import ObjectDB
 from evennia.objects.objects import DefaultRoom
+from .exits import Exit
 from .objects import ObjectParent
 
+# 房间内物体的分组顺序：玩家、NPC、物品
+PLAYER, NPC, ITEM = 0, 1, 2
+
+# 显示行格式的版本，修改 render_occupant 的输出时手动递增，重载时旧的缓存行随之作废
+OCCUPANT_LINES_VERSION = 1
+
+# 重载前缓存的显示行：room id -> {obj id: (group, line)}，房间首次显示时取回
+_HANDED_OVER = {}
+
+def dump_occupant_lines():
+    """
+    Get the cached occupant lines of all loaded rooms, to hand over on reload.
+
+    Returns:
+        dict: `{room id: {obj id: (group, line)}}`.
+    """
+    cached = {
+        room.id: room.ndb.occupant_lines
+        for room in ObjectDB.get_all_cached_instances()
+        if isinstance(room, Room) and room.ndb.occupant_lines
+    }
+    return {**_HANDED_OVER, **cached}
+
+def load_occupant_lines(lines):
+    """Keep the occupant lines handed over on reload until each room is shown."""
+    _HANDED_OVER.update(lines)
+
 class Room(ObjectParent, DefaultRoom):
-    def return_appearance(self, looker):
+    # 共用出口命令集及其对应的出口签名
+    _exit_cmdset = None
+    _exit_signature = None
+
+    def update_exit_cmdset(self):
+        """
+        Keep the commands of all shareable exits in this room in one cmdset,
+        rebuilt only when an exit is added, removed, renamed, re-aliased,
+        re-locked or re-targeted.
+        """
+        exits = [obj for obj in self.contents if isinstance(obj, Exit) and obj.shares_cmdset()]
+        signature = tuple(
+            (exit.id, exit.db_key, tuple(exit.aliases.all()), exit.db_lock_storage,
+             exit.db_destination_id)
+            for exit in exits
+        )
+        if signature == self._exit_signature:
+            return
+        if self._exit_cmdset:
+            self.cmdset.remove(self._exit_cmdset.key)
+        self._exit_cmdset = self._exit_signature = None
+        if exits:
+            exit_cmdset = CmdSet(None)
+            # 与单个出口的命令集同名，no_exits 才能把它一并滤掉
+            exit_cmdset.key = "ExitCmdSet"
+            exit_cmdset.priority = Exit.priority
+            exit_cmdset.duplicates = True
+            for exit in exits:
+                exit_cmdset.add(exit.create_exit_command())
+            self.cmdset.add(exit_cmdset, persistent=False)
+            self._exit_cmdset = exit_cmdset
+        self._exit_signature = signature
+
+    def at_cmdset_get(self, **kwargs):
+        # 先更新共用出口命令集，登记的才是这次要合并的
+        self.update_exit_cmdset()
+        super().at_cmdset_get(**kwargs)
+
+    def render_occupant(self, obj):
+        """
+        Render the appearance line of a single occupant. Bump
+        `OCCUPANT_LINES_VERSION` when changing what this returns.
+
+        Returns:
+            tuple: `(group, line)` where group is one of PLAYER, NPC or ITEM.
+        """
+        chinese_name = obj.db.chinese_name or obj.aliases.get("中文名") or "未知"
+        english_id = obj.key
+        if obj.has_account:
+            return PLAYER, f"Player {chinese_name}({english_id})"
+        if obj.typeclass_path.endswith("NPC"):
+            return NPC, f"Npc {chinese_name}({english_id})"
+        return ITEM, f"{chinese_name}（{english_id}）"
+
+    def refresh_appearance(self, obj=None):
+        """
+        Drop cached appearance lines so they are re-rendered on the next look.
+
+        Args:
+            obj (Object, optional): Only re-render the line of this occupant.
+                If not given, the whole cache is dropped.
+        """
+        lines = self.ndb.occupant_lines or _HANDED_OVER.get(self.id)
+        if not lines:
+            return
+        if obj is None:
+            lines.clear()
+        else:
+            lines.pop(obj.id, None)
+
+    def at_object_receive(self, moved_obj, source_location, move_type="move", **kwargs):
+        super().at_object_receive(moved_obj, source_location, move_type=move_type, **kwargs)
+        self.refresh_appearance(moved_obj)
+
+    def at_object_leave(self, moved_obj, target_location, move_type="move", **kwargs):
+        super().at_object_leave(moved_obj, target_location, move_type=move_type, **kwargs)
+        self.refresh_appearance(moved_obj)
+
+    def return_appearance(self, looker, **kwargs):
         # 只获取房间的基本描述，不包含默认的 Characters 等内容
         desc = self.get_display_name(looker) + "\n"
         if self.db.desc:
@@ -13,30 +121,30 @@ class Room(ObjectParent, DefaultRoom):
         if not contents:
             return desc
 
-        # 分离玩家（排除自己）、NPC和物品
-        players = [obj for obj in contents if obj.has_account and obj != looker]  # 排除 looker
-        npcs = [obj for obj in contents if obj.typeclass_path.endswith("NPC") and not obj.has_account]
-        items = [obj for obj in contents if not obj.has_account and not obj.typeclass_path.endswith("NPC")]
-
-        # 构建新的显示内容
-        visible = []
-        # 处理其他玩家
-        for player in players:
-            chinese_name = player.db.chinese_name or player.aliases.get("中文名") or "未知"
-            english_id = player.key
-            visible.append(f"Player {chinese_name}({english_id})")
-        # 处理NPC
-        for npc in npcs:
-            chinese_name = npc.db.chinese_name or npc.aliases.get("中文名") or "未知"
-            english_id = npc.key
-            visible.append(f"Npc {chinese_name}({english_id})")
-        # 处理物品
-        for item in items:
-            chinese_name = item.db.chinese_name or item.aliases.get("中文名") or "未知"
-            english_id = item.key
-            visible.append(f"{chinese_name}（{english_id}）")
+        # 每个物体的显示行缓存在 ndb 中，只在物体变化时重新生成
+        lines = self.ndb.occupant_lines
+        if lines is None:
+            lines = self.ndb.occupant_lines = _HANDED_OVER.pop(self.id, None) or {}
+
+        # 一次遍历完成分组：玩家（排除自己）、NPC和物品
+        groups = ([], [], [])
+        for obj in contents:
+            entry = lines.get(obj.id)
+            if entry is None:
+                entry = lines[obj.id] = self.render_occupant(obj)
+            group, line = entry
+            if group == PLAYER and obj == looker:
+                continue
+            groups[group].append(line)
+
+        # 直接修改 location 不会触发离开钩子，清理已不在房间内的缓存行
+        if len(lines) > len(contents):
+            present = {obj.id for obj in contents}
+            for obj_id in [obj_id for obj_id in lines if obj_id not in present]:
+                del lines[obj_id]
 
         # 将新内容插入描述
+        visible = groups[PLAYER] + groups[NPC] + groups[ITEM]
         if visible:
             desc += "\n这里有：\n  " + "\n  ".join(visible)
         return desc
@@ -13,6 +13,9 @@ just overloads its hooks to have it perform its function.
 """
 
 from evennia.scripts.scripts import DefaultScript
+from evennia.utils.dbserialize import dbserialize, dbunserialize
+
+from world.ticks import RESOLUTION, TICKER
 
 
 class Script(DefaultScript):
@@ -98,6 +101,128 @@ class Script(DefaultScript):
       at_server_shutdown() - called at a full server shutdown.
       at_server_start()
 
+    * Shared ticks
+     Set `tick_interval` (seconds) instead of `interval` to have `at_tick()`
+     called by the shared `TickScheduler` rather than by a timer of this
+     script's own. Such scripts subscribe on creation and on every server
+     start (overrides of `at_server_start` must call super) and unsubscribe
+     when deleted.
+
+    * Snapshot state
+     `self.state` is a plain in-memory dict for state that changes every
+     tick. Updating it writes nothing to the database. Instead the whole
+     dict is saved as one serialized blob (the `snapshot` Attribute) every
+     `snapshot_interval` seconds if it changed, and always on
+     `at_server_reload` and `at_server_shutdown` (overrides must call
+     super). At most the last `snapshot_interval` seconds of changes are
+     lost if the server crashes.
+
+    """
+
+    tick_interval = 0
+    snapshot_interval = 30
+
+    def at_first_save(self, **kwargs):
+        super().at_first_save(**kwargs)
+        self.start_ticking()
+
+    def at_server_start(self):
+        super().at_server_start()
+        self.start_ticking()
+
+    def at_server_reload(self):
+        super().at_server_reload()
+        self.save_snapshot()
+
+    def at_server_shutdown(self):
+        super().at_server_shutdown()
+        self.save_snapshot()
+
+    def at_idmapper_flush(self):
+        flush = super().at_idmapper_flush()
+        if flush and self.ndb._snapshot_state is not None:
+            self.save_snapshot()
+            TICKER.unsubscribe(("snapshot", self.id))
+        return flush
+
+    def delete(self):
+        tick_key = self._tick_key
+        snapshot_key = ("snapshot", self.id)
+        deleted = super().delete()
+        if deleted:
+            TICKER.unsubscribe(tick_key)
+            TICKER.unsubscribe(snapshot_key)
+        return deleted
+
+    @property
+    def _tick_key(self):
+        return ("script", self.id)
+
+    def start_ticking(self):
+        """
+        Subscribe `at_tick` to the tick scheduler, if `tick_interval` is set.
+
+        """
+        if self.tick_interval:
+            TICKER.subscribe(self.at_tick, self.tick_interval, key=self._tick_key)
+
+    def stop_ticking(self):
+        """
+        Unsubscribe from the tick scheduler.
+
+        """
+        TICKER.unsubscribe(self._tick_key)
+
+    def at_tick(self):
+        """
+        Called every `tick_interval` seconds by the tick scheduler.
+
+        """
+        pass
+
+    @property
+    def state(self):
+        """
+        The in-memory snapshot state, loaded from the last snapshot on
+        first use.
+
+        """
+        state = self.ndb._snapshot_state
+        if state is None:
+            blob = self.attributes.get("snapshot")
+            # 不传 db_obj，取回的是普通 dict，与新建的状态一样修改时不写库
+            state = dbunserialize(blob) if blob else {}
+            self.ndb._snapshot_state = state
+            self.ndb._snapshot = blob
+            TICKER.subscribe(self.save_snapshot, self.snapshot_interval, key=("snapshot", self.id))
+        return state
+
+    def save_snapshot(self):
+        """
+        Save `state` as one blob, unless nothing changed since the last save.
+
+        """
+        state = self.ndb._snapshot_state
+        if state is None or not self.pk:
+            return
+        blob = dbserialize(state)
+        if blob != self.ndb._snapshot:
+            self.attributes.add("snapshot", blob)
+            self.ndb._snapshot = blob
+
+
+class TickScheduler(Script):
     """
+    The one timer that drives all shared ticks (see `world.ticks`).
+    Registered in `settings.GLOBAL_SCRIPTS`.
+
+    """
+
+    def at_script_creation(self):
+        self.key = "tick_scheduler"
+        self.desc = "Drives all shared ticks"
+        self.interval = RESOLUTION
+        self.persistent = True
 
-    pass
+    def at_repeat(self, **kwargs):
+        TICKER.tick()
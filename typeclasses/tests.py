@@ -0,0 +1,237 @@
+"""
+Tests for the typeclasses.
+
+Run with
+
+    evennia test --settings settings.py typeclasses
+
+"""
+
+import itertools
+import math
+import random
+import time
+from collections import Counter
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+
+from evennia.utils import create
+from evennia.utils.test_resources import EvenniaTest
+
+from world.object_index import OBJECT_INDEX
+
+from .characters import INNATE_ATTRS, INNATE_MAX, INNATE_MIN, INNATE_TOTAL, roll_innate_attributes
+
+# 基准测试中每种做法调用的次数
+BENCHMARK_CALLS = 20000
+# 均匀性检验中每种分配平均抽到的次数
+SAMPLES_PER_SPLIT = 50
+# 频道广播基准测试的收听者数及其权限组合
+BROADCAST_LISTENERS = 10000
+LISTENER_PERMISSIONS = [("Player",), ("Player", "Helper"), ("Builder",)]
+
+
+def _uncached_display_name(obj, looker):
+    # 缓存之前的做法：每次读取属性、解析锁字符串
+    chinese_name = obj.db.chinese_name or obj.key
+    base_name = f"{chinese_name}（{obj.key}）"
+    if looker and looker.locks.check_lockstring(looker, "perm(Developer)"):
+        return f"{base_name}(#{obj.id})"
+    return base_name
+
+
+def _calls_per_second(func, *args):
+    start = time.perf_counter()
+    for _ in range(BENCHMARK_CALLS):
+        func(*args)
+    return BENCHMARK_CALLS / (time.perf_counter() - start)
+
+
+class TestDisplayName(EvenniaTest):
+    def test_follows_name_changes(self):
+        # obj2 不是 Developer，看不到编号
+        self.obj1.set_chinese_name("长剑")
+        self.assertEqual(self.obj1.get_display_name(self.obj2), "长剑（Obj）")
+        self.obj1.key = "Sword"
+        self.assertEqual(self.obj1.get_display_name(self.obj2), "长剑（Sword）")
+        self.obj1.set_chinese_name("短剑")
+        self.assertEqual(self.obj1.get_display_name(self.obj2), "短剑（Sword）")
+
+    def test_follows_attribute_writes(self):
+        # 不经 set_chinese_name，直接写属性也要刷新显示名和索引
+        self.assertEqual(self.obj1.get_display_name(self.obj2), "Obj（Obj）")
+        self.obj1.db.chinese_name = "长剑"
+        self.assertEqual(self.obj1.get_display_name(self.obj2), "长剑（Obj）")
+        self.assertEqual(self.char1.search("长剑"), self.obj1)
+        del self.obj1.db.chinese_name
+        self.assertEqual(self.obj1.get_display_name(self.obj2), "Obj（Obj）")
+
+    def test_follows_permission_changes(self):
+        self.assertEqual(self.obj1.get_display_name(self.obj2), "Obj（Obj）")
+        self.obj2.permissions.add("Developer")
+        self.assertEqual(self.obj1.get_display_name(self.obj2), f"Obj（Obj）(#{self.obj1.id})")
+        self.obj2.permissions.remove("Developer")
+        self.assertEqual(self.obj1.get_display_name(self.obj2), "Obj（Obj）")
+
+    def test_follows_quelling(self):
+        # char1 本身不是 Developer，只靠账号的权限
+        self.char1.permissions.remove("Developer")
+        self.assertEqual(self.obj1.get_display_name(self.char1), f"Obj（Obj）(#{self.obj1.id})")
+        self.char1.account.attributes.add("_quell", True)
+        self.assertEqual(self.obj1.get_display_name(self.char1), "Obj（Obj）")
+        self.char1.account.attributes.remove("_quell")
+        self.assertEqual(self.obj1.get_display_name(self.char1), f"Obj（Obj）(#{self.obj1.id})")
+
+    def test_benchmark(self):
+        self.obj1.set_chinese_name("长剑")
+        self.assertEqual(
+            self.obj1.get_display_name(self.char1), _uncached_display_name(self.obj1, self.char1)
+        )
+        before = _calls_per_second(_uncached_display_name, self.obj1, self.char1)
+        after = _calls_per_second(self.obj1.get_display_name, self.char1)
+        print(f"\nget_display_name: {before:,.0f} calls/s uncached, {after:,.0f} calls/s cached")
+        self.assertGreater(after, before)
+
+
+class TestObjectSearch(EvenniaTest):
+    def test_name_search_uses_index(self):
+        self.obj1.set_chinese_name("长剑")
+        self.assertEqual(self.char1.search("剑"), self.obj1)
+
+    def test_search_while_index_suspended(self):
+        # 批量生成的钩子里索引暂停，搜索改走数据库
+        with OBJECT_INDEX.suspended():
+            self.assertEqual(self.char1.search("Obj"), self.obj1)
+
+    def test_dbref_search(self):
+        # char1 是 Developer，可以按编号查找
+        self.assertEqual(self.char1.search(self.obj1.dbref), self.obj1)
+
+
+def _valid_splits(fixed_index=None, fixed_value=None):
+    values = range(INNATE_MIN, INNATE_MAX + 1)
+    return {
+        split
+        for split in itertools.product(values, repeat=len(INNATE_ATTRS))
+        if sum(split) == INNATE_TOTAL
+        and (fixed_index is None or split[fixed_index] == fixed_value)
+    }
+
+
+class TestInnateRoller(TestCase):
+    def setUp(self):
+        self.random_state = random.getstate()
+        random.seed(20261018)
+
+    def tearDown(self):
+        random.setstate(self.random_state)
+
+    def roll(self, count, fixed_attr=None, fixed_value=None):
+        counts = Counter()
+        for _ in range(count):
+            attributes = roll_innate_attributes(fixed_attr, fixed_value)
+            counts[tuple(attributes[attr] for attr in INNATE_ATTRS)] += 1
+        return counts
+
+    def assertUniform(self, counts, splits):
+        """Chi-square test of `counts` against a uniform draw over `splits`."""
+        self.assertLessEqual(set(counts), splits)
+        samples = sum(counts.values())
+        expected = samples / len(splits)
+        chi2 = sum((counts.get(split, 0) - expected) ** 2 / expected for split in splits)
+        # 自由度较大时卡方分布近似正态，取均值加五个标准差为界
+        df = len(splits) - 1
+        self.assertLess(chi2, df + 5 * math.sqrt(2 * df))
+
+    def test_uniform(self):
+        splits = _valid_splits()
+        self.assertUniform(self.roll(SAMPLES_PER_SPLIT * len(splits)), splits)
+
+    def test_uniform_with_fixed_stat(self):
+        splits = _valid_splits(2, 25)
+        counts = self.roll(SAMPLES_PER_SPLIT * len(splits), INNATE_ATTRS[2], 25)
+        self.assertUniform(counts, splits)
+
+    def test_hidden_attributes(self):
+        attributes = roll_innate_attributes()
+        for attr in ("先天福缘", "先天容貌"):
+            self.assertTrue(INNATE_MIN <= attributes[attr] <= INNATE_MAX)
+
+
+class _Listener:
+    """A channel listener that counts how often it formats and receives."""
+
+    is_superuser = False
+    account = None
+
+    def __init__(self, permissions):
+        self.permissions = SimpleNamespace(all=lambda: list(permissions))
+        self.formatted = self.received = 0
+
+    def at_pre_channel_msg(self, message, channel, senders=None, **kwargs):
+        self.formatted += 1
+        return f"[{channel.key}] {message}"
+
+    def channel_msg(self, message, channel, **kwargs):
+        self.received += 1
+
+    def at_post_channel_msg(self, message, channel, **kwargs):
+        pass
+
+
+def _distribute_per_receiver(channel, receivers, message):
+    # 与 DefaultChannel.msg 相同：每个收听者单独格式化
+    for receiver in receivers:
+        recv_message = receiver.at_pre_channel_msg(message, channel)
+        receiver.channel_msg(recv_message, channel)
+        receiver.at_post_channel_msg(recv_message, channel)
+
+
+class TestChannelDelivery(EvenniaTest):
+    def setUp(self):
+        super().setUp()
+        self.channel = create.create_channel("江湖频道", typeclass="typeclasses.channels.Channel")
+
+    def tearDown(self):
+        self.channel.delete()
+        super().tearDown()
+
+    def test_puppet_profile_follows_account(self):
+        # 两个角色本身权限相同，只有账号权限不同
+        self.char1.permissions.remove("Developer")
+        self.assertNotEqual(
+            self.channel.render_profile(self.char1, []),
+            self.channel.render_profile(self.char2, []),
+        )
+        self.char2.account.permissions.add("Developer")
+        self.assertEqual(
+            self.channel.render_profile(self.char1, []),
+            self.channel.render_profile(self.char2, []),
+        )
+
+    def test_benchmark_broadcast(self):
+        listeners = [
+            _Listener(LISTENER_PERMISSIONS[number % len(LISTENER_PERMISSIONS)])
+            for number in range(BROADCAST_LISTENERS)
+        ]
+        start = time.perf_counter()
+        _distribute_per_receiver(self.channel, listeners, "hello")
+        before = time.perf_counter() - start
+
+        for listener in listeners:
+            listener.formatted = listener.received = 0
+        with patch.object(type(self.channel), "listeners", return_value=set(listeners)):
+            start = time.perf_counter()
+            self.channel.msg("hello")
+            after = time.perf_counter() - start
+
+        self.assertTrue(all(listener.received == 1 for listener in listeners))
+        # 每种权限组合只格式化一次
+        self.assertEqual(
+            sum(listener.formatted for listener in listeners), len(LISTENER_PERMISSIONS)
+        )
+        print(
+            f"\n{BROADCAST_LISTENERS} listeners: {before * 1000:.1f}ms formatting per "
+            f"receiver, {after * 1000:.1f}ms formatting per profile"
+        )
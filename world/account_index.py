@@ -0,0 +1,91 @@
+"""
+Account name index
+
+An in-memory map of normalized (stripped, lower-case) account names to
+account ids. It answers "does this account exist?" with a dict lookup, so
+probing names at the login prompt never queries the database. The account
+itself is only fetched on a hit, by id through the idmapper cache.
+
+The index is loaded at server start, or handed over from the previous
+process on a reload (see `world.reload_state`), and kept in sync by the
+Account typeclass on creation, rename and deletion.
+
+"""
+
+from evennia.accounts.models import AccountDB
+
+
+def normalize_name(name):
+    """Account names are matched case-insensitively."""
+    return name.strip().lower()
+
+
+class AccountNameIndex:
+    """
+    Map of normalized account names to account ids.
+
+    """
+
+    def __init__(self):
+        self.ids = None
+
+    def load(self):
+        """
+        (Re)build the index from the database.
+
+        """
+        self.ids = {
+            normalize_name(key): account_id
+            for account_id, key in AccountDB.objects.values_list("id", "db_key")
+        }
+
+    def dump_state(self):
+        """Get the index to hand over on reload."""
+        return self.ids
+
+    def load_state(self, ids):
+        """Take over the index handed over on reload."""
+        self.ids = ids
+
+    def add(self, account):
+        if self.ids is not None:
+            self.ids[normalize_name(account.key)] = account.id
+
+    def rename(self, account, oldname):
+        if self.ids is not None:
+            self.ids.pop(normalize_name(oldname), None)
+            self.ids[normalize_name(account.key)] = account.id
+
+    def remove(self, name):
+        if self.ids is not None:
+            self.ids.pop(normalize_name(name), None)
+
+    def exists(self, name):
+        """
+        Check if an account with this name exists, without touching the database.
+
+        """
+        if self.ids is None:
+            self.load()
+        return normalize_name(name) in self.ids
+
+    def get(self, name):
+        """
+        Get the account with this name.
+
+        Args:
+            name (str): The account name, in any case.
+
+        Returns:
+            Account or None: The account, only looked up if the name is known.
+
+        """
+        if self.ids is None:
+            self.load()
+        account_id = self.ids.get(normalize_name(name))
+        if account_id is None:
+            return None
+        return AccountDB.objects.get_id(account_id)
+
+
+ACCOUNT_NAMES = AccountNameIndex()
@@ -0,0 +1,131 @@
+"""
+Channel history
+
+Keeps the last `HISTORY_SIZE` lines of every channel in an in-memory ring
+buffer, so "channel/history" is answered from memory instead of by tailing
+the channel's log file.
+
+The log files are still the persistent history, but they are written
+behind: a sent message is only queued, and a LoopingCall appends all the
+queued lines of each channel every `FLUSH_INTERVAL` seconds as one batch
+through Evennia's threaded `log_file`. `at_server_stop` flushes whatever
+is still queued, so a reload or shutdown loses nothing.
+
+The rings are handed over to the new process on a reload (see
+`world.reload_state`), but start out empty after a cold start. Until a
+ring holds enough lines to answer a query, the query falls back to the
+log file, flushing that channel's queue first.
+
+"""
+
+import time
+from collections import deque
+
+from twisted.internet.task import LoopingCall
+
+from evennia.utils import logger
+
+FLUSH_INTERVAL = 0.3
+HISTORY_SIZE = 200
+
+
+class ChannelHistory:
+    """
+    Per-channel ring buffers plus a write-behind queue per log file.
+
+    """
+
+    def __init__(self, size=HISTORY_SIZE, interval=FLUSH_INTERVAL):
+        self.size = size
+        self.interval = interval
+        # channel id -> deque of history lines
+        self.rings = {}
+        # log file name -> [(time, line), ...] not yet written
+        self.pending = {}
+        self._task = None
+
+    def record(self, channel, line):
+        """
+        Remember a line of channel history and queue it for the log file.
+
+        Args:
+            channel (Channel): The channel the line was sent to.
+            line (str): The line as it should appear in the history.
+
+        """
+        ring = self.rings.get(channel.id)
+        if ring is None:
+            ring = self.rings[channel.id] = deque(maxlen=self.size)
+        ring.append(line)
+        log_file = channel.get_log_filename()
+        if log_file:
+            self.pending.setdefault(log_file, []).append((time.time(), line))
+            if not self._task:
+                self._task = LoopingCall(self.flush)
+                self._task.start(self.interval, now=False)
+
+    def lines(self, channel, start_index=0, count=20):
+        """
+        Get history lines from memory.
+
+        Args:
+            channel (Channel): The channel to get the history of.
+            start_index (int, optional): How many of the newest lines to skip.
+            count (int, optional): How many lines to return.
+
+        Returns:
+            list or None: The lines, oldest first, or `None` if the ring
+                does not hold that far back.
+
+        """
+        ring = self.rings.get(channel.id)
+        if ring is None or len(ring) < start_index + count:
+            return None
+        end = len(ring) - start_index
+        return list(ring)[end - count : end]
+
+    def forget(self, channel):
+        """
+        Drop the ring of a deleted channel.
+
+        """
+        self.rings.pop(channel.id, None)
+
+    def dump_state(self):
+        """Get the rings to hand over on reload."""
+        return {channel_id: list(ring) for channel_id, ring in self.rings.items()}
+
+    def load_state(self, rings):
+        """Take over the rings handed over on reload."""
+        for channel_id, lines in rings.items():
+            self.rings[channel_id] = deque(lines, maxlen=self.size)
+
+    def flush(self, log_file=None):
+        """
+        Append the queued lines to their log files, in a background thread.
+
+        Args:
+            log_file (str, optional): Only flush the queue of this file.
+
+        """
+        if log_file is not None:
+            batches = [(log_file, self.pending.pop(log_file, None))]
+        else:
+            batches, self.pending = list(self.pending.items()), {}
+        for filename, batch in batches:
+            if not batch:
+                continue
+            # log_file 只给第一行加时间戳，其余行按同样格式自行加上
+            (_, first), rest = batch[0], batch[1:]
+            logger.log_file(
+                "\n".join(
+                    [first] + [f"{logger.timeformat(when)} [-] {line}" for when, line in rest]
+                ),
+                filename,
+            )
+        if not self.pending and self._task:
+            self._task.stop()
+            self._task = None
+
+
+CHANNEL_HISTORY = ChannelHistory()
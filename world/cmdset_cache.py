@@ -0,0 +1,209 @@
+"""
+Merged cmdset cache
+
+Before every command, Evennia gathers the cmdsets of the session, account,
+character, the room, the things in it and the exits, and merges them by
+priority and merge type. It only reuses a merge when the very same cmdset
+instances come back, and every player has their own instances, so two
+players standing in the same room with the same cmdsets still merge
+separately.
+
+The outcome of a merge only depends on the shape of the stack: for each
+cmdset its class, key, priority, merge type and options, and the classes
+and names of its commands (the classes are not needed for the merge, but
+let the command parser share its tries by recipe too). This module keys merges by that signature. The first merge
+of a signature is done the normal way and remembered as a recipe - which
+command of which cmdset ends up where, and where the merged options come
+from. A stack with the same signature, from any player, is then put
+together by following the recipe with its own commands, without merging.
+
+Commands are compared by key and aliases only, as Evennia's merge does:
+their locks and `arg_regex` are not in the signature, so a recipe found
+with one player's commands is followed with another's. The merged cmdset
+still holds each player's own commands, so their locks and `arg_regex`
+apply to that player when the command is parsed and run. This assumes
+that no cmdset overrides its merge to look at anything else of its
+commands.
+
+The signature is worked out from the stack on every call, so adding or
+removing a cmdset, or a cmdset changing its commands, gives a new
+signature; recipes no longer used drop out of the `CACHE_SIZE` most
+recently used.
+
+Evennia's `get_and_merge_cmdsets` looks merges up in its
+`_CMDSET_MERGE_CACHE` by the ids of the cmdsets in the stack. `install`
+puts `MERGE_CACHE` in its place; it is done in `at_server_init`. To get
+from the ids back to the cmdsets, the cmdset providers and the objects
+around them `register` their cmdset stacks in `at_cmdset_get`, which the
+cmdhandler calls just before gathering. A stack with a cmdset that was
+not registered is cached by ids only, as Evennia does.
+
+"""
+
+from collections import OrderedDict
+from weakref import WeakValueDictionary
+
+from evennia.commands import cmdhandler
+from evennia.commands.cmdset import CmdSet
+from evennia.utils import logger
+
+# 最多保存这么多个合并方案
+CACHE_SIZE = 512
+# 合并结果上直接照抄的选项（cmdsetobj 另行记录来自哪个命令集）
+_OPTIONS = tuple(key for key in CmdSet.to_duplicate if key != "cmdsetobj") + ("actual_mergetype",)
+
+
+def cmdset_signature(cmdset):
+    """
+    Everything about a cmdset that the outcome of a merge depends on.
+
+    Args:
+        cmdset (CmdSet): The cmdset.
+
+    Returns:
+        tuple: The signature.
+
+    """
+    return (
+        type(cmdset),
+        cmdset.key,
+        cmdset.priority,
+        cmdset.mergetype,
+        cmdset.duplicates,
+        cmdset.no_exits,
+        cmdset.no_objs,
+        cmdset.no_channels,
+        tuple(cmdset.key_mergetypes.items()),
+        tuple((type(cmd), cmd._keyaliases) for cmd in cmdset.commands),
+    )
+
+
+class MergeRecipe:
+    """
+    How a merged cmdset is put together from the cmdsets it was merged from.
+
+    """
+
+    def __init__(self, cmdsets, merged):
+        # command id -> (cmdset index, command index)
+        positions = {}
+        for index, cmdset in enumerate(cmdsets):
+            for cmd_index, cmd in enumerate(cmdset.commands):
+                positions.setdefault(id(cmd), (index, cmd_index))
+        # 合并结果就是某个命令集本身（只有一个优先级组时）
+        self.same_as = next(
+            (index for index, cmdset in enumerate(cmdsets) if cmdset is merged), None
+        )
+        self.commands = [positions[id(cmd)] for cmd in merged.commands]
+        self.system_commands = [positions[id(cmd)] for cmd in merged.system_commands]
+        self.options = {key: getattr(merged, key) for key in _OPTIONS}
+        self.key_mergetypes = dict(merged.key_mergetypes)
+        self.cmdsetobj_from = next(
+            (
+                index
+                for index, cmdset in enumerate(cmdsets)
+                if cmdset.cmdsetobj is merged.cmdsetobj
+            ),
+            None,
+        )
+        # 命令解析用的前缀树（见 server/conf/cmdparser.py），随方案共用
+        self.command_trie = None
+
+    def build(self, cmdsets):
+        """
+        Put together the merged cmdset of a stack with the same signature.
+
+        """
+        if self.same_as is not None:
+            merged = cmdsets[self.same_as]
+        else:
+            merged = CmdSet()
+            for key, value in self.options.items():
+                setattr(merged, key, value)
+            merged.key_mergetypes = dict(self.key_mergetypes)
+            if self.cmdsetobj_from is not None:
+                merged.cmdsetobj = cmdsets[self.cmdsetobj_from].cmdsetobj
+            merged.commands = [cmdsets[index].commands[pos] for index, pos in self.commands]
+            merged.system_commands = [
+                cmdsets[index].commands[pos] for index, pos in self.system_commands
+            ]
+        merged.merged_from = cmdsets
+        merged.merge_recipe = self
+        return merged
+
+
+class MergeCache:
+    """
+    Recipes of merged cmdsets, by stack signature. Stands in for the
+    cmdhandler's `_CMDSET_MERGE_CACHE`, which maps the ids of the cmdsets
+    in a stack to their merged cmdset.
+
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.recipes = OrderedDict()
+        self.hits = self.misses = 0
+        # cmdset id -> cmdset，由 at_cmdset_get 登记
+        self.known = WeakValueDictionary()
+        # 有未登记命令集的栈，照 Evennia 的做法按 id 缓存
+        self.merged = WeakValueDictionary()
+        # __contains__ 按方案拼出的结果，紧接着由 __getitem__ 取走
+        self.found = None
+
+    def register(self, cmdsets):
+        """
+        Make cmdsets findable by id, so stacks with them can follow recipes.
+
+        Args:
+            cmdsets (list): The cmdsets, e.g. a `cmdset_stack`.
+
+        """
+        known = self.known
+        for cmdset in cmdsets:
+            if known.get(id(cmdset)) is not cmdset:
+                known[id(cmdset)] = cmdset
+
+    def __contains__(self, mergehash):
+        cmdsets = [self.known.get(cmdset_id) for cmdset_id in mergehash]
+        if any(cmdset is None for cmdset in cmdsets):
+            return mergehash in self.merged
+        signature = tuple(map(cmdset_signature, cmdsets))
+        recipe = self.recipes.get(signature)
+        if recipe is None:
+            # 由 cmdhandler 照常合并，再经 __setitem__ 记下方案
+            self.misses += 1
+            return False
+        self.recipes.move_to_end(signature)
+        self.hits += 1
+        self.found = recipe.build(cmdsets)
+        return True
+
+    def __getitem__(self, mergehash):
+        found, self.found = self.found, None
+        return found if found is not None else self.merged[mergehash]
+
+    def __setitem__(self, mergehash, merged):
+        self.merged[mergehash] = merged
+        cmdsets = merged.merged_from
+        try:
+            recipe = MergeRecipe(cmdsets, merged)
+        except KeyError:
+            # 合并结果中有不属于任何命令集的命令，不缓存
+            logger.log_warn(f"Cmdset merge of {[cmdset.key for cmdset in cmdsets]} not cached.")
+            return
+        merged.merge_recipe = recipe
+        self.recipes[tuple(map(cmdset_signature, cmdsets))] = recipe
+        if len(self.recipes) > self.size:
+            self.recipes.popitem(last=False)
+
+
+MERGE_CACHE = MergeCache()
+
+
+def install():
+    """
+    Make the cmdhandler look its merges up in `MERGE_CACHE`.
+
+    """
+    cmdhandler._CMDSET_MERGE_CACHE = MERGE_CACHE
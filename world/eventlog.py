@@ -0,0 +1,99 @@
+"""
+Event log
+
+A structured, non-blocking log for tracing connections and logins. Logging
+an event only appends a small dict to an in-memory ring buffer. A
+LoopingCall drains the buffer every `FLUSH_INTERVAL` seconds and hands
+the whole batch to Evennia's threaded `log_file`. That writes it off the
+reactor thread to `server/logs/events.log`, which rotates like the other
+game logs.
+
+Each record is one JSON line with the event name, the session id and
+address, the seconds since the session connected and since that session's
+previous event, plus any extra fields given.
+
+"""
+
+import json
+import time
+from collections import deque
+
+from twisted.internet.task import LoopingCall
+
+from evennia.utils import logger
+
+FLUSH_INTERVAL = 0.5
+BUFFER_SIZE = 10000
+LOG_FILENAME = "events.log"
+
+
+class EventLog:
+    """
+    Ring-buffered structured event log.
+
+    """
+
+    def __init__(self, filename=LOG_FILENAME, size=BUFFER_SIZE, interval=FLUSH_INTERVAL):
+        self.filename = filename
+        self.interval = interval
+        self.buffer = deque(maxlen=size)
+        self.dropped = 0
+        # sessid -> time of the last event logged for that session
+        self.last_event = {}
+        self._task = None
+
+    def log(self, event, session=None, **fields):
+        """
+        Record an event.
+
+        Args:
+            event (str): Name of the event.
+            session (Session, optional): The session the event concerns.
+            **fields: Any extra JSON-serializable data to store.
+
+        """
+        now = time.time()
+        record = {"time": round(now, 3), "event": event}
+        if session is not None:
+            sessid = session.sessid
+            record["sessid"] = sessid
+            record["address"] = session.address
+            record["since_connect"] = round(now - session.conn_time, 3)
+            record["since_last"] = round(now - self.last_event.get(sessid, session.conn_time), 3)
+            self.last_event[sessid] = now
+        record.update(fields)
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        self.buffer.append(record)
+        if not self._task:
+            self._task = LoopingCall(self.flush)
+            self._task.start(self.interval, now=False)
+
+    def forget(self, session):
+        """
+        Stop tracking phase timings for a session that went away.
+
+        """
+        self.last_event.pop(session.sessid, None)
+
+    def flush(self):
+        """
+        Write everything buffered so far, in a background thread.
+
+        """
+        if self.dropped:
+            self.buffer.append({"time": round(time.time(), 3), "event": "dropped", "count": self.dropped})
+            self.dropped = 0
+        if not self.buffer:
+            if self._task:
+                self._task.stop()
+                self._task = None
+            return
+        batch = [self.buffer.popleft() for _ in range(len(self.buffer))]
+        logger.log_file(
+            "\n".join(json.dumps(record, ensure_ascii=False, default=str) for record in batch),
+            filename=self.filename,
+        )
+
+
+EVENT_LOG = EventLog()
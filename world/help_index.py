@@ -0,0 +1,253 @@
+"""
+Help index
+
+The default `help` command rescans every file and database help entry,
+checks the locks of each, builds a fresh Lunr search index and re-parses
+the subtopics of the entry it shows - on every call. This index does that
+work once, at server start, for the file and database entries:
+
+- Each entry's subtopic tree is split once.
+- Key, aliases and category are cut into search grams and put in an
+  inverted index. Runs of Chinese characters give their characters and
+  character pairs (there are no spaces to split words on). Other words
+  give the whole word and its three-letter grams. A query is cut the same
+  way and only the postings of its own grams are looked at.
+- Entries are grouped by their listing lock and by their read lock. A
+  caller's view is found by checking each distinct lock once, and the
+  topics of each view are kept, as are the `LISTING_CACHE_SIZE` most
+  recently used help listings (one per view, cmdset and client width).
+
+Database entries change through `sethelp`; saving or deleting one marks
+the index stale and it is rebuilt on next use. File entries only change
+with a code reload.
+
+"""
+
+import re
+from collections import OrderedDict, defaultdict
+
+from django.db.models.signals import post_delete, post_save
+
+from evennia.help.filehelp import FILE_HELP_ENTRIES
+from evennia.help.models import HelpEntry
+from evennia.help.utils import parse_entry_for_subcategories
+
+_CJK = r"\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_WORDS = re.compile(rf"[{_CJK}]+|[^\s{_CJK}]+")
+_CJK_WORD = re.compile(rf"[{_CJK}]")
+
+# 模糊匹配至少要命中查询中这一比例的片段
+MIN_SCORE = 0.5
+# 最多保存这么多份排好版的帮助列表
+LISTING_CACHE_SIZE = 256
+
+
+def search_grams(text):
+    """
+    Cut a text into search grams.
+
+    Args:
+        text (str): Text in any mix of Chinese and other scripts.
+
+    Returns:
+        set: The grams.
+
+    """
+    grams = set()
+    for word in _WORDS.findall(text.lower()):
+        if _CJK_WORD.match(word):
+            grams.update(word)
+            grams.update(word[i : i + 2] for i in range(len(word) - 1))
+        else:
+            grams.add(word)
+            grams.update(word[i : i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+class IndexedTopic:
+    """
+    A file or database help entry with its search data worked out.
+
+    """
+
+    def __init__(self, entry):
+        self.entry = entry
+        self.key = entry.key.lower().strip()
+        self.aliases = entry.aliases if isinstance(entry.aliases, list) else entry.aliases.all()
+        self.names = [self.key] + [alias.lower().strip() for alias in self.aliases]
+        self.category = entry.help_category.lower()
+        # 子话题树：None -> 正文，其余键 -> 下一层
+        self.tree = parse_entry_for_subcategories(entry.entrytext)
+        # locks.get 返回的已是 "read:..." 形式的完整锁字符串
+        self.read_lock = entry.locks.get("read")
+        self.list_lock = entry.locks.get("view") or self.read_lock
+
+
+class HelpIndex:
+    """
+    Startup-built index of the file and database help entries.
+
+    """
+
+    def __init__(self):
+        self.topics = None
+        self.stale = True
+
+    def build(self):
+        """
+        (Re)build the index from the file help modules and the database.
+
+        """
+        file_topics = {topic.key: topic for topic in map(IndexedTopic, FILE_HELP_ENTRIES.all())}
+        db_topics = {topic.key: topic for topic in map(IndexedTopic, HelpEntry.objects.all())}
+        # 数据库条目覆盖同名的文件条目
+        self.topics = {**file_topics, **db_topics}
+        self.db_keys = set(db_topics)
+
+        self.names = {}
+        self.postings = defaultdict(set)
+        self.categories = defaultdict(list)
+        for key, topic in self.topics.items():
+            for name in topic.names:
+                self.names.setdefault(name, key)
+            for gram in search_grams(" ".join(topic.names + [topic.category])):
+                self.postings[gram].add(key)
+            self.categories[topic.category].append(key)
+
+        # lock -> keys of the topics using it, per mode
+        self.by_lock = {"list": defaultdict(list), "query": defaultdict(list)}
+        for key, topic in self.topics.items():
+            self.by_lock["list"][topic.list_lock].append(key)
+            self.by_lock["query"][topic.read_lock].append(key)
+        # (mode, locks passed) -> (db topics, file topics)
+        self.views = {}
+        # rendered help listings, keyed by whoever renders them
+        self.listings = OrderedDict()
+        self.stale = False
+
+    def _ensure(self):
+        if self.stale:
+            self.build()
+
+    def view(self, caller, mode="list"):
+        """
+        Find which topics `caller` may list or read, checking each distinct
+        lock once.
+
+        Args:
+            caller (Object or Account): The one using help.
+            mode (str): `"list"` for the help index, `"query"` for reading.
+
+        Returns:
+            frozenset: The locks passed; identifies the view.
+
+        """
+        self._ensure()
+        passed = set()
+        for lock, keys in self.by_lock[mode].items():
+            if not lock or self.topics[keys[0]].entry.locks.check_lockstring(
+                caller, lock, default=True
+            ):
+                passed.add(lock)
+        return frozenset(passed)
+
+    def topics_in_view(self, mode, passed):
+        """
+        Get the file and database topics of a view.
+
+        Args:
+            mode (str): `"list"` or `"query"`, as given to `view`.
+            passed (frozenset): The view, as returned by `view`.
+
+        Returns:
+            tuple: `({key: dbentry, ...}, {key: fileentry, ...})`, shared
+                between callers with the same view; do not modify.
+
+        """
+        cached = self.views.get((mode, passed))
+        if cached is None:
+            db_topics, file_topics = {}, {}
+            for lock in passed:
+                for key in self.by_lock[mode][lock]:
+                    target = db_topics if key in self.db_keys else file_topics
+                    target[key] = self.topics[key].entry
+            cached = self.views[(mode, passed)] = (db_topics, file_topics)
+        return cached
+
+    def get_listing(self, signature):
+        """
+        Get a rendered help listing, if it is still kept.
+
+        """
+        output = self.listings.get(signature)
+        if output is not None:
+            self.listings.move_to_end(signature)
+        return output
+
+    def add_listing(self, signature, output):
+        """
+        Keep a rendered help listing, dropping the least recently used one
+        when there are more than `LISTING_CACHE_SIZE`.
+
+        """
+        self.listings[signature] = output
+        if len(self.listings) > LISTING_CACHE_SIZE:
+            self.listings.popitem(last=False)
+
+    def find(self, name):
+        """
+        Get the topic with this key or alias.
+
+        Returns:
+            IndexedTopic or None: The topic.
+
+        """
+        self._ensure()
+        key = self.names.get(name.lower().strip())
+        return self.topics[key] if key else None
+
+    def search(self, query, allowed=None, maxnum=5):
+        """
+        Find topics by name: exact key or alias first, then by shared grams.
+
+        Args:
+            query (str): What to look for.
+            allowed (container, optional): Only return these topic keys.
+            maxnum (int, optional): Most topics to return.
+
+        Returns:
+            list: Topic keys, best match first.
+
+        """
+        self._ensure()
+        query = query.lower().strip()
+        exact = self.names.get(query)
+        results = [exact] if exact and (allowed is None or exact in allowed) else []
+        grams = search_grams(query)
+        if grams:
+            scores = defaultdict(int)
+            for gram in grams:
+                for key in self.postings.get(gram, ()):
+                    scores[key] += 1
+            threshold = len(grams) * MIN_SCORE
+            ranked = sorted(
+                (key for key, score in scores.items() if score >= threshold),
+                key=lambda key: (-scores[key], len(key), key),
+            )
+            results += [
+                key
+                for key in ranked
+                if key != exact and (allowed is None or key in allowed)
+            ]
+        return results[:maxnum]
+
+
+HELP_INDEX = HelpIndex()
+
+
+def _mark_stale(sender, **kwargs):
+    HELP_INDEX.stale = True
+
+
+post_save.connect(_mark_stale, sender=HelpEntry)
+post_delete.connect(_mark_stale, sender=HelpEntry)
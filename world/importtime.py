@@ -0,0 +1,141 @@
+"""
+Import-time profiler
+
+Most of the time of `evennia start` and `evennia reload` goes to importing
+Evennia, Django and the game's own modules. `profile_imports` measures
+that: it starts a fresh Python with `-X importtime`, sets up Django and
+Evennia the way the server does, imports the modules the server loads at
+start (typeclasses, cmdsets and the startstop module, as named in the
+settings) and reports how long each import took.
+
+The profile runs in a separate process, so the modules already imported
+by the running server do not hide anything and the server is not blocked
+while it runs. The total is compared to `settings.RELOAD_IMPORT_TARGET`.
+
+"""
+
+import os
+import sys
+
+from django.conf import settings
+from twisted.internet.utils import getProcessOutputAndValue
+
+# 服务器启动时按这些设置导入的模块
+_MODULE_SETTINGS = (
+    "AT_SERVER_STARTSTOP_MODULE",
+    "CMDSET_UNLOGGEDIN",
+    "CMDSET_SESSION",
+    "CMDSET_ACCOUNT",
+    "CMDSET_CHARACTER",
+    "BASE_ACCOUNT_TYPECLASS",
+    "BASE_OBJECT_TYPECLASS",
+    "BASE_CHARACTER_TYPECLASS",
+    "BASE_ROOM_TYPECLASS",
+    "BASE_EXIT_TYPECLASS",
+    "BASE_CHANNEL_TYPECLASS",
+    "BASE_SCRIPT_TYPECLASS",
+)
+
+_SCRIPT = """
+import importlib, os, sys
+sys.path.insert(0, {game_dir!r})
+os.environ["DJANGO_SETTINGS_MODULE"] = "server.conf.settings"
+import django
+django.setup()
+import evennia
+evennia._init()
+for module in {modules!r}:
+    importlib.import_module(module)
+"""
+
+
+class ImportTime:
+    """
+    How long one module took to import.
+
+    """
+
+    def __init__(self, module, self_us, cumulative_us, depth):
+        self.module = module
+        self.self_us = self_us
+        self.cumulative_us = cumulative_us
+        # 0 表示被直接导入，否则是被哪一层模块间接导入
+        self.depth = depth
+
+
+def startup_modules():
+    """
+    Returns:
+        list: The game modules the server imports at start, from the settings.
+
+    """
+    modules = []
+    for name in _MODULE_SETTINGS:
+        path = getattr(settings, name, None)
+        if not path:
+            continue
+        module = path if name == "AT_SERVER_STARTSTOP_MODULE" else path.rsplit(".", 1)[0]
+        if module not in modules:
+            modules.append(module)
+    return modules
+
+
+def parse_importtime(output):
+    """
+    Parse the report `python -X importtime` writes to stderr.
+
+    Args:
+        output (str): The stderr output.
+
+    Returns:
+        list: An `ImportTime` per imported module, in import order.
+
+    """
+    times = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:") :].split("|", 2)
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # 表头
+            continue
+        name = fields[2][1:]
+        module = name.lstrip()
+        times.append(
+            ImportTime(
+                module, int(fields[0]), int(fields[1]), (len(name) - len(module)) // 2
+            )
+        )
+    return times
+
+
+def profile_imports(modules=None):
+    """
+    Profile importing the server and game modules in a new process.
+
+    Args:
+        modules (list, optional): Modules to import after Evennia is set
+            up. Defaults to `startup_modules()`.
+
+    Returns:
+        Deferred: Fires with the list of `ImportTime`s, or fails with a
+            `RuntimeError` carrying the output if the process failed.
+
+    """
+    modules = startup_modules() if modules is None else modules
+    script = _SCRIPT.format(game_dir=settings.GAME_DIR, modules=list(modules))
+    deferred = getProcessOutputAndValue(
+        sys.executable,
+        ("-X", "importtime", "-c", script),
+        env=dict(os.environ),
+        path=settings.GAME_DIR,
+    )
+
+    def _parse(result):
+        out, err, code = result
+        err = err.decode("utf-8", "replace")
+        if code:
+            raise RuntimeError(err.strip().splitlines()[-1] if err.strip() else f"exit code {code}")
+        return parse_importtime(err)
+
+    return deferred.addCallback(_parse)
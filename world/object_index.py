@@ -0,0 +1,409 @@
+"""
+Object search index
+
+`get`, `look <target>` and most other commands find their target by
+searching the objects around the caller by name. Evennia does that in the
+database: an exact match on key and aliases, then a regular expression
+per word. The Chinese name, kept in the `chinese_name` Attribute, is not
+searched at all, and the regular expression cannot find 剑 in 长剑, since
+Chinese has no spaces for words to start at.
+
+This index keeps the names of all objects in memory - key, aliases and
+Chinese name - in one bucket per location. With `pypinyin` installed, a
+name with Chinese in it also gets its pinyin with and without spaces and
+its initials ("changjian", "chang jian" and "cj" for 长剑); without it
+there is no pinyin. A search among candidates tries, in order:
+
+- EXACT: a name equal to the query (the only tier for exact searches);
+- PINYIN: a pinyin spelling or initials equal to the query;
+- PARTIAL: a name or spelling whose words start with the query's words,
+  as Evennia matches partially;
+- GRAMS: a name sharing at least `MIN_SCORE` of the query's search grams
+  (see `world.help_index.search_grams`).
+
+The first tier with matches gives the result, better matches first:
+within a tier, the more of the name the query covers, the better. The
+`ball-2` form picks among them as usual.
+
+Objects are indexed when created (`at_object_post_creation`), renamed
+or given a new Chinese name (`at_display_name_change`, called by
+`NameAttributeHandler` however the Attribute is set), re-aliased
+(`IndexedAliasHandler`) or moved
+(`at_post_move`), and dropped when deleted. A candidate that is not in
+the index, or was moved without the hooks (by setting `location`
+directly), is indexed from its cached fields when searched. The index is
+loaded at server start.
+
+"""
+
+import re
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from evennia.objects.models import ObjectDB
+from evennia.typeclasses.attributes import AttributeHandler, ModelAttributeBackend
+from evennia.typeclasses.tags import AliasHandler
+from evennia.utils.utils import make_iter
+
+from world.help_index import search_grams
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:
+    # 没有安装 pypinyin 时不做拼音扩展
+    lazy_pinyin = None
+
+_CJK = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+_MULTIMATCH_REGEX = re.compile(settings.SEARCH_MULTIMATCH_REGEX, re.I + re.U)
+
+# 匹配的层次，从好到差
+EXACT, PINYIN, PARTIAL, GRAMS = range(4)
+# 片段匹配至少要命中查询中这一比例的片段
+MIN_SCORE = 0.5
+
+
+def pinyin_names(name):
+    """
+    Spell a name with Chinese in it in pinyin.
+
+    Args:
+        name (str): The lower-case name.
+
+    Returns:
+        tuple: The pinyin without and with spaces and the initials, or
+            nothing if the name has no Chinese or pypinyin is missing.
+
+    """
+    if lazy_pinyin is None or not _CJK.search(name):
+        return ()
+    syllables = [syllable.strip() for syllable in lazy_pinyin(name) if syllable.strip()]
+    return (
+        "".join(syllables),
+        " ".join(syllables),
+        "".join(syllable[0] for syllable in syllables),
+    )
+
+
+def _partial_regex(query):
+    # 与 Evennia 的部分匹配相同：每个词依次匹配名字中某个词的开头
+    return re.compile(r".* ".join(r"\b" + re.escape(word) for word in query.split()) + r".*")
+
+
+class IndexedObject:
+    """
+    The names of an object, worked out for searching.
+
+    """
+
+    __slots__ = ("location_id", "names", "pinyin", "grams")
+
+    def __init__(self, location_id, key, aliases, chinese_name):
+        names = [key, *aliases]
+        if chinese_name:
+            names.append(str(chinese_name))
+        self.location_id = location_id
+        self.names = tuple(dict.fromkeys(name.strip().lower() for name in names if name.strip()))
+        self.pinyin = tuple(
+            dict.fromkeys(spelling for name in self.names for spelling in pinyin_names(name))
+        )
+        self.grams = set().union(*map(search_grams, self.names + self.pinyin))
+
+
+class Bucket:
+    """
+    The postings of the objects in one location.
+
+    """
+
+    __slots__ = ("ids", "names", "pinyin", "grams")
+
+    def __init__(self):
+        self.ids = set()
+        self.names = defaultdict(set)
+        self.pinyin = defaultdict(set)
+        self.grams = defaultdict(set)
+
+    def postings(self, entry):
+        return ((self.names, entry.names), (self.pinyin, entry.pinyin), (self.grams, entry.grams))
+
+
+class ObjectIndex:
+    """
+    Names of all objects, bucketed by location.
+
+    """
+
+    def __init__(self):
+        # obj id -> IndexedObject
+        self.entries = {}
+        # location id -> Bucket
+        self.buckets = defaultdict(Bucket)
+        # 为 True 时钩子不更新索引，由调用者自行补上
+        self.paused = False
+
+    def load(self):
+        """
+        (Re)load the names of all objects from the database.
+
+        """
+        aliases = defaultdict(list)
+        for obj_id, alias in ObjectDB.db_tags.through.objects.filter(
+            tag__db_tagtype="alias"
+        ).values_list("objectdb_id", "tag__db_key"):
+            aliases[obj_id].append(alias)
+        chinese_names = dict(
+            ObjectDB.db_attributes.through.objects.filter(
+                attribute__db_key="chinese_name", attribute__db_category__isnull=True
+            ).values_list("objectdb_id", "attribute__db_value")
+        )
+        self.entries = {}
+        self.buckets = defaultdict(Bucket)
+        for obj_id, key, location_id in ObjectDB.objects.values_list(
+            "id", "db_key", "db_location_id"
+        ):
+            self._add(
+                obj_id,
+                IndexedObject(location_id, key, aliases.get(obj_id, ()), chinese_names.get(obj_id)),
+            )
+
+    def _add(self, obj_id, entry):
+        self.entries[obj_id] = entry
+        bucket = self.buckets[entry.location_id]
+        bucket.ids.add(obj_id)
+        for postings, keys in bucket.postings(entry):
+            for key in keys:
+                postings[key].add(obj_id)
+
+    def remove(self, obj_id):
+        """
+        Drop an object from the index.
+
+        """
+        entry = self.entries.pop(obj_id, None)
+        if entry is None:
+            return
+        bucket = self.buckets[entry.location_id]
+        bucket.ids.discard(obj_id)
+        for postings, keys in bucket.postings(entry):
+            for key in keys:
+                ids = postings[key]
+                ids.discard(obj_id)
+                if not ids:
+                    del postings[key]
+        if not bucket.ids:
+            del self.buckets[entry.location_id]
+
+    def add(self, obj_id, location_id, key, aliases=(), chinese_name=None):
+        """
+        (Re)index an object by names already known, without looking at it.
+
+        """
+        self.remove(obj_id)
+        self._add(obj_id, IndexedObject(location_id, key, aliases, chinese_name))
+
+    def update(self, obj):
+        """
+        (Re)index an object by its current key, aliases, Chinese name and
+        location.
+
+        """
+        if self.paused:
+            return
+        self.add(
+            obj.id,
+            obj.db_location_id,
+            obj.db_key,
+            obj.aliases.all(),
+            obj.attributes.get("chinese_name"),
+        )
+
+    @contextmanager
+    def suspended(self):
+        """
+        Let the hooks leave the index alone for a while, e.g. while objects
+        are created in bulk and indexed with `add` afterwards.
+
+        """
+        self.paused = True
+        try:
+            yield
+        finally:
+            self.paused = False
+
+    def move(self, obj):
+        """
+        Put an object in the bucket of its current location, indexing it
+        if it is not indexed yet.
+
+        """
+        if self.paused:
+            return
+        entry = self.entries.get(obj.id)
+        if entry is None:
+            self.update(obj)
+        elif entry.location_id != obj.db_location_id:
+            self.remove(obj.id)
+            entry.location_id = obj.db_location_id
+            self._add(obj.id, entry)
+
+    def _match(self, query, candidates, exact):
+        """
+        Score the candidates in the best tier that matches the query.
+
+        Returns:
+            dict: `{obj id: score}`, higher is better.
+
+        """
+        buckets = [
+            self.buckets[location_id]
+            for location_id in {self.entries[obj_id].location_id for obj_id in candidates}
+        ]
+
+        def _lookup(field, key):
+            ids = set()
+            for bucket in buckets:
+                ids.update(getattr(bucket, field).get(key, ()))
+            return ids.intersection(candidates)
+
+        for tier in (EXACT,) if exact else (EXACT, PINYIN, PARTIAL, GRAMS):
+            if tier == EXACT:
+                scores = dict.fromkeys(_lookup("names", query), 1.0)
+            elif tier == PINYIN:
+                scores = dict.fromkeys(_lookup("pinyin", query), 1.0)
+            elif tier == PARTIAL:
+                regex = _partial_regex(query)
+                scores = {}
+                for obj_id in candidates:
+                    entry = self.entries[obj_id]
+                    lengths = [len(name) for name in entry.names + entry.pinyin if regex.search(name)]
+                    if lengths:
+                        scores[obj_id] = len(query) / min(lengths)
+            else:
+                grams = search_grams(query)
+                hits = Counter()
+                for gram in grams:
+                    hits.update(_lookup("grams", gram))
+                scores = {
+                    obj_id: count / len(grams)
+                    for obj_id, count in hits.items()
+                    if count / len(grams) >= MIN_SCORE
+                }
+            if scores:
+                return scores
+        return {}
+
+    def search(self, searchdata, candidates, exact=False):
+        """
+        Find the candidates whose names match a query, like Evennia's
+        `search_object` does for a key and alias search among candidates.
+
+        Args:
+            searchdata (str): The name searched for, possibly on the form
+                `name-2` to pick the second of several matches.
+            candidates (list): The objects to search among.
+            exact (bool): Only match whole names.
+
+        Returns:
+            list or None: The matching candidates, best match first, or
+                `None` if the index cannot answer: while it is suspended,
+                or if a candidate could not be indexed.
+
+        """
+        if self.paused:
+            return None
+        by_id = {obj.id: obj for obj in make_iter(candidates) if obj}
+        for obj in by_id.values():
+            # 补上尚未索引的、或绕过钩子移动过的候选对象
+            self.move(obj)
+        if not self.entries.keys() >= by_id.keys():
+            return None
+
+        query = searchdata.strip().lower()
+        scores = self._match(query, by_id, exact=True)
+        match_number = None
+        if not scores:
+            match_data = _MULTIMATCH_REGEX.match(query)
+            if match_data:
+                match_number = int(match_data.group("number")) - 1
+                query = match_data.group("name").strip()
+                scores = self._match(query, by_id, exact=True)
+        if not exact and not scores and query:
+            scores = self._match(query, by_id, exact=False)
+
+        matches = [by_id[obj_id] for obj_id in sorted(scores, key=lambda i: (-scores[i], i))]
+        if match_number is not None:
+            matches = matches[match_number : match_number + 1] if match_number >= 0 else []
+        return matches
+
+
+OBJECT_INDEX = ObjectIndex()
+
+
+class IndexedAliasHandler(AliasHandler):
+    """
+    An AliasHandler that reindexes its object whenever its aliases change.
+
+    """
+
+    def add(self, *args, **kwargs):
+        result = super().add(*args, **kwargs)
+        OBJECT_INDEX.update(self.obj)
+        return result
+
+    def remove(self, *args, **kwargs):
+        result = super().remove(*args, **kwargs)
+        OBJECT_INDEX.update(self.obj)
+        return result
+
+    def clear(self, *args, **kwargs):
+        result = super().clear(*args, **kwargs)
+        OBJECT_INDEX.update(self.obj)
+        return result
+
+
+# 显示名所用的属性
+NAME_ATTRIBUTE = "chinese_name"
+
+
+def _is_name(key, category):
+    return category is None and NAME_ATTRIBUTE in (
+        name.strip().lower() for name in make_iter(key) if name
+    )
+
+
+class NameAttributeHandler(AttributeHandler):
+    """
+    An AttributeHandler that calls `at_display_name_change` on its object
+    whenever the `chinese_name` Attribute is set or removed, be it through
+    `obj.db`, a builder command or a batch add at creation.
+
+    """
+
+    def __init__(self, obj):
+        super().__init__(obj, ModelAttributeBackend)
+
+    def add(self, key, value, category=None, *args, **kwargs):
+        result = super().add(key, value, category, *args, **kwargs)
+        if _is_name(key, category):
+            self.obj.at_display_name_change()
+        return result
+
+    def batch_add(self, *args, **kwargs):
+        result = super().batch_add(*args, **kwargs)
+        if any(_is_name(attr[0], attr[2] if len(attr) > 2 else None) for attr in args):
+            self.obj.at_display_name_change()
+        return result
+
+    def remove(self, key=None, category=None, *args, **kwargs):
+        result = super().remove(key, category, *args, **kwargs)
+        if category is None and (key is None or _is_name(key, category)):
+            self.obj.at_display_name_change()
+        return result
+
+    def clear(self, category=None, *args, **kwargs):
+        result = super().clear(category, *args, **kwargs)
+        if category is None:
+            self.obj.at_display_name_change()
+        return result
@@ -0,0 +1,157 @@
+"""
+Password verification
+
+Password hashing is deliberately slow (tens of milliseconds per check), so
+it must not run on the reactor thread where it would stall every connected
+player. Checks run on a small dedicated thread pool instead and report back
+through a Deferred.
+
+Attempts are throttled per IP address and per account with token buckets
+before any hashing is done, so a flood of guesses costs almost nothing.
+
+`benchmark` measures how late the reactor ticks while a burst of logins is
+checked, on the reactor thread as before and through the pool. Run it in
+game with e.g.
+
+    py from world.passwords import benchmark; benchmark().addCallback(me.msg)
+
+"""
+
+import time
+
+from django.contrib.auth.hashers import check_password, make_password
+from twisted.internet import reactor, threads
+from twisted.internet.defer import DeferredList, inlineCallbacks
+from twisted.internet.task import LoopingCall, deferLater
+from twisted.python.threadpool import ThreadPool
+
+from evennia.utils import logger
+
+from world.throttle import TokenBucket
+
+# 每个 IP 最多连续尝试 10 次，之后每 6 秒恢复一次
+IP_THROTTLE = TokenBucket(rate=1 / 6, burst=10)
+# 每个账号最多连续尝试 5 次，之后每 12 秒恢复一次
+ACCOUNT_THROTTLE = TokenBucket(rate=1 / 12, burst=5)
+
+POOL_SIZE = 4
+
+_POOL = None
+
+
+def _get_pool():
+    global _POOL
+    if _POOL is None:
+        _POOL = ThreadPool(minthreads=1, maxthreads=POOL_SIZE, name="password-check")
+        _POOL.start()
+        reactor.addSystemEventTrigger("during", "shutdown", _POOL.stop)
+    return _POOL
+
+
+def allow_attempt(address, account):
+    """
+    Check the throttles for a login attempt.
+
+    Args:
+        address (str): The address the attempt comes from.
+        account (Account): The account being logged into.
+
+    Returns:
+        bool: If the password may be checked.
+
+    """
+    # 两个限流都要扣除，避免一个 IP 轮流尝试多个账号或多个 IP 尝试一个账号
+    ip_ok = IP_THROTTLE.allow(address)
+    account_ok = ACCOUNT_THROTTLE.allow(account.id)
+    return ip_ok and account_ok
+
+
+def verify_password(account, password):
+    """
+    Check a password against an account's stored hash, off the reactor thread.
+    This is the account's own `check_password`, so a hash made with outdated
+    hasher settings is upgraded as usual.
+
+    Args:
+        account (Account): The account to check.
+        password (str): The password in cleartext.
+
+    Returns:
+        Deferred: Fires with `True` or `False`. Errors are logged and
+            count as a failed check.
+
+    """
+
+    def _errback(failure):
+        logger.log_err(f"Password check for {account.key} failed: {failure.getErrorMessage()}")
+        return False
+
+    deferred = threads.deferToThreadPool(reactor, _get_pool(), account.check_password, password)
+    return deferred.addErrback(_errback)
+
+
+class _BenchmarkAccount:
+    """Stands in for an account, with a hash made by the current hasher."""
+
+    key = "benchmark"
+
+    def __init__(self, password):
+        self.password = make_password(password)
+
+    def check_password(self, raw_password):
+        return check_password(raw_password, self.password)
+
+
+@inlineCallbacks
+def _tick_latency(run, tick):
+    # 每个 tick 记录比预定时间晚了多少
+    lateness = []
+    last = [time.perf_counter()]
+
+    def _tick():
+        now = time.perf_counter()
+        lateness.append(max(0.0, now - last[0] - tick))
+        last[0] = now
+
+    loop = LoopingCall(_tick)
+    loop.start(tick, now=False)
+    yield deferLater(reactor, tick * 5, lambda: None)
+    yield run()
+    yield deferLater(reactor, tick * 5, lambda: None)
+    loop.stop()
+    return {
+        "mean_ms": 1000 * sum(lateness) / len(lateness),
+        "max_ms": 1000 * max(lateness),
+    }
+
+
+@inlineCallbacks
+def benchmark(logins=200, tick=0.01):
+    """
+    Measure reactor tick latency while `logins` concurrent logins have their
+    passwords checked.
+
+    Args:
+        logins (int): Password checks started at once.
+        tick (float): Seconds between the measured reactor ticks.
+
+    Returns:
+        Deferred: Fires with `{"blocking": ..., "pooled": ...}`, each giving
+            the mean and worst tick lateness in milliseconds, for checks
+            on the reactor thread and through `verify_password`.
+
+    """
+    account = _BenchmarkAccount("benchmark")
+
+    def _blocking():
+        # 每次登录各自作为一个 reactor 调用，与之前在命令中直接校验相同
+        for _ in range(logins):
+            reactor.callLater(0, account.check_password, "wrong")
+        return deferLater(reactor, 0, lambda: None)
+
+    def _pooled():
+        return DeferredList([verify_password(account, "wrong") for _ in range(logins)])
+
+    blocking = yield _tick_latency(_blocking, tick)
+    pooled = yield _tick_latency(_pooled, tick)
+    return {"logins": logins, "blocking": blocking, "pooled": pooled}
@@ -0,0 +1,122 @@
+"""
+Permission caching
+
+Checking a permission through a lockstring parses the lockstring and walks
+the permission hierarchy on every call. Display names check the looker's
+Developer permission for every object they render, so the result is cached
+on the looker instead and refreshed whenever its permissions change.
+
+Typeclasses that want their permission changes to refresh the cache use
+`CachedPermissionHandler` as their `permissions` handler.
+
+"""
+
+from evennia.typeclasses.tags import PermissionHandler
+
+_DEVELOPER_LOCK = "perm(Developer)"
+
+
+def is_quelling(obj):
+    """
+    Check if `obj` is puppeted by an Account that quells its permissions,
+    so that permission locks look at the puppet's own permissions.
+
+    """
+    account = getattr(obj, "account", None)
+    return bool(account and account is not obj and account.attributes.get("_quell"))
+
+
+def is_developer(looker):
+    """
+    Check if `looker` has the Developer permission, caching the result.
+    Quelling is read anew each time, so `quell` and `unquell` take effect
+    at once.
+
+    Args:
+        looker (Object or Account): The one to check.
+
+    Returns:
+        bool: If the looker passes `perm(Developer)`.
+
+    """
+    quelling = is_quelling(looker)
+    cached = getattr(looker, "_is_developer", None)
+    if cached is None or cached[0] != quelling:
+        cached = (quelling, looker.locks.check_lockstring(looker, _DEVELOPER_LOCK))
+        looker._is_developer = cached
+    return cached[1]
+
+
+def permission_fingerprint(obj):
+    """
+    A hashable summary of the permissions of `obj`, cached like `is_developer`.
+    Two lookers with the same fingerprint pass the same permission locks.
+
+    Args:
+        obj (Object or Account): The one to summarize.
+
+    Returns:
+        tuple: `(is_superuser, sorted permission strings)`.
+
+    """
+    cached = getattr(obj, "_perm_fingerprint", None)
+    if cached is None:
+        cached = (bool(obj.is_superuser), tuple(sorted(obj.permissions.all())))
+        obj._perm_fingerprint = cached
+    return cached
+
+
+def access_fingerprint(obj):
+    """
+    A hashable summary of everything permission locks look at when `obj`
+    is checked: its own permissions and, when an Account puppets it, the
+    Account's permissions and whether it is quelling.
+
+    Args:
+        obj (Object or Account): The one to summarize.
+
+    Returns:
+        tuple: The fingerprint.
+
+    """
+    account = getattr(obj, "account", None)
+    if account and account is not obj:
+        return (permission_fingerprint(obj), permission_fingerprint(account), is_quelling(obj))
+    return (permission_fingerprint(obj),)
+
+
+def refresh_permission_cache(obj):
+    """
+    Forget the cached permission checks of `obj`. An Account's permissions
+    also apply to its puppets, so those are refreshed too.
+
+    Args:
+        obj (Object or Account): The one whose permissions changed.
+
+    """
+    obj._is_developer = None
+    obj._perm_fingerprint = None
+    if hasattr(obj, "get_all_puppets"):
+        for puppet in obj.get_all_puppets():
+            puppet._is_developer = None
+            puppet._perm_fingerprint = None
+
+
+class CachedPermissionHandler(PermissionHandler):
+    """
+    A PermissionHandler that refreshes the cached permission checks of its
+    object whenever a permission is added or removed.
+
+    """
+
+    def add(self, *args, **kwargs):
+        super().add(*args, **kwargs)
+        refresh_permission_cache(self.obj)
+
+    def remove(self, *args, **kwargs):
+        super().remove(*args, **kwargs)
+        refresh_permission_cache(self.obj)
+
+    def clear(self, *args, **kwargs):
+        super().clear(*args, **kwargs)
+        refresh_permission_cache(self.obj)
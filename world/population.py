@@ -0,0 +1,77 @@
+"""
+Online population
+
+Keeps a running count of who is in the game, so the welcome banner can show
+it without walking every session and checking permissions on each connect.
+
+The counts are sets of ids updated from the session and puppet hooks. Adding
+or removing the same id twice is harmless, so hooks that may fire again
+(like the session resync after a reload) keep the counts correct.
+
+"""
+
+# 拥有此权限（或更高）的角色算作神仙
+WIZARD_PERM = "Builder"
+
+_CHINESE_DIGITS = "零一二三四五六七八九"
+
+
+def chinese_number(number):
+    """
+    Format a count the way the banner does (零, 一, ... 九), falling back
+    to Arabic digits from ten upwards.
+
+    """
+    if 0 <= number < 10:
+        return _CHINESE_DIGITS[number]
+    return str(number)
+
+
+class Population:
+    """
+    Online population counters.
+
+    - `connecting` - ids of sessions that have connected but not logged in.
+    - `players` - ids of puppeted characters without the wizard permission.
+    - `wizards` - ids of puppeted characters with the wizard permission.
+
+    """
+
+    def __init__(self):
+        self.connecting = set()
+        self.players = set()
+        self.wizards = set()
+
+    def session_connected(self, session):
+        if not session.logged_in:
+            self.connecting.add(session.sessid)
+
+    def session_logged_in(self, session):
+        self.connecting.discard(session.sessid)
+
+    def session_disconnected(self, session):
+        self.connecting.discard(session.sessid)
+
+    def puppeted(self, obj):
+        if obj.check_permstring(WIZARD_PERM):
+            self.players.discard(obj.id)
+            self.wizards.add(obj.id)
+        else:
+            self.wizards.discard(obj.id)
+            self.players.add(obj.id)
+
+    def unpuppeted(self, obj):
+        if not obj.sessions.count():
+            self.players.discard(obj.id)
+            self.wizards.discard(obj.id)
+
+    def counts(self):
+        """
+        Returns:
+            tuple: `(wizards, players, connecting)`.
+
+        """
+        return len(self.wizards), len(self.players), len(self.connecting)
+
+
+POPULATION = Population()
@@ -0,0 +1,145 @@
+"""
+Reload state handoff
+
+A reload starts a new server process, so everything kept in memory - the
+account name index, the channel history rings, half-finished logins, the
+rendered room lines - is lost and has to be rebuilt from the database by
+the first players to need it.
+
+Subsystems register a `dump` and a `load` function here, with a version.
+`at_server_reload_stop` calls `save`, which dumps every subsystem into one
+pickle file, and `at_server_reload_start` calls `restore`, which maps the
+file into memory and hands each subsystem its data back. A subsystem's
+data is only loaded if it was saved with the same version, so bump the
+version whenever the shape of the data changes. A file older than
+`MAX_AGE` seconds, or written by another format, is ignored.
+
+The sessions are only synced from the portal after these hooks, so a
+subsystem whose state belongs to sessions must keep its data until then
+(see `resume_login_flow` in `commands/default_cmdsets.py`).
+
+The file is removed once read and on every cold start, and is only
+readable by the server's user. Never hand over credentials: what a
+subsystem dumps ends up on disk.
+
+"""
+
+import mmap
+import os
+import pickle
+import time
+
+from django.conf import settings
+
+from evennia.utils import logger
+
+# 文件格式的版本，改动文件结构时递增
+FORMAT = 1
+# 超过这个秒数的状态文件不再使用
+MAX_AGE = 120
+
+
+class ReloadState:
+    """
+    Registry of subsystems whose in-memory state survives a reload.
+
+    """
+
+    def __init__(self, path=None):
+        self._path = path
+        # name -> (version, dump, load)
+        self.handlers = {}
+
+    @property
+    def path(self):
+        if self._path is None:
+            self._path = os.path.join(settings.GAME_DIR, "server", "reload_state.pickle")
+        return self._path
+
+    def register(self, name, dump, load, version=1):
+        """
+        Hand the state of a subsystem over to the next server process.
+
+        Args:
+            name (str): Unique name of the subsystem.
+            dump (callable): Called without arguments on reload; returns
+                picklable data, or `None` if there is nothing to keep.
+            load (callable): Called with that data after the reload.
+            version (any, optional): Compared by equality with the version
+                the data was saved with; the data is dropped on a mismatch.
+
+        """
+        self.handlers[name] = (version, dump, load)
+
+    def save(self):
+        """
+        Dump all registered subsystems to the state file.
+
+        """
+        states = {}
+        for name, (version, dump, _) in self.handlers.items():
+            try:
+                data = dump()
+            except Exception:
+                logger.log_trace(f"Reload state: could not dump '{name}'.")
+                continue
+            if data is not None:
+                states[name] = (version, data)
+        tmp_path = f"{self.path}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as state_file:
+            pickle.dump((FORMAT, time.time(), states), state_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+    def restore(self):
+        """
+        Load the state file written before the reload, if there is one, and
+        hand each registered subsystem its data.
+
+        Returns:
+            set: Names of the subsystems that got their state back.
+
+        """
+        try:
+            with open(self.path, "rb") as state_file:
+                with mmap.mmap(state_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    saved = pickle.loads(mapped)
+        except FileNotFoundError:
+            return set()
+        except Exception:
+            logger.log_trace("Reload state: could not read the state file.")
+            self.discard()
+            return set()
+        self.discard()
+
+        fmt, saved_at, states = saved
+        if fmt != FORMAT or time.time() - saved_at > MAX_AGE:
+            logger.log_info("Reload state: state file is outdated, not used.")
+            return set()
+        restored = set()
+        for name, (saved_version, data) in states.items():
+            handler = self.handlers.get(name)
+            if handler is None or handler[0] != saved_version:
+                logger.log_info(f"Reload state: '{name}' changed version, not restored.")
+                continue
+            try:
+                handler[2](data)
+            except Exception:
+                logger.log_trace(f"Reload state: could not restore '{name}'.")
+                continue
+            restored.add(name)
+        logger.log_info(f"Reload state: restored {', '.join(sorted(restored)) or 'nothing'}.")
+        return restored
+
+    def discard(self):
+        """
+        Remove the state file.
+
+        """
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+RELOAD_STATE = ReloadState()
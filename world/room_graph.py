@@ -0,0 +1,300 @@
+"""
+Room graph
+
+Finding a route between rooms the Evennia way means loading each room on
+the way, then its exits and their destinations, from the database. This
+index keeps the whole exit graph in memory instead, in compressed sparse
+row form:
+
+- `rooms` is an array of room ids; a room's position in it is its node.
+- The exits leaving node `n` are `offsets[n]` to `offsets[n + 1]` in the
+  parallel arrays `targets` (destination nodes) and `exits` (exit ids).
+
+The graph is loaded from all `Exit` objects at server start and compiled
+into the arrays on the first query. After that it follows the `post_save`
+and `post_delete` signals of exits: a new exit, a deleted one or one that
+got a new location or destination patches only the row of the room it
+leaves, shifting the later entries and offsets by one; rooms not seen
+before are appended as new nodes. Rooms left without exits keep their
+(empty) node until the next load. Bulk inserts send no signals;
+`world.spawner.bulk_spawn` calls `update` itself.
+
+Routes are found with breadth-first search, or A* when given a distance
+estimate, and cost one step per exit. Locks are not looked at; whoever
+walks the route still traverses each exit normally.
+
+"""
+
+import heapq
+from array import array
+from collections import deque
+
+from django.db.models.signals import post_delete, post_save
+
+from evennia.objects.models import ObjectDB
+
+from typeclasses.exits import Exit
+
+
+class RoomGraph:
+    """
+    Compressed adjacency arrays of the rooms and the exits between them.
+
+    """
+
+    def __init__(self):
+        # exit id -> (from room id, to room id, exit key)；为 None 表示尚未载入
+        self.edges = None
+        self.dirty = True
+
+    def load(self):
+        """
+        (Re)load the edges from all exits in the database.
+
+        """
+        self.edges = {
+            exit_id: (location_id, destination_id, key)
+            for exit_id, location_id, destination_id, key in Exit.objects.all_family()
+            .filter(db_location__isnull=False, db_destination__isnull=False)
+            .values_list("id", "db_location_id", "db_destination_id", "db_key")
+        }
+        self.dirty = True
+
+    def _ensure(self):
+        if self.edges is None:
+            self.load()
+        if self.dirty:
+            self._compile()
+
+    def _compile(self):
+        room_ids = sorted({room_id for edge in self.edges.values() for room_id in edge[:2]})
+        self.rooms = array("q", room_ids)
+        self.nodes = {room_id: node for node, room_id in enumerate(room_ids)}
+        by_source = sorted(
+            (self.nodes[source], self.nodes[target], exit_id)
+            for exit_id, (source, target, _) in self.edges.items()
+        )
+        self.offsets = array("l", [0] * (len(room_ids) + 1))
+        for source, _, _ in by_source:
+            self.offsets[source + 1] += 1
+        for node in range(len(room_ids)):
+            self.offsets[node + 1] += self.offsets[node]
+        self.targets = array("l", (target for _, target, _ in by_source))
+        self.exits = array("q", (exit_id for _, _, exit_id in by_source))
+        # 全源最短距离，按需计算
+        self._all_pairs = None
+        self.dirty = False
+
+    def _node(self, room_id):
+        node = self.nodes.get(room_id)
+        if node is None:
+            node = self.nodes[room_id] = len(self.rooms)
+            self.rooms.append(room_id)
+            self.offsets.append(self.offsets[-1])
+        return node
+
+    def _unlink(self, exit_id, edge):
+        # 只改动出发房间的那一行，其后各行整体前移一格
+        node = self.nodes[edge[0]]
+        start, end = self.offsets[node], self.offsets[node + 1]
+        index = start + list(self.exits[start:end]).index(exit_id)
+        del self.targets[index], self.exits[index]
+        for later in range(node + 1, len(self.offsets)):
+            self.offsets[later] -= 1
+        self._all_pairs = None
+
+    def _link(self, exit_id, edge):
+        node, target = self._node(edge[0]), self._node(edge[1])
+        index = self.offsets[node + 1]
+        self.targets.insert(index, target)
+        self.exits.insert(index, exit_id)
+        for later in range(node + 1, len(self.offsets)):
+            self.offsets[later] += 1
+        self._all_pairs = None
+
+    def update(self, exit):
+        """
+        Add, move or remove the edge of an exit to match the exit. Objects
+        that are not exits (any more) have no edge.
+
+        """
+        if self.edges is None:
+            return
+        if isinstance(exit, Exit) and exit.db_location_id and exit.db_destination_id:
+            edge = (exit.db_location_id, exit.db_destination_id, exit.db_key)
+            old = self.edges.get(exit.id)
+            if old == edge:
+                return
+            self.edges[exit.id] = edge
+            if self.dirty or (old and old[:2] == edge[:2]):
+                # 尚未编译，或只改了出口名，数组不用动
+                return
+            if old:
+                self._unlink(exit.id, old)
+            self._link(exit.id, edge)
+        else:
+            self.remove(exit.id)
+
+    def remove(self, exit_id):
+        """
+        Drop the edge of a deleted exit.
+
+        """
+        if self.edges is None:
+            return
+        edge = self.edges.pop(exit_id, None)
+        if edge and not self.dirty:
+            self._unlink(exit_id, edge)
+
+    def neighbors(self, room_id):
+        """
+        Get the exits leaving a room.
+
+        Args:
+            room_id (int): The room.
+
+        Returns:
+            list: `(exit id, exit key, destination room id)` per exit.
+
+        """
+        self._ensure()
+        node = self.nodes.get(room_id)
+        if node is None:
+            return []
+        return [
+            (exit_id, self.edges[exit_id][2], self.rooms[target])
+            for exit_id, target in zip(
+                self.exits[self.offsets[node] : self.offsets[node + 1]],
+                self.targets[self.offsets[node] : self.offsets[node + 1]],
+            )
+        ]
+
+    def _route(self, came_from, start, goal):
+        route = []
+        node = goal
+        while node != start:
+            node, exit_id = came_from[node]
+            route.append(exit_id)
+        route.reverse()
+        return route
+
+    def path(self, start_id, goal_id, heuristic=None):
+        """
+        Find a shortest route between two rooms.
+
+        Args:
+            start_id (int): Room to start from.
+            goal_id (int): Room to reach.
+            heuristic (callable, optional): `heuristic(room_id, goal_id)`
+                estimating the number of exits left, never overestimating.
+                If given, A* is used instead of breadth-first search.
+
+        Returns:
+            list or None: Ids of the exits to take in order, `[]` if already
+                there, or `None` if the goal cannot be reached.
+
+        """
+        self._ensure()
+        if start_id == goal_id:
+            return []
+        start, goal = self.nodes.get(start_id), self.nodes.get(goal_id)
+        if start is None or goal is None:
+            return None
+        offsets, targets, exits = self.offsets, self.targets, self.exits
+        # node -> (previous node, exit id)
+        came_from = {start: None}
+
+        if heuristic is None:
+            queue = deque([start])
+            while queue:
+                node = queue.popleft()
+                for index in range(offsets[node], offsets[node + 1]):
+                    target = targets[index]
+                    if target not in came_from:
+                        came_from[target] = (node, exits[index])
+                        if target == goal:
+                            return self._route(came_from, start, goal)
+                        queue.append(target)
+            return None
+
+        steps = {start: 0}
+        queue = [(heuristic(start_id, goal_id), start)]
+        while queue:
+            _, node = heapq.heappop(queue)
+            if node == goal:
+                return self._route(came_from, start, goal)
+            for index in range(offsets[node], offsets[node + 1]):
+                target, cost = targets[index], steps[node] + 1
+                if cost < steps.get(target, cost + 1):
+                    steps[target] = cost
+                    came_from[target] = (node, exits[index])
+                    heapq.heappush(queue, (cost + heuristic(self.rooms[target], goal_id), target))
+        return None
+
+    def distances(self, start_id, max_steps=None):
+        """
+        Count the exits to every room reachable from a room.
+
+        Args:
+            start_id (int): Room to start from.
+            max_steps (int, optional): Do not look further than this.
+
+        Returns:
+            dict: `{room id: number of exits}`, including the start at 0.
+
+        """
+        self._ensure()
+        start = self.nodes.get(start_id)
+        if start is None:
+            return {start_id: 0}
+        offsets, targets = self.offsets, self.targets
+        steps = {start: 0}
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            if max_steps is not None and steps[node] >= max_steps:
+                continue
+            for index in range(offsets[node], offsets[node + 1]):
+                target = targets[index]
+                if target not in steps:
+                    steps[target] = steps[node] + 1
+                    queue.append(target)
+        return {self.rooms[node]: count for node, count in steps.items()}
+
+    def all_pairs(self):
+        """
+        Get the distances between all rooms, worked out once per change of
+        the graph.
+
+        Returns:
+            dict: `{from room id: {to room id: number of exits}}`; do not
+                modify.
+
+        """
+        self._ensure()
+        if self._all_pairs is None:
+            self._all_pairs = {room_id: self.distances(room_id) for room_id in self.rooms}
+        return self._all_pairs
+
+
+ROOM_GRAPH = RoomGraph()
+
+
+def _object_saved(sender, instance, update_fields=None, **kwargs):
+    # 类型类是代理模型，信号的 sender 是各个类型类，因此不按 sender 过滤
+    if ROOM_GRAPH.edges is None or not isinstance(instance, ObjectDB):
+        return
+    if update_fields and not {"db_location", "db_destination", "db_key"}.intersection(
+        update_fields
+    ):
+        return
+    ROOM_GRAPH.update(instance)
+
+
+def _object_deleted(sender, instance, **kwargs):
+    if isinstance(instance, ObjectDB):
+        ROOM_GRAPH.remove(instance.id)
+
+
+post_save.connect(_object_saved)
+post_delete.connect(_object_deleted)
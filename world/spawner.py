@@ -0,0 +1,348 @@
+"""
+Prototype compiler and bulk spawner
+
+`evennia.spawn` resolves the whole `prototype_parent` chain of a prototype
+on every spawn, then creates each object with a save per field, Attribute,
+Tag and alias. Repopulating a zone with hundreds of NPCs that way costs
+thousands of queries.
+
+`compile_prototype` flattens a prototype's inheritance once. Module
+prototypes (those in `world/prototypes.py`) are static, so the result is
+cached until the code is reloaded. Prototypes stored in the database may
+be edited in-game and are compiled anew each time.
+
+`bulk_spawn` creates many objects from one prototype:
+
+- Values of a prototype without callables or `$protfuncs` are worked out
+  once for all instances; otherwise once per instance.
+- The objects are inserted with one bulk insert, and their prototype
+  Attributes, Tags, aliases and permissions with one more each.
+- The typeclass creation hooks (`basetype_setup`, `at_object_creation`
+  and friends) still run for each object, but the field saves they make
+  - the lock and cmdset storage, mostly - are held back and written with
+  one bulk update, and the Attributes they set are inserted together
+  with the prototype's. Prototype values win. Until then a hook reading
+  an Attribute a hook has set (`attributes.get`/`has`, `db`) gets the
+  held value, as it would after a save.
+- Everything happens in one transaction.
+
+Not everything can be held back. Tags that a creation hook adds, and any
+query a hook makes itself, still cost the usual queries per object, and
+a hook that looks Attributes up in other ways (`attributes.all`, searches)
+does not see the held ones. Objects spawned from a prototype with no
+such hooks cost a fixed number of queries however many are spawned,
+plus one per distinct Tag.
+
+Keep this module apart from `world/prototypes.py`: every dict at the top
+level of that module is loaded as a prototype.
+
+"""
+
+from contextlib import contextmanager
+from itertools import chain
+
+from django.db import connection, transaction
+
+import evennia
+from evennia.objects.models import ObjectDB
+from evennia.prototypes import prototypes as protlib
+from evennia.prototypes import spawner
+from evennia.typeclasses.attributes import Attribute
+from evennia.utils.dbserialize import to_pickle
+from evennia.utils.utils import make_iter
+
+from world.object_index import OBJECT_INDEX
+from world.room_graph import ROOM_GRAPH
+
+# prototype_key -> 已展开继承的模块原型
+_COMPILED = {}
+
+# objparams 中各项的位置，见 evennia.prototypes.spawner.batch_create_object
+_CREATE_KWARGS, _PERMISSIONS, _LOCKS, _ALIASES, _NATTRIBUTES, _ATTRIBUTES, _TAGS, _EXECS = range(8)
+# 不指定 update_fields 的 save 会写这些字段
+_ALL_FIELDS = tuple(field.name for field in ObjectDB._meta.concrete_fields if not field.primary_key)
+
+
+def _is_dynamic(value):
+    """Check if a prototype value must be evaluated anew for every instance."""
+    if callable(value):
+        return True
+    if isinstance(value, str):
+        return "$" in value
+    if isinstance(value, dict):
+        return any(_is_dynamic(val) for val in value.values())
+    if isinstance(value, (list, tuple, set)):
+        return any(_is_dynamic(val) for val in value)
+    return False
+
+
+def compile_prototype(prototype_key):
+    """
+    Get a prototype with its whole inheritance chain merged in.
+
+    Args:
+        prototype_key (str): The prototype to compile.
+
+    Returns:
+        dict: The flattened prototype. Do not modify it; it may be shared.
+
+    Raises:
+        KeyError: If there is not exactly one prototype with this key.
+
+    """
+    prototype_key = prototype_key.lower()
+    compiled = _COMPILED.get(prototype_key)
+    if compiled is not None:
+        return compiled
+    module_prototype = protlib.search_prototype(prototype_key, no_db=True)
+    cacheable = len(module_prototype) == 1 and module_prototype[0]["prototype_key"] == prototype_key
+    prototype = protlib.search_prototype(prototype_key, require_single=True)[0]
+    compiled = spawner.flatten_prototype(prototype, validate=True)
+    if cacheable:
+        _COMPILED[prototype_key] = compiled
+    return compiled
+
+
+def clear_prototype_cache():
+    """
+    Forget all compiled prototypes.
+
+    """
+    _COMPILED.clear()
+
+
+def _bulk_tags(objs, objparams):
+    """
+    Add the prototype Tags, aliases and permissions of each object, with
+    one query per distinct tag plus one insert.
+
+    """
+    # (key, category, tagtype) -> Tag
+    tags = {}
+    links = []
+    for obj, params in zip(objs, objparams):
+        wanted = [
+            (key, category, None, data[0] if data else None) for key, category, *data in params[_TAGS]
+        ]
+        wanted += [(alias, None, "alias", None) for alias in params[_ALIASES]]
+        wanted += [(perm, None, "permission", None) for perm in params[_PERMISSIONS]]
+        for key, category, tagtype, data in wanted:
+            tag = tags.get((key, category, tagtype))
+            if tag is None:
+                tag = tags[(key, category, tagtype)] = ObjectDB.objects.create_tag(
+                    key=key, category=category, data=data, tagtype=tagtype
+                )
+            links.append((obj.id, tag.id))
+    if links:
+        through = ObjectDB.db_tags.through
+        through.objects.bulk_create(
+            [through(objectdb_id=obj_id, tag_id=tag_id) for obj_id, tag_id in set(links)],
+            ignore_conflicts=True,
+        )
+
+
+@contextmanager
+def _held_writes(objs):
+    """
+    Hold back the field saves and Attribute writes the creation hooks make
+    on `objs`, to be written in bulk. Held Attributes are read back by the
+    hooks through `attributes.get`, `attributes.has` and `db`.
+
+    Yields:
+        tuple: `(fields, attributes)`: the set of field names saved, and
+            `{obj id: {(key, category): (value, lockstring)}}` of the
+            Attributes set, last value winning.
+
+    """
+    fields = set()
+    attributes = {obj.id: {} for obj in objs}
+
+    def _save(*args, update_fields=None, **kwargs):
+        fields.update(update_fields or _ALL_FIELDS)
+
+    def _category(category):
+        return category.strip().lower() if category else None
+
+    def _normalize(key, category):
+        return key.strip().lower(), _category(category)
+
+    def _hold(obj):
+        handler = obj.attributes
+        add, get, has, remove = handler.add, handler.get, handler.has, handler.remove
+        held = attributes[obj.id]
+
+        def _add(key, value, category=None, lockstring="", strattr=False, **kwargs):
+            if strattr:
+                return add(key, value, category, lockstring, strattr, **kwargs)
+            held[_normalize(key, category)] = (value, lockstring)
+
+        def _get(key=None, default=None, category=None, **kwargs):
+            # 只有按单个键读取值时才能从暂存中回答
+            if isinstance(key, str) and not kwargs and _normalize(key, category) in held:
+                return held[_normalize(key, category)][0]
+            return get(key, default, category, **kwargs)
+
+        def _has(key=None, category=None):
+            if isinstance(key, str) and _normalize(key, category) in held:
+                return True
+            return has(key, category)
+
+        def _remove(key=None, category=None, *args, **kwargs):
+            if key is None:
+                # 不给键时删除该分类下的全部属性
+                dropped = [held_key for held_key in held if held_key[1] == _category(category)]
+            else:
+                dropped = [_normalize(name, category) for name in make_iter(key)]
+            for held_key in dropped:
+                held.pop(held_key, None)
+            return remove(key, category, *args, **kwargs)
+
+        handler.add, handler.get, handler.has, handler.remove = _add, _get, _has, _remove
+
+    for obj in objs:
+        # 实例属性优先于类方法，钩子里的 save 和属性读写都走到这里
+        obj.save = _save
+        _hold(obj)
+    try:
+        yield fields, attributes
+    finally:
+        for obj in objs:
+            del obj.save
+            del obj.attributes.add, obj.attributes.get, obj.attributes.has, obj.attributes.remove
+
+
+def _bulk_attributes(objs, objparams, hook_attributes):
+    """
+    Add the Attributes of each object - those the creation hooks set and
+    those of the prototype - with two inserts. Prototype values win.
+
+    """
+    through = ObjectDB.db_attributes.through
+    per_object = []
+    for obj, params in zip(objs, objparams):
+        prototype_keys = {(attr[0], attr[2]) for attr in params[_ATTRIBUTES]}
+        per_object.append(
+            [attr for attr in hook_attributes[obj.id] if (attr[0], attr[2]) not in prototype_keys]
+            + list(params[_ATTRIBUTES])
+        )
+    keys = {attr[0] for attrs in per_object for attr in attrs}
+    if not keys:
+        return
+    wanted = {(obj.id, attr[0], attr[2]) for obj, attrs in zip(objs, per_object) for attr in attrs}
+    stale = [
+        attr_id
+        for obj_id, key, category, attr_id in through.objects.filter(
+            objectdb_id__in=[obj.id for obj in objs], attribute__db_key__in=keys
+        ).values_list("objectdb_id", "attribute__db_key", "attribute__db_category", "attribute_id")
+        if (obj_id, key, category) in wanted
+    ]
+    if stale:
+        Attribute.objects.filter(id__in=stale).delete()
+
+    owners = []
+    attributes = []
+    for obj, attrs in zip(objs, per_object):
+        for key, value, category, lockstring in attrs:
+            owners.append(obj.id)
+            attributes.append(
+                Attribute(
+                    db_key=key,
+                    db_category=category,
+                    db_model="objectdb",
+                    db_lock_storage=lockstring or "",
+                    db_value=to_pickle(value),
+                )
+            )
+    attributes = Attribute.objects.bulk_create(attributes)
+    through.objects.bulk_create(
+        [
+            through(objectdb_id=obj_id, attribute_id=attr.id)
+            for obj_id, attr in zip(owners, attributes)
+        ]
+    )
+
+
+def bulk_spawn(prototype_key, count, location=None, caller=None):
+    """
+    Create `count` objects from one prototype with batched inserts.
+
+    Args:
+        prototype_key (str): The prototype to spawn.
+        count (int): How many objects to create.
+        location (Object, optional): Where to put them, instead of the
+            prototype's `location`.
+        caller (Object or Account, optional): Passed on to protfuncs.
+
+    Returns:
+        list: The new objects.
+
+    """
+    prototype = dict(compile_prototype(prototype_key))
+    if location is not None:
+        prototype["location"] = location
+    if _is_dynamic(prototype):
+        objparams = spawner.spawn(
+            *(dict(prototype) for _ in range(count)), caller=caller, only_validate=True
+        )
+    else:
+        objparams = spawner.spawn(prototype, caller=caller, only_validate=True) * count
+
+    with transaction.atomic():
+        if not connection.features.can_return_rows_from_bulk_insert:
+            # 数据库不返回批量插入的主键时，只能逐个创建
+            return spawner.batch_create_object(*objparams)
+
+        objs = ObjectDB.objects.bulk_create(
+            [ObjectDB(**params[_CREATE_KWARGS]) for params in objparams]
+        )
+        # 与逐个创建一样运行类型类的创建钩子，但钩子的写入和原型数据稍后批量写入
+        with OBJECT_INDEX.suspended(), _held_writes(objs) as (fields, held):
+            for obj, params in zip(objs, objparams):
+                obj.cache_instance(obj, new=True)
+                obj.at_first_save()
+                if params[_LOCKS]:
+                    obj.locks.add(params[_LOCKS])
+        hook_attributes = {
+            obj_id: [
+                (key, value, category, lockstring)
+                for (key, category), (value, lockstring) in attrs.items()
+            ]
+            for obj_id, attrs in held.items()
+        }
+        if fields:
+            ObjectDB.objects.bulk_update(objs, sorted(fields))
+        _bulk_attributes(objs, objparams, hook_attributes)
+        _bulk_tags(objs, objparams)
+
+    for obj, params in zip(objs, objparams):
+        obj.attributes.reset_cache()
+        obj.tags.reset_cache()
+        obj.aliases.reset_cache()
+        obj.permissions.reset_cache()
+        for key, value in params[_NATTRIBUTES].items():
+            obj.nattributes.add(key, value)
+        # 批量插入不发送 post_save 信号
+        ROOM_GRAPH.update(obj)
+        # 别名和中文名是批量写入的，直接用写入的值建索引，不再查询
+        chinese_names = [
+            attr[1]
+            for attr in chain(hook_attributes[obj.id], params[_ATTRIBUTES])
+            if attr[0] == "chinese_name" and attr[2] is None
+        ]
+        OBJECT_INDEX.add(
+            obj.id,
+            obj.db_location_id,
+            obj.db_key,
+            params[_ALIASES],
+            chinese_names[-1] if chinese_names else None,
+        )
+        if obj.location:
+            obj.location.contents_cache.add(obj)
+            obj.location.at_object_receive(obj, None)
+            obj.at_post_move(None)
+        for code in params[_EXECS]:
+            if code:
+                exec(code, {}, {"evennia": evennia, "obj": obj})
+        if spawn_hook := getattr(obj, "at_object_post_spawn", None):
+            spawn_hook()
+    return objs
@@ -0,0 +1,130 @@
+"""
+Message templates
+
+The login and account creation texts are compiled once when this module is
+loaded (at server start). Compiling splits each text into its literal chunks
+and the names of its `{fields}`, so a send only has to fill in the fields.
+
+Texts without Evennia colour markup are sent with the `raw` option, so the
+Portal passes them straight on instead of running the ANSI parser over every
+line. Encoding to the client's charset always happens in the Portal, per
+connection, so it is not done here.
+
+"""
+
+from string import Formatter
+
+
+class Template:
+    """
+    A text compiled into its literal chunks and field names.
+
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.parts = [(literal, field) for literal, field, _, _ in Formatter().parse(text)]
+        self.static = all(field is None for _, field in self.parts)
+        self.raw = "|" not in text
+
+    def render(self, **fields):
+        """
+        Fill in the fields of this template.
+
+        Returns:
+            str: The finished text.
+
+        """
+        if self.static:
+            return self.text
+        return "".join(
+            literal if field is None else literal + str(fields[field])
+            for literal, field in self.parts
+        )
+
+
+TEMPLATES = {
+    key: Template(text)
+    for key, text in {
+        "welcome": (
+            "----------------------------------------\n"
+            "          欢迎来到《夕阳又现》          \n"
+            "----------------------------------------\n"
+            "夕阳斜照，江湖波澜再起。刀剑纵横，侠影凌空，\n"
+            "只待豪杰仗义而行，谱写武林新篇。\n"
+            "你现在从 {address} 连线进入。\n"
+            "目前共有{wizards}位神仙、{players}位江湖人士在江湖中，"
+            "以及{connecting}位朋友正在步入途中。\n"
+            "----------------------------------------\n"
+            "请输入您的英文名字："
+        ),
+        "welcome_back": "您上次光临是从：{last}\n您上次连线的时间是：欢迎您成为我们的一员",
+        "follow_prompt": "请按照提示输入。",
+        "enter_name": "请输入您的英文名字：",
+        "enter_password": "请输入密码：",
+        "login_success": "登录成功！欢迎回到江湖！",
+        "wrong_password": "密码错误，请重新输入您的英文名字：",
+        "name_taken": "这个名字刚刚被别人用了，请重新输入您的英文名字：",
+        "login_throttled": "尝试次数过多，请稍后再输入密码：",
+        "reload_enter_password": "系统刚刚重新启动，请重新输入密码：",
+        "create_confirm": "使用 {name} 这个名字将会创造一个新的人物，您确定吗(y/n)？",
+        "choose_name": (
+            "现在请您给自己取一个有气质，有个性的名字。\n"
+            "如果您有困难输入中文名字，请直接敲回车键。\n"
+            "请给自己取一个中文名字："
+        ),
+        "set_name": "请给自己取一个中文名字：",
+        "random_name": (
+            "看来您要个随机产生的中文名字．．\n"
+            "请问您是否满意这个中文名字(y/n)？ ──〖 {name} 〗："
+        ),
+        "set_password": "请设定您的密码：",
+        "password_too_short": "密码的长度至少要五个字符，请重设您的密码：",
+        "confirm_password": "请再输入一次您的密码，以确认您没记错：",
+        "password_mismatch": "两次密码不一致，请重设您的密码：",
+        "password_invalid": "{errors}\n请重设您的密码：",
+        "reload_set_password": "系统刚刚重新启动，请重设您的密码：",
+        "set_identifier": "请设定您的身份标识，该标识在您自杀，以及取回密码时使用。不可修改，请谨慎保管：",
+        "identifier_too_short": "身份标识的长度至少要九个字符，请重设您的身份标识：",
+        "confirm_identifier": "请再输入一次您的身份标识，以确认您没记错：",
+        "identifier_mismatch": "两次身份标识不一致，请重设您的身份标识：",
+        "attributes_intro": """一个人物的天赋对于他或她所修习的武艺息息相关。
+人物大多具有以下六项天赋,其中福缘与容貌是隐藏属性：
+　　㈠　臂力：影响攻击能力及负荷量的大小。
+　　㈡　悟性：影响学习武功秘籍的速度及理解师傅的能力。
+　　㈢　根骨：影响体力恢复的速度及升级后所增加的体力。
+　　㈣　身法：影响防御及躲避的能力。
+　　㈤　福缘：影响解迷、奇遇，拜师等运气方面。
+　　㈥  容貌：影响解密，拜师的条件以及玩家和NPC对你的印象。
+您可以输入 (1-4) 指定其中的一项值，或者输入 0 由系统随机选择。
+您的选择是 (0-4)：""",
+        "attribute_choice_invalid": "请输入 0-4：",
+        "attribute_value": "请输入您想要的数值(10-30)：",
+        "attribute_value_invalid": "请输入有效数字(10-30)：",
+        "attribute_value_range": "数值需在 10-30 之间：",
+        "attributes_roll": (
+            "膂力[{先天臂力}]，悟性[{先天悟性}]，根骨[{先天根骨}]，身法[{先天身法}]\n"
+            "您同意这一组天赋吗(y/n)？"
+        ),
+        "set_gender": "您要扮演男性(m)的角色或女性(f)的角色？",
+        "gender_invalid": "请输入 m（男性）或 f（女性）：",
+        "create_success": "角色创建成功！欢迎踏入《夕阳又现》的江湖！",
+    }.items()
+}
+
+
+def send_template(receiver, key, **fields):
+    """
+    Render a template and send it to `receiver`.
+
+    Args:
+        receiver (Session, Account or Object): Anything with a `msg` method.
+        key (str): The name of the template in `TEMPLATES`.
+        **fields: Values for the template's fields.
+
+    """
+    template = TEMPLATES[key]
+    if template.raw:
+        receiver.msg(template.render(**fields), options={"raw": True})
+    else:
+        receiver.msg(template.render(**fields))
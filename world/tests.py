@@ -0,0 +1,122 @@
+"""
+Tests for the world subsystems.
+
+Run with
+
+    evennia test --settings settings.py world
+
+"""
+
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from evennia.commands import cmdhandler
+from evennia.commands.cmdset import CmdSet
+from evennia.commands.command import Command
+from evennia.utils.test_resources import EvenniaTest
+
+from world.channel_history import ChannelHistory
+from world.cmdset_cache import MergeCache
+
+
+def _channel(channel_id, log_file="channel_test.log"):
+    return SimpleNamespace(id=channel_id, get_log_filename=lambda: log_file)
+
+
+@patch("world.channel_history.LoopingCall", new=MagicMock())
+@patch("world.channel_history.logger.log_file")
+class TestChannelHistory(TestCase):
+    def setUp(self):
+        self.history = ChannelHistory(size=5)
+        self.channel = _channel(1)
+
+    def test_ring_keeps_newest_lines(self, log_file):
+        for number in range(8):
+            self.history.record(self.channel, f"line {number}")
+        self.assertEqual(self.history.lines(self.channel, 0, 3), ["line 5", "line 6", "line 7"])
+        self.assertEqual(self.history.lines(self.channel, 2, 3), ["line 3", "line 4", "line 5"])
+        # 超出环形缓冲的部分要回退到日志文件
+        self.assertIsNone(self.history.lines(self.channel, 3, 3))
+        self.assertIsNone(self.history.lines(_channel(2), 0, 1))
+
+    def test_write_behind_in_batches(self, log_file):
+        other = _channel(2, "channel_other.log")
+        self.history.record(self.channel, "first")
+        self.history.record(self.channel, "second")
+        self.history.record(other, "elsewhere")
+        log_file.assert_not_called()
+
+        self.history.flush()
+        self.assertEqual(log_file.call_count, 2)
+        batches = {call.args[1]: call.args[0] for call in log_file.call_args_list}
+        first, second = batches["channel_test.log"].split("\n")
+        self.assertEqual(first, "first")
+        self.assertTrue(second.endswith(" [-] second"))
+        self.assertEqual(batches["channel_other.log"], "elsewhere")
+        self.assertEqual(self.history.pending, {})
+
+    def test_flush_one_file(self, log_file):
+        other = _channel(2, "channel_other.log")
+        self.history.record(self.channel, "first")
+        self.history.record(other, "elsewhere")
+        self.history.flush("channel_test.log")
+        log_file.assert_called_once_with("first", "channel_test.log")
+        self.assertIn("channel_other.log", self.history.pending)
+
+    def test_reload_handover(self, log_file):
+        for number in range(3):
+            self.history.record(self.channel, f"line {number}")
+        restored = ChannelHistory(size=5)
+        restored.load_state(self.history.dump_state())
+        self.assertEqual(restored.lines(self.channel, 0, 3), ["line 0", "line 1", "line 2"])
+        restored.forget(self.channel)
+        self.assertIsNone(restored.lines(self.channel, 0, 1))
+
+
+class _ExtraCmdSet(CmdSet):
+    key = "ExtraCmdSet"
+
+    def at_cmdset_creation(self):
+        self.add(Command(key="extra"))
+
+
+class TestMergeCache(EvenniaTest):
+    def setUp(self):
+        super().setUp()
+        self.cache = MergeCache()
+        # 各处 at_cmdset_get 登记到的缓存，与 cmdhandler 查的须是同一个；
+        # serversession 在钩子里才导入，随 world.cmdset_cache 一起替换
+        for target in (
+            "evennia.commands.cmdhandler._CMDSET_MERGE_CACHE",
+            "world.cmdset_cache.MERGE_CACHE",
+            "typeclasses.objects.MERGE_CACHE",
+            "typeclasses.accounts.MERGE_CACHE",
+        ):
+            patcher = patch(target, self.cache)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def merged(self, character):
+        _, providers, *_ = cmdhandler.generate_cmdset_providers(character)
+        merged = []
+        cmdhandler.get_and_merge_cmdsets(character, providers, "object", "").addCallback(
+            merged.append
+        )
+        return merged[0]
+
+    def test_recipe_shared_between_players(self):
+        first = self.merged(self.char1)
+        second = self.merged(self.char2)
+        self.assertEqual((self.cache.misses, self.cache.hits), (1, 1))
+        self.assertEqual([cmd.key for cmd in first.commands], [cmd.key for cmd in second.commands])
+        # 按方案拼出的是第二个角色自己的命令
+        own = {id(cmd) for cmdset in self.char1.cmdset.cmdset_stack for cmd in cmdset.commands}
+        self.assertFalse(own.intersection(map(id, second.commands)))
+
+    def test_changed_stack_merges_anew(self):
+        self.merged(self.char1)
+        self.char2.cmdset.add(_ExtraCmdSet, persistent=False)
+        merged = self.merged(self.char2)
+        self.assertEqual((self.cache.misses, self.cache.hits), (2, 0))
+        self.assertIn("extra", [cmd.key for cmd in merged.commands])
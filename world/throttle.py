@@ -0,0 +1,71 @@
+"""
+Token-bucket throttling
+
+Each key (an IP address, an account id, ...) gets a bucket holding up to
+`burst` tokens that refills at `rate` tokens per second. An attempt costs
+one token and is refused when the bucket is empty, so short bursts are
+allowed while the sustained rate stays bounded.
+
+Buckets that have refilled completely carry no information, so they are
+pruned to keep memory bounded however many keys are seen.
+
+"""
+
+import time
+
+
+class TokenBucket:
+    """
+    A set of token buckets, one per key.
+
+    """
+
+    def __init__(self, rate, burst, prune_every=1000):
+        """
+        Args:
+            rate (float): Tokens regained per second.
+            burst (int): Maximum number of tokens in a bucket.
+            prune_every (int): Prune full buckets after this many new keys.
+
+        """
+        self.rate = rate
+        self.burst = burst
+        self.prune_every = prune_every
+        # key -> (tokens, time of last update)
+        self.buckets = {}
+        self._new_keys = 0
+
+    def _tokens(self, key, now):
+        tokens, last = self.buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - last) * self.rate)
+
+    def allow(self, key):
+        """
+        Try to spend a token for `key`.
+
+        Returns:
+            bool: If the attempt is allowed.
+
+        """
+        now = time.time()
+        if key not in self.buckets:
+            self._new_keys += 1
+            if self._new_keys >= self.prune_every:
+                self.prune(now)
+        tokens = self._tokens(key, now)
+        if tokens < 1:
+            self.buckets[key] = (tokens, now)
+            return False
+        self.buckets[key] = (tokens - 1, now)
+        return True
+
+    def prune(self, now=None):
+        """
+        Forget all buckets that have refilled completely.
+
+        """
+        now = now or time.time()
+        self.buckets = {
+            key: entry for key, entry in self.buckets.items() if self._tokens(key, now) < self.burst
+        }
+        self._new_keys = 0
@@ -0,0 +1,154 @@
+"""
+Tick scheduler
+
+One timer for all periodic game callbacks (NPC regeneration, weather,
+patrols, ...) instead of one LoopingCall per Script.
+
+Callbacks subscribe with an interval. Callbacks sharing an interval go into
+the same bucket, which is split into one slot per tick of that interval;
+each callback is put in a random slot. Every tick runs one slot of every
+bucket, so a thousand 10-second timers run about a hundred per second
+rather than all on the same second.
+
+The `TickScheduler` script (see `typeclasses.scripts`) drives `tick` every
+`RESOLUTION` seconds. Each tick and each bucket is timed; `stats` reports
+the totals and ticks taking longer than `SLOW_TICK` are logged.
+
+Subscriptions are only kept in memory. Subscribers register again when the
+server starts, e.g. from `at_server_start`.
+
+"""
+
+import random
+import time
+
+from evennia.utils import logger
+
+# 每跳的秒数
+RESOLUTION = 1
+# 超过这个秒数的一跳会记入日志
+SLOW_TICK = 0.1
+
+
+class Bucket:
+    """
+    All callbacks that share an interval.
+
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        # 每一跳一个槽：key -> callback
+        self.slots = [{} for _ in range(interval)]
+        self.calls = 0
+        self.elapsed = 0.0
+        self.max_elapsed = 0.0
+
+    def __len__(self):
+        return sum(len(slot) for slot in self.slots)
+
+
+class TickBuckets:
+    """
+    Interval buckets of tick callbacks.
+
+    """
+
+    def __init__(self, resolution=RESOLUTION, slow_tick=SLOW_TICK):
+        self.resolution = resolution
+        self.slow_tick = slow_tick
+        self.ticks = 0
+        # ticks per interval -> Bucket
+        self.buckets = {}
+        # key -> (Bucket, slot)
+        self.keys = {}
+        self.elapsed = 0.0
+        self.max_elapsed = 0.0
+
+    def subscribe(self, callback, interval, key=None):
+        """
+        Call `callback` every `interval` seconds. Subscribing again with the
+        same key replaces the earlier subscription.
+
+        Args:
+            callback (callable): Called without arguments.
+            interval (int or float): Seconds between calls, rounded to
+                whole ticks.
+            key (hashable, optional): Identifies the subscription. Defaults
+                to the callback itself.
+
+        """
+        key = callback if key is None else key
+        self.unsubscribe(key)
+        ticks = max(1, round(interval / self.resolution))
+        bucket = self.buckets.get(ticks)
+        if bucket is None:
+            bucket = self.buckets[ticks] = Bucket(ticks)
+        slot = bucket.slots[random.randrange(ticks)]
+        slot[key] = callback
+        self.keys[key] = (bucket, slot)
+
+    def unsubscribe(self, key):
+        """
+        Stop calling the callback subscribed under `key`, if any.
+
+        """
+        entry = self.keys.pop(key, None)
+        if entry:
+            bucket, slot = entry
+            del slot[key]
+            if not len(bucket):
+                del self.buckets[bucket.interval]
+
+    def tick(self):
+        """
+        Run one slot of every bucket.
+
+        """
+        self.ticks += 1
+        start = time.perf_counter()
+        for bucket in list(self.buckets.values()):
+            slot = bucket.slots[self.ticks % bucket.interval]
+            if not slot:
+                continue
+            bucket_start = time.perf_counter()
+            for callback in list(slot.values()):
+                try:
+                    callback()
+                except Exception:
+                    logger.log_trace(f"Error in tick callback {callback}.")
+            elapsed = time.perf_counter() - bucket_start
+            bucket.calls += len(slot)
+            bucket.elapsed += elapsed
+            bucket.max_elapsed = max(bucket.max_elapsed, elapsed)
+        elapsed = time.perf_counter() - start
+        self.elapsed += elapsed
+        self.max_elapsed = max(self.max_elapsed, elapsed)
+        if elapsed > self.slow_tick:
+            logger.log_warn(f"Tick {self.ticks} took {elapsed * 1000:.1f}ms.")
+
+    def stats(self):
+        """
+        Returns:
+            dict: Totals for all ticks so far, with times in milliseconds,
+                and the same per bucket under `buckets`, keyed by interval
+                in seconds.
+
+        """
+        return {
+            "ticks": self.ticks,
+            "avg_ms": self.elapsed * 1000 / self.ticks if self.ticks else 0.0,
+            "max_ms": self.max_elapsed * 1000,
+            "buckets": {
+                ticks * self.resolution: {
+                    "subscribers": len(bucket),
+                    "calls": bucket.calls,
+                    "avg_ms": bucket.elapsed * 1000 / bucket.calls if bucket.calls else 0.0,
+                    "max_ms": bucket.max_elapsed * 1000,
+                }
+                for ticks, bucket in self.buckets.items()
+            },
+        }
+
+
+TICKER = TickBuckets()
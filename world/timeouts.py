@@ -0,0 +1,99 @@
+"""
+Timeout wheel
+
+A hashed timing wheel keeping at most one deadline per key (usually a
+session id). All deadlines share a single reactor LoopingCall that only runs
+while there is something to time out, so the reactor load stays the same
+however many times a deadline is rescheduled.
+
+Each tick advances the wheel by one slot. A deadline further away than one
+turn of the wheel simply stays in its slot until the tick it expires on.
+
+"""
+
+from twisted.internet.task import LoopingCall
+
+from evennia.utils import logger
+
+
+class TimeoutWheel:
+    """
+    Schedule, reset and cancel one deadline per key.
+
+    """
+
+    def __init__(self, slots=64, resolution=1.0):
+        """
+        Args:
+            slots (int): Number of slots in the wheel.
+            resolution (float): Seconds per tick.
+
+        """
+        self.resolution = resolution
+        self.slots = [set() for _ in range(slots)]
+        # key -> (expire_tick, timeout, callback, args)
+        self.deadlines = {}
+        self.tick = 0
+        self._task = None
+
+    def schedule(self, key, timeout, callback, *args):
+        """
+        Set the deadline for `key`, replacing any earlier one.
+
+        Args:
+            key (hashable): What the deadline belongs to.
+            timeout (float): Seconds until `callback` fires.
+            callback (callable): Called with `*args` when the deadline passes.
+
+        """
+        self._remove(key)
+        expire = self.tick + max(1, round(timeout / self.resolution))
+        self.deadlines[key] = (expire, timeout, callback, args)
+        self.slots[expire % len(self.slots)].add(key)
+        if not self._task:
+            self._task = LoopingCall(self._advance)
+            self._task.start(self.resolution, now=False)
+
+    def reset(self, key):
+        """
+        Restart the deadline of `key` with its original timeout, if it has one.
+
+        """
+        entry = self.deadlines.get(key)
+        if entry:
+            self.schedule(key, entry[1], entry[2], *entry[3])
+
+    def cancel(self, key):
+        """
+        Remove the deadline of `key`, if any.
+
+        """
+        self._remove(key)
+        self._stop_if_idle()
+
+    def _remove(self, key):
+        entry = self.deadlines.pop(key, None)
+        if entry:
+            self.slots[entry[0] % len(self.slots)].discard(key)
+
+    def _stop_if_idle(self):
+        if not self.deadlines and self._task:
+            self._task.stop()
+            self._task = None
+
+    def _advance(self):
+        self.tick += 1
+        slot = self.slots[self.tick % len(self.slots)]
+        expired = [key for key in slot if self.deadlines[key][0] <= self.tick]
+        for key in expired:
+            _, _, callback, args = self.deadlines[key]
+            self._remove(key)
+            try:
+                callback(*args)
+            except Exception:
+                logger.log_trace()
+        self._stop_if_idle()
+
+
+# 所有未登录连接共享的超时轮
+LOGIN_TIMEOUTS = TimeoutWheel()
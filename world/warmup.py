@@ -0,0 +1,116 @@
+"""
+Startup warm-up
+
+After a start or reload every cache is empty: the first look in a room
+loads the room, its contents and their Attributes from the database, and
+the first command of each player imports and builds the cmdsets. This
+module does that work right after the server starts instead, before the
+players get to it.
+
+The work is split into stages, run in the order of `settings.WARMUP_STAGES`:
+
+- `cmdsets` - import and build the default cmdsets.
+- `rooms` - load all rooms, their contents and Attributes, and build
+  their shared exit cmdsets.
+- `exits` - load all exits and their Attributes, and build the cmdsets of
+  exits not in a shared one.
+- `npcs` - load all NPCs and their Attributes.
+
+The stages run cooperatively on the reactor, one object at a time, so the
+server keeps answering while warming up. Progress is logged after each
+stage. When `settings.WARMUP_TIME_BUDGET` seconds have passed the rest is
+skipped; whatever is not warm by then is loaded on first use as usual.
+
+"""
+
+import time
+
+from django.conf import settings
+from twisted.internet import task
+
+from evennia.commands.cmdsethandler import import_cmdset
+from evennia.utils import logger
+
+from typeclasses.characters import NPC
+from typeclasses.exits import Exit
+from typeclasses.rooms import Room
+
+
+def _warm_cmdsets():
+    paths = [
+        settings.CMDSET_UNLOGGEDIN,
+        settings.CMDSET_SESSION,
+        settings.CMDSET_ACCOUNT,
+        settings.CMDSET_CHARACTER,
+    ]
+    for path in paths:
+        import_cmdset(path, None)
+        yield
+
+
+def _warm_rooms():
+    for room in Room.objects.all_family():
+        room.attributes.all()
+        room.at_cmdset_get()
+        yield
+
+
+def _warm_exits():
+    for exit in Exit.objects.all_family():
+        exit.attributes.all()
+        exit.at_cmdset_get()
+        yield
+
+
+def _warm_npcs():
+    for npc in NPC.objects.all_family():
+        npc.attributes.all()
+        yield
+
+
+STAGES = {
+    "cmdsets": _warm_cmdsets,
+    "rooms": _warm_rooms,
+    "exits": _warm_exits,
+    "npcs": _warm_npcs,
+}
+
+
+def _run(stages, budget):
+    start = time.time()
+    for name in stages:
+        stage_start, count = time.time(), 0
+        for _ in STAGES[name]():
+            count += 1
+            if time.time() - start > budget:
+                logger.log_warn(
+                    f"Warm-up: time budget of {budget}s used up in stage '{name}' "
+                    f"after {count} items; skipping the rest."
+                )
+                return
+            yield
+        logger.log_info(f"Warm-up: {name} done, {count} items in {time.time() - stage_start:.2f}s.")
+    logger.log_info(f"Warm-up: finished in {time.time() - start:.2f}s.")
+
+
+def warm_up(stages=None, budget=None):
+    """
+    Start warming up the caches in the background.
+
+    Args:
+        stages (list, optional): Names of the stages to run, in order.
+            Defaults to `settings.WARMUP_STAGES`.
+        budget (float, optional): Seconds after which to stop. Defaults to
+            `settings.WARMUP_TIME_BUDGET`.
+
+    Returns:
+        Deferred: Fires when the warm-up ends.
+
+    """
+    stages = settings.WARMUP_STAGES if stages is None else stages
+    budget = settings.WARMUP_TIME_BUDGET if budget is None else budget
+    unknown = [name for name in stages if name not in STAGES]
+    if unknown:
+        logger.log_err(f"Warm-up: unknown stages {unknown} ignored.")
+        stages = [name for name in stages if name in STAGES]
+    return task.cooperate(_run(stages, budget)).whenDone()